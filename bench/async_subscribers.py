@@ -0,0 +1,85 @@
+"""Load test with thousands of subscribers of many topics in one process.
+
+Run with `python bench/async_subscribers.py`. The server runs in a subprocess and every subscriber is an AsyncClient
+with its own connection in the event loop of this process. Subscriber i subscribes to the topics i, i + 1, ... of a
+pool of topics, either with one SUBSCRIBE_TOPIC per topic awaited one after the other like the Client does, or with one
+SUBSCRIBE_BATCH. Afterwards one message is published to every topic and the subscribers iterate over their updates.
+The table shows the time until all subscribers were subscribed and until all updates arrived.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+
+from common import print_table, start_server
+
+from client import AsyncClient
+from transport_message import TransportMessage
+
+
+async def subscribe_each(client: AsyncClient, topics) -> None:
+    for topic in topics:
+        await client._request("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=topic))
+
+
+async def receive(client: AsyncClient, count: int) -> None:
+    async for _ in client:
+        count -= 1
+        if count == 0:
+            return
+
+
+async def run(url: str, batch: bool, subscribers: int, topics: int, per_subscriber: int):
+    clients = [AsyncClient(url, timeout=60) for _ in range(subscribers)]
+    # Connect in groups, so the server is not flooded with handshakes
+    for i in range(0, subscribers, 100):
+        await asyncio.gather(*(client.connect() for client in clients[i : i + 100]))
+    publisher = AsyncClient(url)
+    await publisher.connect()
+    pool = [f"load/{i}" for i in range(topics)]
+    subscriptions = [[pool[(i + j) % topics] for j in range(per_subscriber)] for i in range(subscribers)]
+
+    start = time.perf_counter()
+    if batch:
+        await asyncio.gather(*(client.subscribe(names) for client, names in zip(clients, subscriptions)))
+    else:
+        await asyncio.gather(*(subscribe_each(client, names) for client, names in zip(clients, subscriptions)))
+    subscribe = time.perf_counter() - start
+
+    start = time.perf_counter()
+    receiving = asyncio.gather(*(receive(client, per_subscriber) for client in clients))
+    for topic in pool:
+        await publisher.publish(topic, "update")
+    await receiving
+    delivery = time.perf_counter() - start
+
+    for client in [*clients, publisher]:
+        await client.close()
+    return subscribe, delivery
+
+
+def main():
+    parser = ArgumentParser(description="Thousands of subscribers of many topics in one process")
+    parser.add_argument("--subscribers", type=int, default=1_000, help="Subscribers. Default is 1000")
+    parser.add_argument("--topics", type=int, default=100, help="Topics in the pool. Default is 100")
+    parser.add_argument("--per-subscriber", type=int, default=20, help="Topics of every subscriber. Default is 20")
+    params = parser.parse_args()
+    if params.per_subscriber > params.topics:
+        # A subscriber would subscribe to some topics twice and wait for more updates than it receives
+        parser.error("--per-subscriber must not exceed --topics")
+
+    rows = []
+    for name, batch in (("one request per topic", False), ("SUBSCRIBE_BATCH", True)):
+        server, url = start_server("--heartbeat", "3600")
+        try:
+            subscribe, delivery = asyncio.run(run(url, batch, params.subscribers, params.topics, params.per_subscriber))
+        finally:
+            server.terminate()
+            server.wait()
+        subscriptions = params.subscribers * params.per_subscriber
+        rows.append((name, f"{subscribe:.2f}", f"{subscriptions / subscribe:,.0f}", f"{delivery:.2f}"))
+    print_table(("subscribe", "subscribe [s]", "subscriptions/s", "delivery of all updates [s]"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark of the buffered publishing of the Client.
+
+Run with `python bench/buffered_publish.py`. The server runs in a subprocess and one subscriber keeps the topic alive.
+A Client publishes the given number of messages as fast as it can and flushes. Every linger time is compared with
+awaiting the acknowledgement of every message like the ClientSession does. The table shows the published messages per
+second until the last batch was acknowledged, the number of batches and the mean batch size.
+"""
+
+import time
+from argparse import ArgumentParser
+
+from common import print_table, start_server
+
+from client import Client, ClientSession
+
+
+def run(url: str, linger, messages: int, batch_size: int, max_in_flight: int):
+    if linger is None:
+        with ClientSession(url) as session:
+            start = time.perf_counter()
+            for i in range(messages):
+                session.publish("bench", str(i))
+        responses = [None] * messages
+    else:
+        client = Client(url, linger=linger, batch_size=batch_size, max_in_flight=max_in_flight)
+        start = time.perf_counter()
+        for i in range(messages):
+            client.publish("bench", str(i))
+        responses = client.close()
+    duration = time.perf_counter() - start
+    return messages / duration, len(responses)
+
+
+def main():
+    parser = ArgumentParser(description="Messages per second of the buffered publishing")
+    parser.add_argument("--messages", type=int, default=20_000, help="Published messages. Default is 20000")
+    parser.add_argument("--batch-size", type=int, default=500, help="Maximum messages per batch. Default is 500")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Unacknowledged batches. Default is 4")
+    parser.add_argument(
+        "--lingers", type=float, nargs="+", default=[0, 0.001, 0.005, 0.02], help="Linger times in seconds"
+    )
+    params = parser.parse_args()
+
+    server, url = start_server("--heartbeat", "3600")
+    try:
+        with ClientSession(url) as subscriber:
+            subscriber.subscribe("bench")
+            rows = []
+            for linger in [None, *params.lingers]:
+                rate, batches = run(url, linger, params.messages, params.batch_size, params.max_in_flight)
+                name = "one request per message" if linger is None else f"linger {linger * 1e3:g} ms"
+                rows.append((name, f"{rate:,.0f}", f"{batches:,}", f"{params.messages / batches:,.1f}"))
+    finally:
+        server.terminate()
+        server.wait()
+    print_table(("publishing", "messages/s", "batches", "messages per batch"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark of requests over one persistent ClientSession versus one CLI process per request.
+
+Run with `python bench/client_sessions.py`. A server is started on a free port with one subscribed topic. The CLI flow
+starts `client.py --publish` once per message, paying for interpreter start, import, connect and disconnect every time.
+The session flow publishes over one open connection, awaiting the acknowledgement of every request, from one thread
+and from several threads sharing the session. Requests per second are reported.
+"""
+
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+from common import SRC, print_table, start_server
+
+from client import ClientSession
+
+TOPIC = "session-bench"
+
+
+def cli_flow(url: str, requests: int) -> float:
+    """Publish with one client process per message and return the requests per second."""
+    start = time.perf_counter()
+    for i in range(requests):
+        subprocess.run(
+            [sys.executable, os.path.join(SRC, "client.py"), "--server", url, "--publish", TOPIC, "--message", f"m{i}"],
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+    return requests / (time.perf_counter() - start)
+
+
+def session_flow(url: str, requests: int, threads: int) -> float:
+    """Publish over one session from the given number of threads and return the requests per second."""
+    with ClientSession(url) as session:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            responses = list(executor.map(lambda i: session.publish(TOPIC, f"m{i}"), range(requests)))
+        elapsed = time.perf_counter() - start
+    assert all(response.startswith("Successfully") for response in responses), responses[0]
+    return requests / elapsed
+
+
+def main():
+    parser = ArgumentParser(description="Requests per second of persistent sessions versus the CLI")
+    parser.add_argument("--cli-requests", type=int, default=20, help="Requests of the CLI flow. Default is 20")
+    parser.add_argument("--requests", type=int, default=2_000, help="Requests of the session flows. Default is 2000")
+    parser.add_argument("--threads", type=int, default=8, help="Threads sharing one session. Default is 8")
+    params = parser.parse_args()
+
+    server, url = start_server()
+    try:
+        with ClientSession(url) as subscriber:
+            subscriber.subscribe(TOPIC)
+            rows = [
+                ("CLI process per request", f"{cli_flow(url, params.cli_requests):,.1f}"),
+                ("session, 1 thread", f"{session_flow(url, params.requests, 1):,.1f}"),
+                (f"session, {params.threads} threads", f"{session_flow(url, params.requests, params.threads):,.1f}"),
+            ]
+    finally:
+        server.terminate()
+        server.wait()
+    print_table(("flow", "requests/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
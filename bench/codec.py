@@ -0,0 +1,59 @@
+"""Benchmark of the JSON and the binary encoding of transport messages.
+
+Run with `python bench/codec.py`. An update as the subscribers receive it is encoded and decoded with both codecs at
+different payload sizes. The wire size is the size of the Socket.IO packet carrying the message, so it includes the
+escaping of the JSON string inside the JSON array of the event and the extra attachment frame of binary events.
+"""
+
+import time
+from argparse import ArgumentParser
+
+from common import percentile, print_table, timed
+
+from socketio import packet
+
+from codec import decode_message, encode
+from transport_message import TransportMessage
+
+
+def wire_size(data) -> int:
+    """Get the bytes of the Socket.IO packets needed to emit data as PRINT_MESSAGE."""
+    encoded = packet.Packet(packet.EVENT, data=["PRINT_MESSAGE", data]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    return sum(len(part.encode() if isinstance(part, str) else part) for part in encoded)
+
+
+def main():
+    parser = ArgumentParser(description="Encode and decode time and wire size of the codecs")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[16, 256, 4096, 65536], help="Payload sizes in characters"
+    )
+    parser.add_argument("--repeat", type=int, default=5_000, help="Encodings per measurement. Default is 5000")
+    params = parser.parse_args()
+
+    rows = []
+    for size in params.sizes:
+        # Quotes and non-ASCII characters have to be escaped in JSON
+        payload = ('sensor "kitchen" Temperatur 21,5 °C ' * (size // 36 + 1))[:size]
+        message = TransportMessage(
+            timestamp=int(time.time()), topic="sensors/kitchen/temp", payload=payload, offset=12345
+        )
+        for codec in ("json", "binary"):
+            data = encode(message, codec)
+            encode_durations = timed(lambda: encode(message, codec), params.repeat)
+            decode_durations = timed(lambda: decode_message(data), params.repeat)
+            rows.append(
+                (
+                    size,
+                    codec,
+                    f"{percentile(encode_durations, 50) * 1e6:.2f}",
+                    f"{percentile(decode_durations, 50) * 1e6:.2f}",
+                    f"{wire_size(data):,}",
+                )
+            )
+    print_table(("payload", "codec", "encode p50 [us]", "decode p50 [us]", "wire [B]"), rows)
+
+
+if __name__ == "__main__":
+    main()
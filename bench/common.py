@@ -0,0 +1,150 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Callable, List, Sequence, Tuple
+from urllib.parse import urlsplit
+
+# The server and client modules live in src/ and import each other without a package prefix
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+
+def quiet_logging() -> None:
+    """Silence the server log output so it does not distort the measurements."""
+    logging.disable(logging.CRITICAL)
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Get the pct-th percentile of samples using the nearest-rank method.
+
+    :param samples: Measured values
+    :param pct: Percentile between 0 and 100
+    :return: Value at the percentile
+    """
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def timed(func: Callable[[], None], repeat: int) -> List[float]:
+    """Call func repeat times and return the duration of every call in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def print_table(header: Sequence[str], rows: Sequence[Sequence[object]]) -> None:
+    """Print rows as a simple aligned text table."""
+    cells = [[str(c) for c in header]] + [[str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    for i, row in enumerate(cells):
+        print("  ".join(c.rjust(w) for c, w in zip(row, widths)))
+        if i == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+async def connect_sessions(server, count: int, prefix: str = "bench") -> List[str]:
+    """Register count sessions with the Socket.IO manager of server without opening real connections.
+
+    :param server: Server object
+    :param count: Number of sessions
+    :param prefix: Prefix of the generated Engine.IO session ids
+    :return: Socket.IO session ids
+    """
+    sids = []
+    for i in range(count):
+        sid = await server.sio.manager.connect(f"{prefix}-{i}", "/")
+        server._sid_ip_mapping[sid] = "127.0.0.1"
+        sids.append(sid)
+    return sids
+
+
+def capture_packets(server) -> List[object]:
+    """Replace the Engine.IO transport of server by a sink that records every packet instead of sending it.
+
+    :param server: Server object
+    :return: List the sent packets are appended to
+    """
+    sent = []
+
+    async def send_packet(eio_sid, pkt):
+        sent.append(pkt)
+
+    server.sio.eio.send_packet = send_packet
+    return sent
+
+
+async def drain_send_queues(server) -> None:
+    """Wait until the send tasks of server have handed all queued messages to the transport.
+
+    :param server: Server object
+    """
+    while any(len(queue) or not queue.idle for queue in server._send_queues.values()):
+        await asyncio.sleep(0)
+
+
+def rss_bytes() -> int:
+    """Get the resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # ru_maxrss is the peak and not the current size, but it is the best available outside of Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def free_port() -> int:
+    """Get a TCP port on localhost that is currently not in use."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(url: str, timeout: float = 10) -> None:
+    """Wait until a server accepts connections on url. aiohttp only listens once the application has started."""
+    address = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(address.hostname, address.port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def start_server(*args: str) -> Tuple[subprocess.Popen, str]:
+    """Start src/server.py on a free port in a subprocess and wait until it accepts connections.
+
+    :param args: additional command line arguments of the server
+    :return: server process, which has to be terminated by the caller, and its URL
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SRC, "server.py"), "--port", str(port), "--log-level", "ERROR", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        cwd=SRC,
+    )
+    try:
+        asyncio.run(wait_for_server(url))
+    except BaseException:
+        process.terminate()
+        raise
+    return process, url
@@ -0,0 +1,65 @@
+"""Benchmark of the latest-value conflation of high-frequency topics.
+
+Run with `python bench/conflation.py`. Sensor publishers update a few topics as fast as an in-process server accepts
+the publishes, while every topic has a number of subscribers. For every conflation window, the table shows the
+publish rate, the number of updates sent to the subscribers per second and how many publishes were coalesced.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, print_table, quiet_logging
+
+from server import Server
+from transport_message import TransportMessage
+
+
+async def run(window: int, topics: int, subscribers: int, duration: float):
+    server = Server(conflation_windows={"sensors/*": window} if window else None)
+    sent = capture_packets(server)
+    sids = await connect_sessions(server, subscribers + 1)
+    names = [f"sensors/{i}" for i in range(topics)]
+    for sid in sids[:-1]:
+        for name in names:
+            await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic=name).json())
+    sent.clear()
+
+    publishes = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        data = TransportMessage(timestamp=int(time.time()), topic=names[publishes % topics], payload=str(publishes))
+        await server.handle_publish(sids[-1], data.json())
+        publishes += 1
+        # Let the send tasks and the timers of the windows run like they would between requests of a real server
+        await asyncio.sleep(0)
+    # The updates of the windows still open belong to the publishes measured
+    await asyncio.sleep(window / 1000 + 0.05)
+    await asyncio.sleep(0)
+    # Every publish is acknowledged with one packet to the publisher
+    updates = len(sent) - publishes
+    return publishes / duration, updates / duration, server.conflation_stats()["coalesced"]
+
+
+def main():
+    parser = ArgumentParser(description="Updates sent to the subscribers with and without conflation")
+    parser.add_argument("--topics", type=int, default=10, help="Published topics. Default is 10")
+    parser.add_argument("--subscribers", type=int, default=100, help="Subscribers of every topic. Default is 100")
+    parser.add_argument("--duration", type=float, default=3, help="Seconds to publish. Default is 3")
+    parser.add_argument(
+        "--windows", type=int, nargs="+", default=[0, 10, 100, 1000], help="Conflation windows in milliseconds"
+    )
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = []
+    for window in params.windows:
+        publish_rate, update_rate, coalesced = asyncio.run(
+            run(window, params.topics, params.subscribers, params.duration)
+        )
+        rows.append((window or "off", f"{publish_rate:,.0f}", f"{update_rate:,.0f}", f"{coalesced:,}"))
+    print_table(("window [ms]", "publishes/s", "updates sent/s", "coalesced"), rows)
+
+
+if __name__ == "__main__":
+    main()
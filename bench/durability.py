@@ -0,0 +1,124 @@
+"""Benchmark of the publish throughput per durability mode and of the restore time of a large topic table.
+
+Run with `python bench/durability.py`. The publishes go to topics of an in-process `Server` and the packets are
+recorded instead of being written to sockets. The configured number of publishers publish concurrently, each awaiting
+its previous publish like a client awaiting the acknowledgement. In group mode, the publishes arriving during a sync
+share the next one, so the throughput grows with the number of concurrent publishers.
+
+For the restore, a snapshot of the given number of topics and a log tail are written and then read by a new store, as
+after a crash. Reported are the time to read snapshot and tail, and the time until the server has built its topics.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, print_table, quiet_logging
+
+from persistence import DURABILITY_MODES, TopicStore
+from server import Server
+from transport_message import TransportMessage
+
+
+async def throughput(directory: str, durability: str, publishers: int, count: int) -> float:
+    """Publish count messages from concurrent publishers and return the messages per second.
+
+    :param durability: durability mode, or "memory" for a server without store
+    """
+    store = None
+    if durability != "memory":
+        store = TopicStore(os.path.join(directory, durability), durability)
+    server = Server(store=store)
+    capture_packets(server)
+    sids = await connect_sessions(server, publishers + 1)
+    for i in range(publishers):
+        await server.handle_subscribe(sids[-1], TransportMessage(timestamp=int(time.time()), topic=f"t{i}").json())
+    if store is not None:
+        server.restore_topics()
+
+    async def publish(i: int) -> None:
+        for j in range(count // publishers):
+            data = TransportMessage(timestamp=int(time.time()), topic=f"t{i}", payload=f"message {j}").json()
+            await server.handle_publish(sids[i], data)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(publish(i) for i in range(publishers)))
+    elapsed = time.perf_counter() - start
+    if store is not None:
+        await store.close()
+    return count // publishers * publishers / elapsed
+
+
+async def write_crashed_store(directory: str, topics: int, tail: int) -> None:
+    """Write a snapshot of topics and a log tail of tail records and stop like a crash after the records were synced.
+    The topic table is only referenced in here, so it is freed before the restore is measured.
+    """
+    states = [(f"topic-{i}", "x" * 32, int(time.time()), 1) for i in range(topics)]
+    store = TopicStore(directory, "group", snapshot_every=topics + tail + 1)
+    store.restore()
+    store.start(lambda: states)
+    await store.snapshot()
+    await store.publish([(f"topic-{i % topics}", "y" * 32, int(time.time())) for i in range(tail)])
+    # Stop without the final snapshot
+    store._committer.cancel()
+    store._file.close()
+
+
+async def restore_time(directory: str, topics: int, tail: int):
+    """Write a snapshot of topics and a log tail of tail records, then restore them.
+
+    :return: seconds to read snapshot and tail and seconds until the server has restored its topics
+    """
+    await write_crashed_store(directory, topics, tail)
+
+    start = time.perf_counter()
+    restored = TopicStore(directory).restore()
+    read = time.perf_counter() - start
+    assert len(restored) == topics
+    del restored
+
+    server = Server(store=TopicStore(directory))
+    start = time.perf_counter()
+    server.restore_topics()
+    total = time.perf_counter() - start
+    server.store._committer.cancel()
+    server.store._file.close()
+    return read, total
+
+
+async def measure(params):
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for durability in ("memory",) + DURABILITY_MODES:
+            for publishers in params.publishers:
+                msgs = await throughput(directory, durability, publishers, params.count)
+                rows.append((durability, publishers, f"{msgs:,.0f}"))
+    print_table(("durability", "publishers", "msg/s"), rows)
+    print()
+
+    with tempfile.TemporaryDirectory() as directory:
+        read, total = await restore_time(directory, params.topics, params.tail)
+    print_table(
+        ("topics", "tail records", "read snapshot and tail [s]", "restore server [s]"),
+        [(f"{params.topics:,}", f"{params.tail:,}", f"{read:.2f}", f"{total:.2f}")],
+    )
+
+
+def main():
+    parser = ArgumentParser(description="Publish throughput per durability mode and restore time")
+    parser.add_argument(
+        "--publishers", type=int, nargs="+", default=[1, 16, 128], help="Concurrent publishers. Default is 1 16 128"
+    )
+    parser.add_argument("--count", type=int, default=5_000, help="Publishes per measurement. Default is 5000")
+    parser.add_argument("--topics", type=int, default=1_000_000, help="Topics to restore. Default is 1000000")
+    parser.add_argument("--tail", type=int, default=10_000, help="Log records after the snapshot. Default is 10000")
+    params = parser.parse_args()
+
+    quiet_logging()
+    asyncio.run(measure(params))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark of the fan-out of a publish to many subscribers of one topic.
+
+Run with `python bench/fanout.py`. The subscribers are registered with the Socket.IO manager of an in-process `Server`
+and the packets are recorded instead of being written to sockets, so the numbers show the cost of the fan-out itself.
+A fan-out is measured until the packets of all subscribers were handed to the transport, including the send queues.
+The previous implementation, which emitted to every subscriber separately, is measured for comparison.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, drain_send_queues, percentile, print_table, quiet_logging
+
+from server import Server, Topic
+from transport_message import TransportMessage
+
+
+async def emit_per_subscriber(server: Server, topic: Topic) -> None:
+    """Fan-out as done before topics were mapped onto rooms: one emit per subscriber."""
+    topic.last_update = int(time.time())
+    response = TransportMessage(timestamp=int(time.time()), payload=f"{topic.name}: {topic.content}")
+    for sub in topic.subscribers:
+        await server.sio.emit("PRINT_MESSAGE", response.json(), room=sub)
+
+
+async def measure(subscribers: int, publishes: int):
+    server = Server()
+    sent = capture_packets(server)
+    for sid in await connect_sessions(server, subscribers):
+        await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic="fanout").json())
+    topic = server._get_topic_by_name("fanout")
+    server._append(topic, "x" * 64, int(time.time()))
+
+    results = []
+    for name, fan_out in (("per-subscriber emit", emit_per_subscriber), ("room emit", None)):
+        durations = []
+        for _ in range(publishes):
+            sent.clear()
+            start = time.perf_counter()
+            if fan_out is None:
+                await server.update_topic(topic)
+                await drain_send_queues(server)
+            else:
+                await fan_out(server, topic)
+            durations.append(time.perf_counter() - start)
+            assert len(sent) == subscribers
+        results.append((name, durations))
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Fan-out time of a publish to one topic")
+    parser.add_argument("--subscribers", type=int, default=10_000, help="Subscribers of the topic. Default is 10000")
+    parser.add_argument("--publishes", type=int, default=50, help="Publishes per variant. Default is 50")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = [
+        (name, f"{percentile(durations, 50) * 1e3:.2f}", f"{percentile(durations, 99) * 1e3:.2f}")
+        for name, durations in asyncio.run(measure(params.subscribers, params.publishes))
+    ]
+    print(f"fan-out to {params.subscribers} subscribers")
+    print_table(("variant", "p50 [ms]", "p99 [ms]"), rows)
+
+
+if __name__ == "__main__":
+    main()
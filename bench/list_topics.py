@@ -0,0 +1,79 @@
+"""Benchmark of listing the topics of a server with many topics.
+
+Run with `python bench/list_topics.py`. An in-process server gets the given number of topics. The streamed list of all
+topics is compared with building the whole list in one string like the server did before, and a page of a filtered
+list is requested with a request id. The table shows the time until the first message was sent, the total time and
+the size of the largest message.
+"""
+
+import asyncio
+import json
+import time
+from argparse import ArgumentParser
+
+from common import connect_sessions, print_table, quiet_logging
+
+from server import Server, Topic
+from transport_message import TransportMessage
+
+
+def single_string(server: Server) -> str:
+    """Build the list of all topics the way the server did before the list was streamed."""
+    response_msg = "All topics on the server:"
+    for topic in server._topics:
+        response_msg += f"\n{topic.name}"
+    return TransportMessage(timestamp=int(time.time()), payload=response_msg).json()
+
+
+async def measure(server: Server, sid: str, request: TransportMessage):
+    """Request the list and measure when the messages were sent."""
+    sent = []
+
+    async def send_packet(eio_sid, pkt):
+        sent.append((time.perf_counter(), len(pkt.data)))
+
+    server.sio.eio.send_packet = send_packet
+    start = time.perf_counter()
+    ack = await server.handle_list_topics(sid, request.json())
+    end = time.perf_counter()
+    if ack is not None:
+        sent.append((end, len(json.dumps(ack))))
+    return sent[0][0] - start, end - start, max(size for _, size in sent), len(sent)
+
+
+async def run(topics: int):
+    server = Server()
+    sid = (await connect_sessions(server, 1))[0]
+    for i in range(topics):
+        name = f"site-{i % 100}/sensor-{i}"
+        server._topics.add(Topic(name))
+        server._topic_index.add(name)
+
+    start = time.perf_counter()
+    data = single_string(server)
+    single = time.perf_counter() - start
+    rows = [("single string (before)", f"{single * 1e3:,.0f}", f"{single * 1e3:,.0f}", f"{len(data):,}", 1)]
+
+    for name, request in (
+        ("streamed, first list", TransportMessage(timestamp=int(time.time()))),
+        ("streamed, sorted index", TransportMessage(timestamp=int(time.time()))),
+        ("page of prefix site-7", TransportMessage(timestamp=int(time.time()), topic="site-7", request_id=1)),
+        ("page of glob *-7/*", TransportMessage(timestamp=int(time.time()), topic="*-7/*", request_id=1)),
+    ):
+        first, total, largest, messages = await measure(server, sid, request)
+        rows.append((name, f"{first * 1e3:,.1f}", f"{total * 1e3:,.0f}", f"{largest:,}", messages))
+    return rows
+
+
+def main():
+    parser = ArgumentParser(description="Listing the topics of a server with many topics")
+    parser.add_argument("--topics", type=int, default=1_000_000, help="Topics on the server. Default is 1000000")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = asyncio.run(run(params.topics))
+    print_table(("method", "first message [ms]", "total [ms]", "largest message [B]", "messages"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Load generator for the whole broker with end-to-end latency measurement.
+
+Run with `python bench/load.py`. The application of `get_app()` is started in this process on an ephemeral port and
+the configured numbers of async publishers and subscribers connect to it over websockets. Publisher i publishes to
+topic i % topics, subscriber j subscribes to topic j % topics. Every message carries its publish time, so the
+subscribers can measure the delay from the publish until the update arrives.
+
+Reported are the acknowledged publishes per second, the delivered updates, the latency percentiles and the CPU time
+and RSS of this process. Server and load generators share the event loop, so the CPU time includes both of them.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+from typing import List
+
+from common import percentile, print_table, quiet_logging, rss_bytes
+
+import socketio
+from aiohttp import web
+
+from server import get_app
+from transport_message import TransportMessage
+
+
+async def start_app(heart_beat_interval: int):
+    """Start the server application on a free port of localhost.
+
+    :param heart_beat_interval: heart beat interval of the server
+    :return: runner of the application, which has to be cleaned up by the caller, and the URL of the server
+    """
+    runner = web.AppRunner(get_app(heart_beat_interval))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+class Subscriber:
+    """Subscriber which records the delivery latency of every update."""
+
+    def __init__(self) -> None:
+        self.client = socketio.AsyncClient()
+        self.client.on("PRINT_MESSAGE", self._on_update)
+        self.latencies: List[float] = []
+        self.measuring = False
+
+    async def start(self, url: str, topic: str) -> None:
+        await self.client.connect(url, transports=["websocket"])
+        message = TransportMessage(timestamp=int(time.time()), topic=topic, request_id=1)
+        await self.client.call("SUBSCRIBE_TOPIC", message.json())
+
+    def _on_update(self, data: str) -> None:
+        received = time.time()
+        if not self.measuring:
+            return
+        # Updates are formatted as "topic (date): content" and the content is the publish time
+        sent = float(TransportMessage.parse_raw(data).payload.rsplit(": ", 1)[1])
+        self.latencies.append(received - sent)
+
+
+async def publisher(url: str, topic: str, duration: float, rate: float) -> int:
+    """Publish to topic for duration seconds and return the acknowledged publishes.
+
+    :param rate: publishes per second. With 0, every message is published as soon as the previous one is acked
+    """
+    client = socketio.AsyncClient()
+    await client.connect(url, transports=["websocket"])
+    count = 0
+    start = time.monotonic()
+    deadline = start + duration
+    while time.monotonic() < deadline:
+        if rate:
+            delay = start + count / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        message = TransportMessage(timestamp=int(time.time()), topic=topic, payload=repr(time.time()), request_id=count)
+        await client.call("PUBLISH_TOPIC", message.json())
+        count += 1
+    await client.disconnect()
+    return count
+
+
+async def run(params) -> List[tuple]:
+    runner, url = await start_app(params.heartbeat)
+    topics = [f"load-{i}" for i in range(params.topics)]
+    try:
+        subscribers = [Subscriber() for _ in range(params.subscribers)]
+        for i, subscriber in enumerate(subscribers):
+            await subscriber.start(url, topics[i % len(topics)])
+        for subscriber in subscribers:
+            subscriber.measuring = True
+
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        published = await asyncio.gather(
+            *(publisher(url, topics[i % len(topics)], params.duration, params.rate) for i in range(params.publishers))
+        )
+        # Give the last updates time to arrive
+        await asyncio.sleep(0.5)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+        for subscriber in subscribers:
+            await subscriber.client.disconnect()
+    finally:
+        await runner.cleanup()
+
+    subscribers_of = [sum(1 for j in range(params.subscribers) if j % len(topics) == t) for t in range(len(topics))]
+    expected = sum(count * subscribers_of[i % len(topics)] for i, count in enumerate(published))
+    latencies = [latency * 1000 for subscriber in subscribers for latency in subscriber.latencies]
+    return [
+        ("publishes/s", f"{sum(published) / params.duration:,.0f}"),
+        ("updates delivered", f"{len(latencies):,} of {expected:,}"),
+        ("latency p50 (ms)", f"{percentile(latencies, 50):.2f}"),
+        ("latency p90 (ms)", f"{percentile(latencies, 90):.2f}"),
+        ("latency p99 (ms)", f"{percentile(latencies, 99):.2f}"),
+        ("latency max (ms)", f"{max(latencies, default=float('nan')):.2f}"),
+        ("CPU (% of one core)", f"{cpu / wall * 100:.0f}"),
+        ("RSS (MiB)", f"{rss_bytes() / 2**20:.1f}"),
+    ]
+
+
+def main():
+    parser = ArgumentParser(description="End-to-end load test of the broker in one process")
+    parser.add_argument("--publishers", type=int, default=4, help="Publishing connections. Default is 4")
+    parser.add_argument("--subscribers", type=int, default=50, help="Subscribing connections. Default is 50")
+    parser.add_argument("--topics", type=int, default=4, help="Topics. Default is 4")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds to publish. Default is 5")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Publishes per second per publisher. Default is 0, as fast as acked"
+    )
+    parser.add_argument(
+        "--heartbeat", type=int, default=3600, help="Heart beat interval of the server. Default is 3600 so it stays out"
+    )
+    params = parser.parse_args()
+
+    quiet_logging()
+    print_table(("metric", "value"), asyncio.run(run(params)))
+
+
+if __name__ == "__main__":
+    main()
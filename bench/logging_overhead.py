@@ -0,0 +1,97 @@
+"""Benchmark of the publish throughput with logging on and off.
+
+Run with `python bench/logging_overhead.py`. Publishes go through `Server.handle_publish` on an in-process server
+while the log is written synchronously from the event loop (as the server did before), through the queue pipeline of
+`setup_logging` or not at all. The log file is written into a temporary directory and the console output goes to
+os.devnull or to a slow console which blocks for a moment on every write, like a terminal or disk under load does.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, print_table
+
+from server import Server, setup_logging
+from transport_message import TransportMessage
+
+
+class SlowStream:
+    """Console stream which blocks for delay seconds on every write."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def write(self, text: str) -> None:
+        time.sleep(self.delay)
+
+    def flush(self) -> None:
+        pass
+
+
+def direct_logging(log_file: str, stream) -> None:
+    """Log synchronously to a file and the console, as the server did before logging was moved off the loop."""
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    root = logging.getLogger()
+    for handler in (logging.FileHandler(log_file), logging.StreamHandler(stream)):
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def reset_logging() -> None:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    logging.disable(logging.NOTSET)
+
+
+async def throughput(size: int, count: int) -> float:
+    server = Server()
+    capture_packets(server)
+    subscriber, publisher = await connect_sessions(server, 2)
+    await server.handle_subscribe(subscriber, TransportMessage(timestamp=int(time.time()), topic="bench").json())
+    data = TransportMessage(timestamp=int(time.time()), topic="bench", payload="x" * size).json()
+    start = time.perf_counter()
+    for _ in range(count):
+        await server.handle_publish(publisher, data)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="Publish throughput with logging on and off")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 65536], help="Payload sizes in bytes")
+    parser.add_argument("--count", type=int, default=5_000, help="Publishes per measurement. Default is 5000")
+    parser.add_argument(
+        "--slow-write-ms", type=float, default=1.0, help="Delay of every write to the slow console. Default is 1"
+    )
+    params = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        log_file = os.path.join(tmp, "server.log")
+        for console_name, console in (("devnull", devnull), ("slow", SlowStream(params.slow_write_ms / 1000))):
+            for size in params.sizes:
+                row = [console_name, size]
+                for mode in ("off", "direct", "queue"):
+                    listener = None
+                    if mode == "off":
+                        logging.disable(logging.CRITICAL)
+                    elif mode == "direct":
+                        direct_logging(log_file, console)
+                    else:
+                        listener = setup_logging("INFO", 256, log_file, console)
+                    row.append(f"{asyncio.run(throughput(size, params.count)):,.0f}")
+                    if listener is not None:
+                        listener.stop()
+                    reset_logging()
+                rows.append(row)
+    print_table(("console", "payload [B]", "off [msg/s]", "direct [msg/s]", "queue [msg/s]"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark of the publish throughput of single publishes versus batches.
+
+Run with `python bench/publish_batch.py`. A server is started on a free port and one publisher sends messages to a few
+topics with one subscriber each, either one PUBLISH_TOPIC per message waiting for every acknowledgement or as
+PUBLISH_BATCH frames of different sizes waiting for the acknowledgement of every batch. The run ends when the
+subscribers received every message.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+
+from common import print_table, start_server
+
+import socketio
+
+from transport_message import TransportMessage, TransportMessageBatch
+
+
+async def run(url: str, topics, total: int, batch_size: int) -> float:
+    """Publish total messages with the given batch size (0 for single publishes) and return the messages per second."""
+    received = 0
+    done = asyncio.Event()
+
+    def count(messages: int) -> None:
+        nonlocal received
+        received += messages
+        if received >= total:
+            done.set()
+
+    # The first PRINT_MESSAGE of every subscriber confirms the subscription, the counter is reset below
+    def on_update(data):
+        count(1)
+
+    def on_batch(data):
+        count(len(TransportMessageBatch.parse_raw(data).messages))
+
+    subscribers = []
+    for topic in topics:
+        subscriber = socketio.AsyncClient()
+        subscriber.on("PRINT_MESSAGE", on_update)
+        subscriber.on("PRINT_MESSAGE_BATCH", on_batch)
+        await subscriber.connect(url, transports=["websocket"])
+        await subscriber.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=topic).json())
+        subscribers.append(subscriber)
+    await asyncio.sleep(0.5)
+    received = 0
+
+    publisher = socketio.AsyncClient()
+    acked = asyncio.Queue()
+    publisher.on("PRINT_MESSAGE_AND_EXIT", lambda data: acked.put_nowait(data))
+    await publisher.connect(url, transports=["websocket"])
+
+    start = time.perf_counter()
+    if batch_size == 0:
+        for i in range(total):
+            message = TransportMessage(timestamp=int(time.time()), topic=topics[i % len(topics)], payload=f"m{i}")
+            await publisher.emit("PUBLISH_TOPIC", message.json())
+            await acked.get()
+    else:
+        for first in range(0, total, batch_size):
+            messages = [
+                TransportMessage(timestamp=int(time.time()), topic=topics[i % len(topics)], payload=f"m{i}")
+                for i in range(first, min(total, first + batch_size))
+            ]
+            await publisher.emit("PUBLISH_BATCH", TransportMessageBatch(timestamp=int(time.time()), messages=messages).json())
+            await acked.get()
+    await asyncio.wait_for(done.wait(), 60)
+    elapsed = time.perf_counter() - start
+
+    for client in subscribers + [publisher]:
+        await client.disconnect()
+    return total / elapsed
+
+
+def main():
+    parser = ArgumentParser(description="Publish throughput of single publishes versus batches")
+    parser.add_argument("--messages", type=int, default=5_000, help="Messages per run. Default is 5000")
+    parser.add_argument("--topics", type=int, default=4, help="Topics with one subscriber each. Default is 4")
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[10, 100, 1000], help="Batch sizes. Default is 10 100 1000"
+    )
+    params = parser.parse_args()
+
+    # Heart beats would add updates the publisher did not send
+    server, url = start_server("--heartbeat", "3600")
+    topics = [f"batch-{i}" for i in range(params.topics)]
+    rows = []
+    try:
+        for batch_size in [0] + params.batch_sizes:
+            rate = asyncio.run(run(url, topics, params.messages, batch_size))
+            rows.append((batch_size or "single", f"{rate:,.0f}"))
+    finally:
+        server.terminate()
+        server.wait()
+    print_table(("batch size", "messages/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark of the messages per second handled by `Server.handle_publish` at different payload sizes.
+
+Run with `python bench/publish_throughput.py`. The publishes go to a topic with one subscriber on an in-process
+`Server` and the packets are recorded instead of being written to sockets. The "double parse" column adds the second
+`TransportMessage.parse_raw` the handlers did before the request was parsed only once in the decorator.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, print_table, quiet_logging
+
+from server import Server
+from transport_message import TransportMessage
+
+
+async def throughput(server: Server, sid: str, data: str, count: int, double_parse: bool) -> float:
+    """Publish data count times and return the messages per second."""
+    start = time.perf_counter()
+    for _ in range(count):
+        if double_parse:
+            TransportMessage.parse_raw(data)
+        await server.handle_publish(sid, data)
+    return count / (time.perf_counter() - start)
+
+
+async def measure(sizes, count: int):
+    server = Server()
+    capture_packets(server)
+    subscriber, publisher = await connect_sessions(server, 2)
+    await server.handle_subscribe(subscriber, TransportMessage(timestamp=int(time.time()), topic="bench").json())
+
+    rows = []
+    for size in sizes:
+        data = TransportMessage(timestamp=int(time.time()), topic="bench", payload="x" * size).json()
+        double = await throughput(server, publisher, data, count, double_parse=True)
+        single = await throughput(server, publisher, data, count, double_parse=False)
+        rows.append((size, f"{double:,.0f}", f"{single:,.0f}", f"{(single / double - 1) * 100:+.1f}%"))
+    return rows
+
+
+def main():
+    parser = ArgumentParser(description="Messages per second through handle_publish")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[64, 1024, 16384, 262144], help="Payload sizes in bytes"
+    )
+    parser.add_argument("--count", type=int, default=5_000, help="Publishes per measurement. Default is 5000")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = asyncio.run(measure(params.sizes, params.count))
+    print_table(("payload [B]", "double parse [msg/s]", "single parse [msg/s]", "change"), rows)
+
+
+if __name__ == "__main__":
+    main()
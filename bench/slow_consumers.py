@@ -0,0 +1,100 @@
+"""Benchmark of the delivery to fast subscribers while other subscribers of the same topic are stalled.
+
+Run with `python bench/slow_consumers.py`. An in-process server has a topic with fast and stalled subscribers. The
+sends to the stalled subscribers never complete, like a client whose TCP window is full. Updates are published in a
+loop and for every overflow policy the table shows the publish latency, the latency until a fast subscriber got the
+update, and how many updates were dropped, conflated or led to a disconnect. Without bounded queues, every update for
+a stalled subscriber would stay in memory until its connection is closed.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+
+from common import connect_sessions, percentile, print_table, quiet_logging
+
+from send_queue import OVERFLOW_POLICIES
+from server import Server
+from transport_message import TransportMessage
+
+
+async def run(policy: str, fast: int, slow: int, publishes: int, queue_size: int):
+    server = Server(send_queue_size=queue_size, overflow_policy=policy)
+    flowing = asyncio.Event()
+    flowing.set()
+    received = {}
+
+    async def send_packet(eio_sid, pkt):
+        if eio_sid.startswith("slow"):
+            await flowing.wait()
+        elif eio_sid == "fast-0":
+            received[len(received)] = time.perf_counter()
+
+    server.sio.eio.send_packet = send_packet
+    sids = await connect_sessions(server, fast, "fast") + await connect_sessions(server, slow, "slow")
+    publisher = (await connect_sessions(server, 1, "publisher"))[0]
+    for sid in sids:
+        await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic="bench").json())
+    received.clear()
+    flowing.clear()
+
+    published_at, publish_durations = [], []
+    for i in range(publishes):
+        data = TransportMessage(timestamp=int(time.time()), topic="bench", payload=str(i)).json()
+        start = time.perf_counter()
+        await server.handle_publish(publisher, data)
+        publish_durations.append(time.perf_counter() - start)
+        published_at.append(start)
+        # Let the send tasks run like they would between requests of a real server
+        await asyncio.sleep(0)
+    while len(received) < publishes:
+        await asyncio.sleep(0.001)
+    delivery = [received[i] - published_at[i] for i in range(publishes)]
+    stats = server.send_queue_stats()
+    flowing.set()
+    return publish_durations, delivery, stats
+
+
+def main():
+    parser = ArgumentParser(description="Delivery to fast subscribers next to stalled ones")
+    parser.add_argument("--fast", type=int, default=100, help="Fast subscribers. Default is 100")
+    parser.add_argument("--slow", type=int, default=10, help="Stalled subscribers. Default is 10")
+    parser.add_argument("--publishes", type=int, default=2_000, help="Published updates. Default is 2000")
+    parser.add_argument("--queue-size", type=int, default=100, help="Size of the send queues. Default is 100")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = []
+    for policy in OVERFLOW_POLICIES:
+        publish_durations, delivery, stats = asyncio.run(
+            run(policy, params.fast, params.slow, params.publishes, params.queue_size)
+        )
+        rows.append(
+            (
+                policy,
+                f"{percentile(publish_durations, 50) * 1e3:.2f}",
+                f"{percentile(delivery, 50) * 1e3:.2f}",
+                f"{percentile(delivery, 99) * 1e3:.2f}",
+                f"{stats['max_depth']:,}",
+                f"{stats['dropped']:,}",
+                f"{stats['conflated']:,}",
+                f"{stats['disconnected']:,}",
+            )
+        )
+    print_table(
+        (
+            "policy",
+            "publish p50 [ms]",
+            "delivery p50 [ms]",
+            "delivery p99 [ms]",
+            "max depth",
+            "dropped",
+            "conflated",
+            "disconnected",
+        ),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
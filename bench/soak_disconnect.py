@@ -0,0 +1,82 @@
+"""Soak test of the cleanup of disconnected clients.
+
+Run with `python bench/soak_disconnect.py`. Clients are connected to an in-process `Server` in rounds, subscribe to a
+few topics each and disconnect again through the same handler and manager calls Socket.IO makes. After every round the
+topic state must be empty again and the resident set size must stay at the level of the first round. Exits with a
+non-zero status if the state or the memory does not return to its baseline.
+"""
+
+import asyncio
+import gc
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, print_table, quiet_logging, rss_bytes
+
+from server import Server
+from transport_message import TransportMessage
+
+
+async def run_round(server: Server, clients: int, topics: int, per_client: int, round_no: int) -> None:
+    sids = await connect_sessions(server, clients, prefix=f"round{round_no}")
+    for sid in sids:
+        for name in random.sample(range(topics), per_client):
+            await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic=f"t{name}").json())
+    for sid in sids:
+        server.sio.manager.pre_disconnect(sid, "/")
+        await server.disconnect(sid, "client disconnect")
+        await server.sio.manager.disconnect(sid, "/", ignore_queue=True)
+
+
+def state_size(server: Server) -> int:
+    """Count the entries left in the topic state and in the Socket.IO manager."""
+    return (
+        len(server._topics)
+        + len(server._topics._subscriptions)
+        + len(server._sid_ip_mapping)
+        + len(server.sio.manager.rooms.get("/", {}))
+        + len(server.sio.manager._rooms_of)
+    )
+
+
+async def soak(params) -> bool:
+    server = Server()
+    sent = capture_packets(server)
+    rounds = max(2, params.clients // params.round_size)
+    rows = []
+    baseline = None
+    for round_no in range(rounds):
+        await run_round(server, params.round_size, params.topics, params.per_client, round_no)
+        sent.clear()
+        gc.collect()
+        rss = rss_bytes()
+        if baseline is None:
+            baseline = rss
+        rows.append(((round_no + 1) * params.round_size, state_size(server), f"{rss / 2**20:.1f}"))
+    print_table(("clients", "state entries", "rss [MiB]"), rows)
+
+    growth = rss - baseline
+    ok = state_size(server) == 0 and growth <= params.tolerance * 2**20
+    print(f"rss growth after first round: {growth / 2**20:.1f} MiB (tolerance {params.tolerance} MiB)")
+    return ok
+
+
+def main():
+    parser = ArgumentParser(description="Connect and disconnect many clients and check that nothing leaks")
+    parser.add_argument("--clients", type=int, default=100_000, help="Total clients. Default is 100000")
+    parser.add_argument("--round-size", type=int, default=10_000, help="Clients per round. Default is 10000")
+    parser.add_argument("--topics", type=int, default=1_000, help="Number of distinct topics. Default is 1000")
+    parser.add_argument("--per-client", type=int, default=3, help="Subscriptions per client. Default is 3")
+    parser.add_argument("--tolerance", type=float, default=16, help="Allowed rss growth in MiB. Default is 16")
+    params = parser.parse_args()
+
+    quiet_logging()
+    ok = asyncio.run(soak(params))
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Memory benchmark of the topic state.
+
+Run with `python bench/topic_memory.py`. The topic registry is filled with a given number of subscriptions, spread
+over few topics with many subscribers and over many topics with one subscriber, and the allocated memory is measured
+with tracemalloc. The session id strings are allocated beforehand, because they belong to Socket.IO and not to the
+topic state. The previous Topic class with an instance dictionary is measured for comparison.
+"""
+
+import gc
+import tracemalloc
+from argparse import ArgumentParser
+from typing import List, Optional
+
+from common import print_table, quiet_logging
+
+from server import Topic, TopicRegistry
+
+
+class DictTopic:
+    """Topic as it was stored before it used slots: every attribute lives in an instance dictionary."""
+
+    def __init__(self, name: Optional[str] = None) -> None:
+        self.name = name
+        self.content = None
+        self.subscribers = set()
+        self.timestamp = None
+        self.last_update = None
+
+
+def measure(topic_class, sids: List[str], topics: int) -> int:
+    """Subscribe every sid to one of topics topics and return the allocated bytes."""
+    names = [f"topic-{i}" for i in range(topics)]
+    gc.collect()
+    tracemalloc.start()
+    registry = TopicRegistry()
+    for i, name in enumerate(names):
+        registry.add(topic_class(name))
+    for i, sid in enumerate(sids):
+        registry.subscribe(registry.get(names[i % topics]), sid)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del registry
+    return size
+
+
+def main():
+    parser = ArgumentParser(description="Bytes per topic and per subscription")
+    parser.add_argument("--subscriptions", type=int, default=1_000_000, help="Subscriptions. Default is 1000000")
+    params = parser.parse_args()
+
+    quiet_logging()
+    sids = [f"{i:020d}" for i in range(params.subscriptions)]
+    rows = []
+    for topic_class in (DictTopic, Topic):
+        # Topics without subscribers give the size of a topic, one large topic the size of a subscription
+        empty = measure(topic_class, [], params.subscriptions)
+        crowded = measure(topic_class, sids, 1)
+        spread = measure(topic_class, sids, params.subscriptions)
+        rows.append(
+            (
+                topic_class.__name__,
+                f"{empty / params.subscriptions:.0f}",
+                f"{crowded / params.subscriptions:.0f}",
+                f"{spread / params.subscriptions:.0f}",
+            )
+        )
+    print(f"{params.subscriptions} subscriptions")
+    print_table(("class", "bytes/topic", "bytes/subscription (1 topic)", "bytes/topic with 1 subscriber"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Micro-benchmark of the request latency of the server handlers as the number of topics grows.
+
+Run with `python bench/topic_registry.py`. Every handler is called directly on an in-process `Server`, so the numbers
+show the cost of the topic lookups without any network overhead. The topics are created with subscribe requests, so
+populating a server with a million topics takes a few minutes.
+"""
+
+import asyncio
+import random
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, percentile, print_table, quiet_logging
+
+from server import Server
+from transport_message import TransportMessage
+
+
+async def populate(server: Server, count: int) -> None:
+    """Create count topics through subscribe requests of one session, so that every index of the server is filled."""
+    (sid,) = await connect_sessions(server, 1, "populate")
+    for i in range(count):
+        await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic=f"topic-{i}").json())
+
+
+async def measure(server: Server, count: int, requests: int):
+    """Measure the latency of subscribe, publish, status and unsubscribe requests on random topics."""
+    capture_packets(server)
+    await populate(server, count)
+    (sid,) = await connect_sessions(server, 1)
+    names = [f"topic-{random.randrange(count)}" for _ in range(requests)]
+    results = []
+    for handler in (server.handle_subscribe, server.handle_publish, server.handle_topic_status):
+        durations = []
+        for name in names:
+            data = TransportMessage(timestamp=int(time.time()), topic=name, payload="bench").json()
+            start = time.perf_counter()
+            await handler(sid, data)
+            durations.append(time.perf_counter() - start)
+        results.append((handler.__name__, durations))
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Request latency of the server handlers versus number of topics")
+    parser.add_argument("--max-topics", type=int, default=1_000_000, help="Largest topic count. Default is 1000000")
+    parser.add_argument("--requests", type=int, default=2_000, help="Requests per handler. Default is 2000")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = []
+    count = 10
+    while count <= params.max_topics:
+        server = Server()
+        for name, durations in asyncio.run(measure(server, count, params.requests)):
+            rows.append(
+                (
+                    count,
+                    name,
+                    f"{percentile(durations, 50) * 1e6:.1f}",
+                    f"{percentile(durations, 99) * 1e6:.1f}",
+                )
+            )
+        count *= 10
+    print_table(("topics", "handler", "p50 [us]", "p99 [us]"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark of status requests for a topic with many subscribers.
+
+Run with `python bench/topic_status.py`. An in-process server has one topic with the given number of subscribers. The
+status is requested repeatedly and compared with rendering the whole subscriber list on every request like the server
+did before. The cached status is measured once while nothing changes and once with a subscriber leaving and joining
+again before every request, so that every status has to be encoded again. The table shows the latency of the requests
+and the size of the status.
+"""
+
+import asyncio
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+from common import capture_packets, connect_sessions, percentile, print_table, quiet_logging
+
+from server import Server, Topic
+from transport_message import TransportMessage
+
+
+def full_status(server: Server, topic: Topic) -> str:
+    """Render the status the way the server did before it was cached."""
+    subscribers = ""
+    for subscriber in topic.subscribers:
+        subscribers += f"\t{server._sid_ip_mapping[subscriber]}\n\t"
+    timestamp = datetime.fromtimestamp(int(topic.timestamp)).strftime("%d-%m-%Y %H:%M:%S")
+    topic_status = f"\ntopic name:\t{topic.name}\n\ntimestamp:\t{timestamp}\n\ncontent:\t{topic.content}"
+    return TransportMessage(timestamp=int(time.time()), payload=f"{topic_status}\n\nsubscribers:{subscribers}").json()
+
+
+async def run(subscribers: int, requests: int):
+    server = Server()
+    capture_packets(server)
+    sids = await connect_sessions(server, subscribers)
+    for sid in sids:
+        await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic="popular").json())
+    await server.handle_publish(
+        sids[0], TransportMessage(timestamp=int(time.time()), topic="popular", payload="0").json()
+    )
+    topic = server._get_topic_by_name("popular")
+    request = TransportMessage(timestamp=int(time.time()), topic="popular", request_id=1).json()
+    rows = []
+
+    durations = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        data = full_status(server, topic)
+        durations.append(time.perf_counter() - start)
+    rows.append(("full list (before)", durations, len(data)))
+
+    for name, change in (("cached, unchanged", False), ("cached, subscribers changed", True)):
+        durations = []
+        for _ in range(requests):
+            if change:
+                data = TransportMessage(timestamp=int(time.time()), topic="popular").json()
+                await server.handle_unsubscribe(sids[-1], data)
+                await server.handle_subscribe(sids[-1], data)
+            start = time.perf_counter()
+            status = await server.handle_topic_status(sids[0], request)
+            durations.append(time.perf_counter() - start)
+        rows.append((name, durations, len(status)))
+    return [
+        (name, f"{percentile(durations, 50) * 1e3:.3f}", f"{percentile(durations, 99) * 1e3:.3f}", f"{size:,}")
+        for name, durations, size in rows
+    ]
+
+
+def main():
+    parser = ArgumentParser(description="Status requests for a topic with many subscribers")
+    parser.add_argument("--subscribers", type=int, default=50_000, help="Subscribers of the topic. Default is 50000")
+    parser.add_argument("--requests", type=int, default=200, help="Status requests per method. Default is 200")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rows = asyncio.run(run(params.subscribers, params.requests))
+    print_table(("method", "p50 [ms]", "p99 [ms]", "response [B]"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark of matching topic names against many wildcard subscriptions.
+
+Run with `python bench/wildcards.py`. The patterns look like the subscriptions of dashboards on a sensor hierarchy,
+e.g. `site-3/+/temp`, `site-3/building-7/#` or `+/building-7/humidity`. Every published topic name is matched against
+all patterns, once through the `TopicTrie` and once by testing every pattern on its own, which is the cost of a flat
+list of patterns. Afterwards `Server.handle_publish` is measured on an in-process server with the patterns subscribed
+by a thousand sessions, so the number includes encoding and sending the update to the matching subscribers.
+"""
+
+import asyncio
+import random
+import time
+from argparse import ArgumentParser
+
+from common import capture_packets, connect_sessions, percentile, print_table, quiet_logging, timed
+
+from server import Server
+from topic_trie import MULTI_LEVEL, SEPARATOR, SINGLE_LEVEL, TopicTrie
+from transport_message import TransportMessage
+
+SITES = 100
+BUILDINGS = 1_000
+MEASUREMENTS = ("temp", "humidity", "co2", "power")
+
+
+def random_pattern(rng: random.Random) -> str:
+    site, building = f"site-{rng.randrange(SITES)}", f"building-{rng.randrange(BUILDINGS)}"
+    measurement = rng.choice(MEASUREMENTS)
+    return rng.choice(
+        (
+            f"{site}/{SINGLE_LEVEL}/{measurement}",
+            f"{site}/{building}/{MULTI_LEVEL}",
+            f"{SINGLE_LEVEL}/{building}/{measurement}",
+            f"{site}/{building}/{SINGLE_LEVEL}",
+        )
+    )
+
+
+def random_topic(rng: random.Random) -> str:
+    return f"site-{rng.randrange(SITES)}/building-{rng.randrange(BUILDINGS)}/{rng.choice(MEASUREMENTS)}"
+
+
+def matches(pattern: str, name: str) -> bool:
+    """Match a single pattern level by level."""
+    levels = name.split(SEPARATOR)
+    for i, level in enumerate(pattern.split(SEPARATOR)):
+        if level == MULTI_LEVEL:
+            return True
+        if i >= len(levels) or (level != SINGLE_LEVEL and level != levels[i]):
+            return False
+    return len(levels) == len(pattern.split(SEPARATOR))
+
+
+def linear_match(patterns, name: str):
+    """Match a topic name against every pattern of a flat list."""
+    return [pattern for pattern in patterns if matches(pattern, name)]
+
+
+async def publish_latency(patterns, names, sessions: int):
+    """Measure handle_publish with the patterns subscribed by the given number of sessions."""
+    server = Server()
+    capture_packets(server)
+    sids = await connect_sessions(server, sessions + 1)
+    for i, pattern in enumerate(patterns):
+        server._patterns.add(pattern, sids[i % sessions])
+    durations = []
+    for name in names:
+        data = TransportMessage(timestamp=int(time.time()), topic=name, payload="bench").json()
+        start = time.perf_counter()
+        await server.handle_publish(sids[-1], data)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main():
+    parser = ArgumentParser(description="Wildcard matching with a trie versus a flat list of patterns")
+    parser.add_argument("--patterns", type=int, default=100_000, help="Subscribed patterns. Default is 100000")
+    parser.add_argument("--publishes", type=int, default=2_000, help="Matched topic names. Default is 2000")
+    parser.add_argument("--linear", type=int, default=20, help="Topic names matched by the flat list. Default is 20")
+    parser.add_argument("--sessions", type=int, default=1_000, help="Sessions subscribing. Default is 1000")
+    params = parser.parse_args()
+
+    quiet_logging()
+    rng = random.Random(1)
+    patterns = [random_pattern(rng) for _ in range(params.patterns)]
+    names = [random_topic(rng) for _ in range(params.publishes)]
+
+    trie = TopicTrie()
+    start = time.perf_counter()
+    for i, pattern in enumerate(patterns):
+        trie.add(pattern, f"sid-{i}")
+    build = time.perf_counter() - start
+
+    names_iter = iter(names)
+    trie_durations = timed(lambda: trie.match(next(names_iter)), len(names))
+    names_iter = iter(names[: params.linear])
+    linear_durations = timed(lambda: linear_match(patterns, next(names_iter)), params.linear)
+    matched = sum(len(trie.match(name)) for name in names) / len(names)
+    publish_durations = asyncio.run(publish_latency(patterns, names, params.sessions))
+
+    print(f"{params.patterns:,} patterns, trie built in {build:.2f} s, {matched:.1f} matching patterns per topic")
+    print_table(
+        ("method", "p50 [us]", "p99 [us]"),
+        [
+            (name, f"{percentile(durations, 50) * 1e6:,.1f}", f"{percentile(durations, 99) * 1e6:,.1f}")
+            for name, durations in (
+                ("trie match", trie_durations),
+                ("flat list match", linear_durations),
+                ("handle_publish", publish_durations),
+            )
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Load test of the publish throughput of the server with different numbers of worker processes.
+
+Run with `python bench/workers_load.py`. For every worker count, `server.py --workers N` is started on a free port and
+several client processes publish as fast as the acknowledgements come back, each over a number of websocket
+connections, while a few subscribers receive the updates. The publishes per second summed over all clients are
+reported. Throughput can only scale up to the number of CPU cores of the machine.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from argparse import ArgumentParser
+
+from common import print_table, start_server
+
+import socketio
+
+from transport_message import TransportMessage
+
+
+async def publisher(url: str, topic: str, duration: float) -> int:
+    """Publish to topic, waiting for every acknowledgement, for duration seconds and return the publishes."""
+    client = socketio.AsyncClient()
+    acked = asyncio.Queue()
+    client.on("PRINT_MESSAGE_AND_EXIT", lambda data: acked.put_nowait(data))
+    await client.connect(url, transports=["websocket"])
+    count = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        message = TransportMessage(timestamp=int(time.time()), topic=topic, payload=f"message {count}")
+        await client.emit("PUBLISH_TOPIC", message.json())
+        await acked.get()
+        count += 1
+    await client.disconnect()
+    return count
+
+
+def run_publishers(url: str, topics, connections: int, duration: float) -> int:
+    async def run():
+        tasks = [publisher(url, topics[i % len(topics)], duration) for i in range(connections)]
+        return sum(await asyncio.gather(*tasks))
+
+    return asyncio.run(run())
+
+
+async def subscribe(url: str, topics):
+    clients = []
+    for topic in topics:
+        client = socketio.AsyncClient()
+        await client.connect(url, transports=["websocket"])
+        await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=topic).json())
+        clients.append(client)
+    await asyncio.sleep(0.5)
+    return clients
+
+
+def measure(workers: int, params) -> float:
+    server, url = start_server("--workers", str(workers))
+    topics = [f"load-{i}" for i in range(params.topics)]
+    loop = asyncio.new_event_loop()
+    try:
+        subscribers = loop.run_until_complete(subscribe(url, topics))
+        with multiprocessing.Pool(params.processes) as pool:
+            start = time.perf_counter()
+            counts = pool.starmap(
+                run_publishers, [(url, topics, params.connections, params.duration)] * params.processes
+            )
+            elapsed = time.perf_counter() - start
+        for client in subscribers:
+            loop.run_until_complete(client.disconnect())
+    finally:
+        loop.close()
+        server.terminate()
+        server.wait()
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = ArgumentParser(description="Publish throughput versus number of worker processes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts. Default is 1 2 4")
+    parser.add_argument("--processes", type=int, default=4, help="Client processes. Default is 4")
+    parser.add_argument("--connections", type=int, default=8, help="Publishers per client process. Default is 8")
+    parser.add_argument("--topics", type=int, default=8, help="Topics with one subscriber each. Default is 8")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds of publishing. Default is 5")
+    params = parser.parse_args()
+
+    rows = [(workers, f"{measure(workers, params):,.0f}") for workers in params.workers]
+    print(f"{os.cpu_count()} CPU cores")
+    print_table(("workers", "publishes/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
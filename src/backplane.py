@@ -0,0 +1,170 @@
+"""Backplane connecting the worker processes of a server started with `--workers`.
+
+The parent process runs a `BackplaneHub` on a Unix socket which relays every message of a worker to all other
+workers. The workers talk to the hub through `UnixSocketManager`, a python-socketio client manager, so that events
+Socket.IO relays between servers and the topic state the workers share both travel over the same connection and no
+external message broker is needed.
+"""
+
+import asyncio
+import json
+import logging
+import socket
+import struct
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+_FRAME_HEADER = struct.Struct("!I")
+"""header of a frame on the backplane: length of the JSON encoded message"""
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Read one message from the backplane.
+
+    :param reader: stream of the backplane connection
+    :return: decoded message or None if the connection was closed
+    """
+    try:
+        header = await reader.readexactly(_FRAME_HEADER.size)
+        (length,) = _FRAME_HEADER.unpack(header)
+        return json.loads(await reader.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def encode_frame(message: dict) -> bytes:
+    """Encode one message for the backplane.
+
+    :param message: JSON serializable message
+    :return: frame with length header
+    """
+    data = json.dumps(message, separators=(",", ":")).encode()
+    return _FRAME_HEADER.pack(len(data)) + data
+
+
+class BackplaneHub:
+    """Relay between the worker processes. Every message of a worker is forwarded to all other workers."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        """Constructor of BackplaneHub class.
+
+        :param sock: bound and listening Unix socket the workers connect to
+        """
+        self.sock = sock
+        self._writers: Dict[asyncio.StreamWriter, Optional[str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def serve(self) -> None:
+        """Relay messages until cancelled. The connections of the workers are closed when the hub stops."""
+        server = await asyncio.start_unix_server(self._handle_worker, sock=self.sock)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self._writers[writer] = None
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                if message.get("method") == "hello":
+                    self._writers[writer] = message.get("host_id")
+                self._forward(writer, encode_frame(message))
+        except asyncio.CancelledError:
+            # The hub stops and closes the connections of all workers
+            self._writers[writer] = None
+        finally:
+            self._tasks.discard(task)
+            host_id = self._writers.pop(writer)
+            writer.close()
+        if host_id is not None:
+            # Let the other workers forget the topics of the worker that is gone
+            self._forward(writer, encode_frame({"method": "host_gone", "host_id": host_id}))
+
+    def _forward(self, sender: asyncio.StreamWriter, frame: bytes) -> None:
+        for writer in self._writers:
+            if writer is not sender:
+                writer.write(frame)
+
+
+class UnixSocketManager(AsyncPubSubManager):
+    """Socket.IO client manager which connects the worker processes through a `BackplaneHub`.
+    Besides the messages of python-socketio, the server of the worker can exchange its own messages with the other
+    workers through `send` and `on_message`.
+    """
+
+    name = "unixsocket"
+
+    def __init__(self, path: str, channel: str = "socketio", write_only: bool = False, logger=None) -> None:
+        """Constructor of UnixSocketManager class.
+
+        :param path: path of the Unix socket of the hub
+        :param channel: name of the channel. Only used in log messages, the hub relays everything
+        :param write_only: only emit events and do not listen for messages of other workers
+        :param logger: custom logger. If not given, the server logger is used
+        """
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.on_message: Optional[Callable[[dict], Awaitable[None]]] = None
+        """coroutine function called with every message sent through `send` by another worker"""
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting: Optional[asyncio.Lock] = None
+        self.thread: Optional[asyncio.Task] = None
+        """task listening to the other workers, started by `initialize`"""
+
+    async def send(self, message: dict) -> None:
+        """Send a message of the server to the other workers.
+
+        :param message: JSON serializable message
+        """
+        await self._publish({"method": "server", "host_id": self.host_id, **message})
+
+    async def close(self) -> None:
+        """Stop listening to the other workers and close the connection to the hub."""
+        if self.thread is not None:
+            self.thread.cancel()
+            self.thread = None
+        if self._writer is not None:
+            writer, self._reader, self._writer = self._writer, None, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _connect(self) -> None:
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                self._writer.write(encode_frame({"method": "hello", "host_id": self.host_id}))
+
+    async def _publish(self, data: dict) -> None:
+        if self._writer is None:
+            await self._connect()
+        self._writer.write(encode_frame(data))
+        await self._writer.drain()
+
+    async def _listen(self):
+        if self._reader is None:
+            await self._connect()
+        while True:
+            message = await read_frame(self._reader)
+            if message is None:
+                logging.error("Connection to the backplane was closed.")
+                return
+            if message.get("method") in ("server", "hello", "host_gone"):
+                if self.on_message is not None:
+                    await self.on_message(message)
+                continue
+            yield message
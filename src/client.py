@@ -1,40 +1,103 @@
 """Starts a Client to communicate with the server. For more information, please run `python client.py --help`"""
 
 import argparse
+import asyncio
 import atexit
+import functools
+import itertools
 import json
 import os
 import sys
+import threading
 import time
+from datetime import datetime
 
 import socketio
 from contextlib import redirect_stderr
 
-from transport_message import TransportMessage
+from codec import CODECS, decode_batch, decode_message, encode
+from topic_trie import is_pattern
+from transport_message import TransportMessage, TransportMessageBatch
+
+RECENT_OFFSETS = 1000
+"""number of offsets of a topic remembered to drop updates received twice"""
 
 
 class Client:
     """
-    Client object for publisher server
+    Client object for publisher server.
+    If the connection is lost, the client reconnects with exponential backoff and subscribes to its topics again.
+    With a linger time, published messages are buffered and sent in batches by a thread of the client. Several batches
+    are sent without waiting for the acknowledgement of the ones before, and flush or close wait until the server
+    acknowledged all of them
     """
 
-    def __init__(self, server_id) -> None:
+    def __init__(
+        self,
+        server_id,
+        codec="json",
+        reconnection_delay=1,
+        reconnection_delay_max=30,
+        linger=None,
+        batch_size=500,
+        max_in_flight=4,
+    ) -> None:
         """Constructor, init socket and variables
 
         :param server_id: server address
         :type server_id: string
+        :param codec: encoding of the messages, one of codec.CODECS
+        :type codec: string
+        :param reconnection_delay: seconds before the first attempt to reconnect, doubled with every further attempt
+        :type reconnection_delay: float
+        :param reconnection_delay_max: maximum seconds between two attempts to reconnect
+        :type reconnection_delay_max: float
+        :param linger: seconds a published message waits for more messages to be sent with in one PUBLISH_BATCH.
+            Default is to send every message on its own right away
+        :type linger: float
+        :param batch_size: maximum number of messages in one batch, a full batch is sent without waiting
+        :type batch_size: int
+        :param max_in_flight: maximum number of batches sent but not acknowledged yet
+        :type max_in_flight: int
         """
-        self.socket = socketio.Client()
+        self.codec = codec
+        self.subscribed_topics = []
+        self.last_offsets = {}
+        """offset of the last update received of every topic, or the one before the next message when subscribing. The
+        updates after it are requested on reconnect"""
+        self._received = {}
+        self._lock = threading.Lock()
+
+        self.linger = linger
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self._pending = []
+        self._in_flight = {}
+        self._responses = []
+        self._request_ids = itertools.count(1)
+        self._deadline = 0.0
+        self._flushing = 0
+        self._closed = False
+        self._sender = None
+        self._condition = threading.Condition()
+
+        # Every delay is moved randomly by up to one first delay, so the clients of a restarted server spread out
+        self.socket = socketio.Client(
+            reconnection_delay=reconnection_delay,
+            reconnection_delay_max=reconnection_delay_max,
+            randomization_factor=reconnection_delay,
+        )
+        self.socket.on("connect", self._handleConnect)
         try:
-            self.socket.connect(server_id)
+            # Without the polling handshake the client also works with a server running several worker processes
+            self.socket.connect(server_id, transports=["websocket"], auth=_auth(codec))
         except socketio.exceptions.ConnectionError:
             print(f"No connection to {server_id}, please make sure the server is available.")
             sys.exit(0)
 
         self.socket.on("PRINT_MESSAGE", self._handleResponse)
         self.socket.on("PRINT_MESSAGE_AND_EXIT", self._handleExitResponse)
-
-        self.subscribed_topics = []
+        self.socket.on("PRINT_MESSAGE_BATCH", self._handleBatchResponse)
 
     def disconnect(self) -> None:
         """
@@ -42,12 +105,16 @@ class Client:
         """
         self.socket.disconnect()
 
-    def subscribe(self, topics) -> None:
+    def subscribe(self, topics, offset=None, limit=None) -> None:
         """
         Request to subscribe to topics, wait for server messages
 
         :param topics: topics
         :type topics: string or list of strings
+        :param offset: receive the messages the server kept from this offset on first
+        :type offset: int
+        :param limit: receive at most this number of the most recent messages the server kept first
+        :type limit: int
         """
         self.subscribed_topics = topics
         # string to list
@@ -57,8 +124,17 @@ class Client:
         print(f"======= SUBSCRIBED TO {', '.join(self.subscribed_topics)} =======\n")
 
         for topic in self.subscribed_topics:
-            tMessage = TransportMessage(timestamp=time.time(), topic=topic)
-            self.socket.emit("SUBSCRIBE_TOPIC", tMessage.json())
+            tMessage = TransportMessage(timestamp=time.time(), topic=topic, offset=offset, limit=limit)
+            if is_pattern(topic):
+                self.socket.emit("SUBSCRIBE_TOPIC", encode(tMessage, self.codec))
+                continue
+            # The acknowledgement carries the offset the updates of the topic start from
+            tMessage.request_id = next(self._request_ids)
+            self.socket.emit(
+                "SUBSCRIBE_TOPIC",
+                encode(tMessage, self.codec),
+                callback=functools.partial(self._handleSubscribeAck, topic),
+            )
 
     def unsubscibe(self) -> None:
         """
@@ -67,31 +143,100 @@ class Client:
         print(f"\n======= UNSUBSCRIBED FROM {', '.join(self.subscribed_topics)} =======")
         for topic in self.subscribed_topics:
             tMessage = TransportMessage(timestamp=time.time(), topic=topic)
-            self.socket.emit("UNSUBSCRIBE_TOPIC", tMessage.json())
+            self.socket.emit("UNSUBSCRIBE_TOPIC", encode(tMessage, self.codec))
 
         # Disconnect
         self.socket.disconnect()
 
     def publish(self, topic, message):
         """
-        Request to publish a message to the topic
+        Request to publish a message to the topic. With a linger time, the message is added to the next batch, which
+        blocks while the batches not sent yet are full
 
         :param topic: topic
         :type topic: string
         :param message: message for topic
         :type message: string
+        :raises RuntimeError: if the client was closed
         """
-        print(f"======= PUBLISH MESSAGE =======")
+        if self.linger is not None:
+            self._buffer(TransportMessage(timestamp=int(time.time()), topic=topic, payload=message))
+            return
+        print("======= PUBLISH MESSAGE =======")
         print(f"Message: {message}")
         tMessage = TransportMessage(timestamp=time.time(), topic=topic, payload=message)
-        self.socket.emit("PUBLISH_TOPIC", tMessage.json())
+        self.socket.emit("PUBLISH_TOPIC", encode(tMessage, self.codec))
+
+    def publish_many(self, messages):
+        """
+        Request to publish several messages in one frame. The server answers with one acknowledgement for all of them
+
+        :param messages: messages as tuples of topic and message, optionally followed by a timestamp
+        :type messages: list of tuples
+        """
+        now = int(time.time())
+        tMessages = [
+            TransportMessage(topic=entry[0], payload=entry[1], timestamp=entry[2] if len(entry) > 2 else now)
+            for entry in messages
+        ]
+        print(f"======= PUBLISH {len(tMessages)} MESSAGES =======")
+        tBatch = TransportMessageBatch(timestamp=now, messages=tMessages)
+        self.socket.emit("PUBLISH_BATCH", encode(tBatch, self.codec))
+
+    def flush(self, timeout=None):
+        """
+        Send the buffered messages right away and wait until the server acknowledged all batches
+
+        :param timeout: maximum seconds to wait, default is to wait without limit
+        :type timeout: float
+        :return: responses of the server to the batches acknowledged since the last flush
+        :rtype: list of strings
+        :raises socketio.exceptions.TimeoutError: if not all batches were acknowledged within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while self._pending or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise socketio.exceptions.TimeoutError()
+                    self._condition.wait(remaining)
+            finally:
+                self._flushing -= 1
+            responses, self._responses = self._responses, []
+        return responses
+
+    def close(self, timeout=None):
+        """
+        Flush the buffered messages, stop sending and disconnect socket
 
-    def listTopics(self):
+        :param timeout: maximum seconds to wait for the acknowledgements, default is to wait without limit
+        :type timeout: float
+        :return: responses of the server to the batches acknowledged since the last flush
+        :rtype: list of strings
+        :raises socketio.exceptions.TimeoutError: if not all batches were acknowledged within the timeout
+        """
+        try:
+            return self.flush(timeout)
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            if self._sender is not None:
+                self._sender.join()
+            self.disconnect()
+
+    def listTopics(self, pattern=None):
         """
-        Request to list all topics avaliable
+        Request to list all topics avaliable. The server sends long lists in several messages
+
+        :param pattern: only list topics starting with this prefix, or matching it if it is a glob pattern like sensors/*
+        :type pattern: string
         """
-        tMessage = TransportMessage(timestamp=time.time())
-        self.socket.emit("LIST_TOPICS", tMessage.json())
+        tMessage = TransportMessage(timestamp=time.time(), topic=pattern)
+        self.socket.emit("LIST_TOPICS", encode(tMessage, self.codec))
 
     def getTopicStatus(self, topic):
         """
@@ -101,17 +246,192 @@ class Client:
         :type topic: string
         """
         tMessage = TransportMessage(timestamp=time.time(), topic=topic)
-        self.socket.emit("GET_TOPIC_STATUS", tMessage.json())
+        self.socket.emit("GET_TOPIC_STATUS", encode(tMessage, self.codec))
+
+    def _buffer(self, message):
+        """
+        Add a message to the next batch and start the thread sending the batches with the first message
+
+        :param message: message to publish
+        :type message: TransportMessage
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The client is closed")
+            # Block the publisher while the server does not keep up
+            while len(self._pending) >= self.batch_size * self.max_in_flight:
+                self._condition.wait()
+            if not self._pending:
+                self._deadline = time.monotonic() + self.linger
+            self._pending.append(message)
+            if len(self._pending) == 1 or len(self._pending) == self.batch_size:
+                self._condition.notify_all()
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._sendBatches, name="publisher", daemon=True)
+                self._sender.start()
+
+    def _sendBatches(self):
+        """
+        Send the buffered messages in batches until the client is closed. A batch is sent when it is full, when its
+        first message waited for the linger time or when the client is flushed, as long as fewer than max_in_flight
+        batches are not acknowledged yet
+        """
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        return
+                    if self._pending and self.socket.connected and len(self._in_flight) < self.max_in_flight:
+                        wait = self._deadline - time.monotonic()
+                        if len(self._pending) >= self.batch_size or self._flushing or wait <= 0:
+                            break
+                    elif self._pending and not self.socket.connected:
+                        # Wait for the reconnect
+                        wait = 0.1
+                    else:
+                        wait = None
+                    self._condition.wait(wait)
+                messages = self._pending[: self.batch_size]
+                del self._pending[: self.batch_size]
+                tBatch = TransportMessageBatch(
+                    timestamp=int(time.time()), messages=messages, request_id=next(self._request_ids)
+                )
+                self._in_flight[tBatch.request_id] = tBatch
+                self._condition.notify_all()
+            self._emitBatch(tBatch)
+
+    def _emitBatch(self, tBatch):
+        """
+        Send a batch of messages, which is acknowledged by the server
+
+        :param tBatch: batch with request id
+        :type tBatch: TransportMessageBatch
+        """
+        try:
+            self.socket.emit(
+                "PUBLISH_BATCH",
+                encode(tBatch, self.codec),
+                callback=functools.partial(self._handleBatchAck, tBatch.request_id),
+            )
+        except socketio.exceptions.SocketIOError:
+            # The connection was lost, the batch is sent again on reconnect
+            pass
+
+    def _handleBatchAck(self, request_id, response):
+        """
+        Receive the acknowledgement of a batch
+
+        :param request_id: request id of the batch
+        :type request_id: int
+        :param response: response from server
+        :type response: string or bytes
+        """
+        with self._condition:
+            if self._in_flight.pop(request_id, None) is not None:
+                self._responses.append(decode_message(response).payload)
+            self._condition.notify_all()
+
+    def _handleSubscribeAck(self, topic, response):
+        """
+        Receive the acknowledgement of a subscribe and remember the offset before the next message of the topic, so
+        the topic is resumed from there after a reconnect even if no update of it was received
+
+        :param topic: subscribed topic
+        :type topic: string
+        :param response: response from server
+        :type response: string or bytes
+        """
+        message = decode_message(response)
+        if message.offset is None:
+            # Only a failed subscribe is acknowledged without offset
+            self._handleExitResponse(response)
+            return
+        with self._lock:
+            if topic not in self._received:
+                self._received[topic] = set()
+                self.last_offsets[topic] = message.offset - 1
+        print(f"{message.payload}")
+
+    def _handleConnect(self):
+        """
+        Subscribe to all topics again and send the batches that were not acknowledged again after a reconnect. Batches
+        sent before the connection was lost may be published twice
+        """
+        if self.subscribed_topics:
+            self._resubscribe()
+        with self._condition:
+            unacknowledged = list(self._in_flight.values())
+        for tBatch in unacknowledged:
+            self._emitBatch(tBatch)
+
+    def _resubscribe(self):
+        """
+        Subscribe to all topics again in one SUBSCRIBE_BATCH. Every topic is resumed after the last update received or
+        the offset acknowledged when subscribing, so the updates published while the client was disconnected are
+        received from the messages the server kept
+        """
+        with self._lock:
+            # Offsets start again if the server lost the topics in a restart, so only updates on this connection count
+            self._received = {}
+            resume = dict(self.last_offsets)
+        now = int(time.time())
+        tMessages = [
+            TransportMessage(timestamp=now, topic=t, offset=resume[t] + 1 if t in resume else None)
+            for t in self.subscribed_topics
+        ]
+        print(f"\n======= RECONNECTED, SUBSCRIBING TO {', '.join(self.subscribed_topics)} AGAIN =======\n")
+        tBatch = TransportMessageBatch(timestamp=now, messages=tMessages)
+        self.socket.emit("SUBSCRIBE_BATCH", encode(tBatch, self.codec))
+
+    def _isNew(self, message):
+        """
+        Check if an update was not received before and remember its offset. After a reconnect, an update can be
+        received both from the kept messages and as it is published
+
+        :param message: update or response from server
+        :type message: TransportMessage
+        :return: False if the update was received before
+        :rtype: bool
+        """
+        if message.topic is None or message.offset is None:
+            return True
+        with self._lock:
+            received = self._received.get(message.topic)
+            if received is None:
+                received = self._received[message.topic] = set()
+                self.last_offsets[message.topic] = message.offset
+            elif message.offset in received:
+                return False
+            else:
+                # The handlers run in threads of their own, so the updates can be handled out of order
+                self.last_offsets[message.topic] = max(self.last_offsets[message.topic], message.offset)
+            received.add(message.offset)
+            if len(received) > 2 * RECENT_OFFSETS:
+                oldest = self.last_offsets[message.topic] - RECENT_OFFSETS
+                received.difference_update([offset for offset in received if offset <= oldest])
+        return True
 
     def _handleResponse(self, response):
         """
         Receive PRINT_MESSAGE response from server
 
         :param response: response from server
-        :type response: string
+        :type response: string or bytes
+        """
+        message = decode_message(response)
+        if self._isNew(message):
+            print(f"{message.payload}")
+
+    def _handleBatchResponse(self, response):
         """
-        response_dict = json.loads(response)
-        print(f"{response_dict['payload']}")
+        Receive PRINT_MESSAGE_BATCH response from server
+
+        :param response: response from server
+        :type response: string or bytes
+        """
+        for message in decode_batch(response).messages:
+            if self._isNew(message):
+                print(f"{message.payload}")
 
     def _handleExitResponse(self, response):
         """
@@ -120,29 +440,466 @@ class Client:
         :param response: response from server
         :type response: string
         """
-        self._handleResponse(response)
+        print(_format_status(decode_message(response).payload))
 
         # Exit
         self.disconnect()
         sys.exit(0)
 
 
+class ClientSession:
+    """
+    Client which keeps one connection to the server open for any number of requests.
+    Every request carries a request id and its response is awaited through the Socket.IO acknowledgement, so the
+    methods return the answer of the server instead of printing it and can be called from several threads.
+    """
+
+    def __init__(self, server_id, timeout=10, on_update=None, codec="json") -> None:
+        """Constructor, connect to the server
+
+        :param server_id: server address
+        :type server_id: string
+        :param timeout: seconds to wait for the response to a request
+        :type timeout: float
+        :param on_update: function called with every update of a subscribed topic
+        :type on_update: callable taking a TransportMessage
+        :param codec: encoding of the messages, one of codec.CODECS
+        :type codec: string
+        :raises socketio.exceptions.ConnectionError: if the server is not available
+        """
+        self.timeout = timeout
+        self.on_update = on_update
+        self.codec = codec
+        self._request_ids = itertools.count(1)
+
+        self.socket = socketio.Client()
+        self.socket.on("PRINT_MESSAGE", self._handleUpdate)
+        self.socket.on("PRINT_MESSAGE_BATCH", self._handleBatchUpdate)
+        self.socket.connect(server_id, transports=["websocket"], auth=_auth(codec))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Disconnect socket. The server removes all subscriptions of the session
+        """
+        self.socket.disconnect()
+
+    def subscribe(self, topics, offset=None, limit=None):
+        """
+        Subscribe to topics. Updates of the topics are passed to on_update
+
+        :param topics: topics
+        :type topics: string or list of strings
+        :param offset: pass the messages the server kept from this offset on to on_update first
+        :type offset: int
+        :param limit: pass at most this number of the most recent messages the server kept to on_update first
+        :type limit: int
+        :return: responses of the server, one per topic
+        :rtype: list of strings
+        """
+        if not isinstance(topics, list):
+            topics = [topics]
+        return [
+            self._request(
+                "SUBSCRIBE_TOPIC", TransportMessage(timestamp=time.time(), topic=t, offset=offset, limit=limit)
+            )
+            for t in topics
+        ]
+
+    def unsubscribe(self, topics):
+        """
+        Unsubscribe from topics
+
+        :param topics: topics
+        :type topics: string or list of strings
+        :return: responses of the server, one per topic
+        :rtype: list of strings
+        """
+        if not isinstance(topics, list):
+            topics = [topics]
+        return [self._request("UNSUBSCRIBE_TOPIC", TransportMessage(timestamp=time.time(), topic=t)) for t in topics]
+
+    def publish(self, topic, message):
+        """
+        Publish a message to the topic
+
+        :param topic: topic
+        :type topic: string
+        :param message: message for topic
+        :type message: string
+        :return: response of the server
+        :rtype: string
+        """
+        return self._request("PUBLISH_TOPIC", TransportMessage(timestamp=time.time(), topic=topic, payload=message))
+
+    def publish_many(self, messages):
+        """
+        Publish several messages in one frame
+
+        :param messages: messages as tuples of topic and message, optionally followed by a timestamp
+        :type messages: list of tuples
+        :return: response of the server for all messages
+        :rtype: string
+        """
+        now = int(time.time())
+        tMessages = [
+            TransportMessage(topic=entry[0], payload=entry[1], timestamp=entry[2] if len(entry) > 2 else now)
+            for entry in messages
+        ]
+        return self._request("PUBLISH_BATCH", TransportMessageBatch(timestamp=now, messages=tMessages))
+
+    def listTopics(self, pattern=None, cursor=None, limit=None):
+        """
+        List one page of the topics avaliable in alphabetical order
+
+        :param pattern: only list topics starting with this prefix, or matching it if it is a glob pattern like sensors/*
+        :type pattern: string
+        :param cursor: only list topics after this one, i.e. the last topic of the previous page
+        :type cursor: string
+        :param limit: maximum number of topics, the server lists at most 1000 without limit
+        :type limit: int
+        :return: response of the server, one topic per line after the first line
+        :rtype: string
+        """
+        return self._request(
+            "LIST_TOPICS", TransportMessage(timestamp=time.time(), topic=pattern, payload=cursor, limit=limit)
+        )
+
+    def iterTopics(self, pattern=None, page_size=1000):
+        """
+        Iterate over all topics avaliable in alphabetical order, which are requested page by page
+
+        :param pattern: only list topics starting with this prefix, or matching it if it is a glob pattern like sensors/*
+        :type pattern: string
+        :param page_size: number of topics requested at once. The server sends at most 1000 topics per page
+        :type page_size: int
+        :return: iterator over the names of the topics
+        :rtype: iterator of strings
+        """
+        cursor = None
+        while True:
+            names = self.listTopics(pattern, cursor, page_size).split("\n")[1:]
+            # A page can be shorter than requested although more topics follow, so only an empty page is the end
+            if not names:
+                return
+            yield from names
+            cursor = names[-1]
+
+    def getTopicStatus(self, topic, sample=None):
+        """
+        Get topic status
+
+        :param topic: topic
+        :type topic: string
+        :param sample: number of subscribers listed, the server lists 10 without sample
+        :type sample: int
+        :return: response of the server
+        :rtype: string
+        """
+        return _format_status(
+            self._request("GET_TOPIC_STATUS", TransportMessage(timestamp=time.time(), topic=topic, limit=sample))
+        )
+
+    def _request(self, event, message):
+        """
+        Send a request and wait for its acknowledgement
+
+        :param event: name of the event
+        :type event: string
+        :param message: request without request id
+        :type message: TransportMessage or TransportMessageBatch
+        :return: payload of the response
+        :rtype: string
+        :raises socketio.exceptions.TimeoutError: if the server does not answer within the timeout
+        """
+        message.request_id = next(self._request_ids)
+        response = self.socket.call(event, encode(message, self.codec), timeout=self.timeout)
+        return decode_message(response).payload
+
+    def _handleUpdate(self, response):
+        """
+        Receive PRINT_MESSAGE update of a subscribed topic
+
+        :param response: update from server
+        :type response: string or bytes
+        """
+        if self.on_update is not None:
+            self.on_update(decode_message(response))
+
+    def _handleBatchUpdate(self, response):
+        """
+        Receive PRINT_MESSAGE_BATCH updates of subscribed topics
+
+        :param response: updates from server
+        :type response: string or bytes
+        """
+        if self.on_update is not None:
+            for message in decode_batch(response).messages:
+                self.on_update(message)
+
+
+class AsyncClient:
+    """
+    Client on asyncio which subscribes to many topics with one request.
+    Updates of the subscribed topics are received by iterating over the client with async for. The client needs no
+    threads of its own, so one process can run thousands of them, e.g. to load test the server
+    """
+
+    def __init__(self, server_id, timeout=10, codec="json", max_updates=10_000) -> None:
+        """Constructor, the connection is opened by connect or async with
+
+        :param server_id: server address
+        :type server_id: string
+        :param timeout: seconds to wait for the response to a request
+        :type timeout: float
+        :param codec: encoding of the messages, one of codec.CODECS
+        :type codec: string
+        :param max_updates: maximum number of received updates not iterated over yet. If the iteration falls behind,
+            the oldest of them is dropped for a new update
+        :type max_updates: int
+        """
+        self.server_id = server_id
+        self.timeout = timeout
+        self.codec = codec
+        self.max_updates = max_updates
+        self.dropped_updates = 0
+        """number of updates dropped because the iteration fell behind"""
+        self.subscribed_topics = []
+        self._request_ids = itertools.count(1)
+        # Created on connect, so the queue belongs to the running event loop
+        self._updates = None
+
+        self.socket = socketio.AsyncClient()
+        self.socket.on("PRINT_MESSAGE", self._handleUpdate)
+        self.socket.on("PRINT_MESSAGE_BATCH", self._handleBatchUpdate)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        Wait for the next update of a subscribed topic
+
+        :return: update, the iteration ends when the client is closed
+        :rtype: TransportMessage
+        """
+        if self._updates is None:
+            raise StopAsyncIteration
+        message = await self._updates.get()
+        if message is None:
+            # Keep the end for other iterations
+            self._put(None)
+            raise StopAsyncIteration
+        return message
+
+    async def connect(self) -> None:
+        """
+        Connect to the server
+
+        :raises socketio.exceptions.ConnectionError: if the server is not available
+        """
+        self._updates = asyncio.Queue(self.max_updates)
+        await self.socket.connect(self.server_id, transports=["websocket"], auth=_auth(self.codec))
+
+    async def close(self) -> None:
+        """
+        Disconnect socket and end the iteration over the updates. The server removes all subscriptions of the client
+        """
+        await self.socket.disconnect()
+        if self._updates is not None:
+            self._put(None)
+
+    async def subscribe(self, topics, offset=None, limit=None):
+        """
+        Subscribe to topics in one SUBSCRIBE_BATCH request. Updates of the topics are received by iterating over the
+        client
+
+        :param topics: topics or wildcard patterns
+        :type topics: string or list of strings
+        :param offset: receive the messages the server kept from this offset on first
+        :type offset: int
+        :param limit: receive at most this number of the most recent messages the server kept of every topic first
+        :type limit: int
+        :return: response of the server for all topics
+        :rtype: string
+        """
+        if not isinstance(topics, list):
+            topics = [topics]
+        now = int(time.time())
+        tMessages = [TransportMessage(timestamp=now, topic=t, offset=offset, limit=limit) for t in topics]
+        response = await self._request("SUBSCRIBE_BATCH", TransportMessageBatch(timestamp=now, messages=tMessages))
+        self.subscribed_topics = list(dict.fromkeys(self.subscribed_topics + topics))
+        return response
+
+    async def unsubscribe(self, topics):
+        """
+        Unsubscribe from topics. The requests are sent concurrently
+
+        :param topics: topics or wildcard patterns
+        :type topics: string or list of strings
+        :return: responses of the server, one per topic
+        :rtype: list of strings
+        """
+        if not isinstance(topics, list):
+            topics = [topics]
+        responses = await asyncio.gather(
+            *(self._request("UNSUBSCRIBE_TOPIC", TransportMessage(timestamp=time.time(), topic=t)) for t in topics)
+        )
+        removed = set(topics)
+        self.subscribed_topics = [t for t in self.subscribed_topics if t not in removed]
+        return responses
+
+    async def publish(self, topic, message):
+        """
+        Publish a message to the topic
+
+        :param topic: topic
+        :type topic: string
+        :param message: message for topic
+        :type message: string
+        :return: response of the server
+        :rtype: string
+        """
+        return await self._request(
+            "PUBLISH_TOPIC", TransportMessage(timestamp=time.time(), topic=topic, payload=message)
+        )
+
+    async def _request(self, event, message):
+        """
+        Send a request and wait for its acknowledgement
+
+        :param event: name of the event
+        :type event: string
+        :param message: request without request id
+        :type message: TransportMessage or TransportMessageBatch
+        :return: payload of the response
+        :rtype: string
+        :raises socketio.exceptions.TimeoutError: if the server does not answer within the timeout
+        """
+        message.request_id = next(self._request_ids)
+        response = await self.socket.call(event, encode(message, self.codec), timeout=self.timeout)
+        return decode_message(response).payload
+
+    def _handleUpdate(self, response):
+        """
+        Receive PRINT_MESSAGE update of a subscribed topic
+
+        :param response: update from server
+        :type response: string or bytes
+        """
+        self._put(decode_message(response))
+
+    def _handleBatchUpdate(self, response):
+        """
+        Receive PRINT_MESSAGE_BATCH updates of subscribed topics
+
+        :param response: updates from server
+        :type response: string or bytes
+        """
+        for message in decode_batch(response).messages:
+            self._put(message)
+
+    def _put(self, message):
+        """
+        Queue an update for the iteration, or the end of the iteration. The oldest queued update is dropped if the
+        queue is full
+
+        :param message: update, or None to end the iteration
+        :type message: TransportMessage
+        """
+        if self._updates.full():
+            self._updates.get_nowait()
+            self.dropped_updates += 1
+        self._updates.put_nowait(message)
+
+
+def _format_status(payload):
+    """
+    Render the status of a topic as lines of labels and values. The server sends the status as JSON object and every
+    other response as text, which is returned as it is
+
+    :param payload: response of the server to a request
+    :type payload: string
+    :return: response to print
+    :rtype: string
+    """
+    try:
+        status = json.loads(payload)
+    except ValueError:
+        return payload
+    if not isinstance(status, dict):
+        return payload
+    lines = [f"\ntopic name:\t{status['topic']}\n"]
+    if status["timestamp"] is None:
+        lines.append("There was no publish on this topic yet.\n")
+    else:
+        timestamp = datetime.fromtimestamp(int(status["timestamp"])).strftime("%d-%m-%Y %H:%M:%S")
+        lines.append(f"timestamp:\t{timestamp}\n")
+        lines.append(f"content:\t{status['content']}\n")
+    lines.append(f"subscribers:\t{status['subscribers']}")
+    lines += [f"\t{address}" for address in status["sample"]]
+    if status["sample"] and status["subscribers"] > len(status["sample"]):
+        lines.append(f"\t... and {status['subscribers'] - len(status['sample'])} more")
+    return "\n".join(lines)
+
+
+def _auth(codec):
+    """
+    Auth data to connect with, which asks the server for the encoding
+
+    :param codec: encoding of the messages, one of codec.CODECS
+    :type codec: string
+    :return: auth data or None for the default JSON encoding
+    :rtype: dict
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}")
+    return {"codec": codec} if codec != "json" else None
+
+
 if __name__ == "__main__":
     # init parser
     parser = argparse.ArgumentParser(prog="Client", description="Client for Publisher")
 
     parser.add_argument("-s", "--server", required=True, help="server address as String", metavar="ADDRESS:PORT")
-    parser.add_argument("-sub", "--subscribe", nargs="+", help="list of topics to subscribe as Strings", metavar="STRING")
+    parser.add_argument(
+        "-sub", "--subscribe", nargs="+", help="list of topics to subscribe as Strings", metavar="STRING"
+    )
+    parser.add_argument(
+        "--offset", type=int, help="with --subscribe, first print the kept messages from this offset on", metavar="INT"
+    )
+    parser.add_argument(
+        "--last", type=int, help="with --subscribe, first print the last kept messages of the topics", metavar="INT"
+    )
     parser.add_argument("-p", "--publish", help="published topic as String", metavar="STRING")
     parser.add_argument("-m", "--message", help="message to be published to topic as String", metavar="STRING")
     parser.add_argument("-st", "--status", help="get topic status from server", metavar="STRING")
-    parser.add_argument("-l", "--list", action="store_true", help="get all list topics from server")
+    parser.add_argument(
+        "-l",
+        "--list",
+        nargs="?",
+        const="",
+        help="get all list topics from server, optionally only those starting with a prefix or matching a glob pattern",
+        metavar="FILTER",
+    )
+    parser.add_argument(
+        "--codec", choices=CODECS, default="json", help="encoding of the messages on the wire, default is json"
+    )
 
     args = parser.parse_args()
 
-    # init client
-    cli = Client(args.server)
-
     # workaround for
     # KeyboardInterrupt: "Exception ignored in: <module 'threading' from '/usr/lib/python3.10/threading.py'>"
     # To see error messages, comment those lines
@@ -152,13 +909,29 @@ if __name__ == "__main__":
 
     # call client functions
     if args.subscribe:
-        cli.subscribe(args.subscribe)
+        cli = Client(args.server, args.codec)
+        cli.subscribe(args.subscribe, args.offset, args.last)
         atexit.register(cli.unsubscibe)
-    elif args.publish and args.message:
-        cli.publish(args.publish, args.message)
-    elif args.list:
-        cli.listTopics()
-    elif args.status:
-        cli.getTopicStatus(args.status)
+        # The threads of the socket do not keep the process alive, so wait here until CTRL+C
+        cli.socket.wait()
+    elif (args.publish and args.message) or args.list is not None or args.status:
+        # One request, so wait for its response instead of waiting for PRINT_MESSAGE_AND_EXIT
+        try:
+            session = ClientSession(args.server, codec=args.codec)
+        except socketio.exceptions.ConnectionError:
+            print(f"No connection to {args.server}, please make sure the server is available.")
+            sys.exit(0)
+        with session:
+            if args.publish:
+                print("======= PUBLISH MESSAGE =======")
+                print(f"Message: {args.message}")
+                print(session.publish(args.publish, args.message))
+            elif args.list is not None:
+                # Print page by page, so the first topics appear right away however many there are
+                print("All topics on the server:")
+                for name in session.iterTopics(args.list or None):
+                    print(name)
+            else:
+                print(session.getTopicStatus(args.status))
     else:
         print("No action, please check your parameters")
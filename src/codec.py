@@ -0,0 +1,149 @@
+"""Encodings of the transport messages on the wire.
+
+Messages are encoded as JSON by default. A client can ask for the binary encoding by connecting with the Socket.IO
+auth data ``{"codec": "binary"}``. Its requests and all messages sent to it are then encoded as a fixed header packed
+with ``struct``, followed by the raw UTF-8 bytes of topic and payload, and Socket.IO sends them as binary attachments
+instead of text. This saves the JSON escaping of the payload and the parsing of the field names. Both encodings can be
+decoded by the same functions, so JSON and binary clients can be connected to the same server.
+
+Binary message: kind, flags of the optional fields, timestamp, request id, offset, limit, length of topic and length of
+payload, followed by topic and payload. Binary batch: kind, flags, timestamp, request id and number of messages,
+followed by the messages.
+"""
+
+import struct
+from typing import Union
+
+from transport_message import TransportMessage, TransportMessageBatch
+
+CODECS = ("json", "binary")
+"""names of the encodings"""
+
+_MESSAGE_HEADER = struct.Struct("!BBqqqqII")
+_BATCH_HEADER = struct.Struct("!BBqqI")
+
+_KIND_MESSAGE = 1
+_KIND_BATCH = 2
+
+_HAS_TOPIC = 1
+_HAS_PAYLOAD = 2
+_HAS_REQUEST_ID = 4
+_HAS_OFFSET = 8
+_HAS_LIMIT = 16
+
+
+def encode(message: Union[TransportMessage, TransportMessageBatch], codec: str = "json") -> Union[str, bytes]:
+    """Encode a message or batch.
+
+    :param message: Message or batch
+    :param codec: one of CODECS
+    :return: JSON string or bytes
+    """
+    if codec == "binary":
+        return encode_binary(message)
+    return message.json()
+
+
+def encode_binary(message: Union[TransportMessage, TransportMessageBatch]) -> bytes:
+    """Encode a message or batch in the binary encoding.
+
+    :param message: Message or batch
+    :return: Encoded message
+    """
+    if isinstance(message, TransportMessageBatch):
+        flags, request_id = _optional(message.request_id, _HAS_REQUEST_ID)
+        header = _BATCH_HEADER.pack(_KIND_BATCH, flags, int(message.timestamp), request_id, len(message.messages))
+        return b"".join([header, *(_encode_message(m) for m in message.messages)])
+    return _encode_message(message)
+
+
+def decode_message(data: Union[str, bytes]) -> TransportMessage:
+    """Decode a message in either encoding.
+
+    :param data: JSON string or bytes
+    :return: Decoded message
+    :raise ValueError: if data is not a valid message
+    """
+    if not isinstance(data, (bytes, bytearray)):
+        return TransportMessage.parse_raw(data)
+    message, end = _decode_message(data, 0)
+    if end != len(data):
+        raise ValueError("Unexpected data after the message")
+    return message
+
+
+def decode_batch(data: Union[str, bytes]) -> TransportMessageBatch:
+    """Decode a batch in either encoding.
+
+    :param data: JSON string or bytes
+    :return: Decoded batch
+    :raise ValueError: if data is not a valid batch
+    """
+    if not isinstance(data, (bytes, bytearray)):
+        return TransportMessageBatch.parse_raw(data)
+    try:
+        kind, flags, timestamp, request_id, count = _BATCH_HEADER.unpack_from(data, 0)
+    except struct.error as error:
+        raise ValueError(str(error)) from error
+    if kind != _KIND_BATCH:
+        raise ValueError("Not a batch")
+    pos = _BATCH_HEADER.size
+    messages = []
+    for _ in range(count):
+        message, pos = _decode_message(data, pos)
+        messages.append(message)
+    if pos != len(data):
+        raise ValueError("Unexpected data after the batch")
+    return TransportMessageBatch.construct(
+        timestamp=timestamp, messages=messages, request_id=request_id if flags & _HAS_REQUEST_ID else None
+    )
+
+
+def _optional(value, flag: int):
+    """Get the flag and the value to pack for an optional integer field."""
+    if value is None:
+        return 0, 0
+    return flag, int(value)
+
+
+def _encode_message(message: TransportMessage) -> bytes:
+    topic = message.topic.encode() if message.topic is not None else b""
+    payload = message.payload.encode() if message.payload is not None else b""
+    flags = (_HAS_TOPIC if message.topic is not None else 0) | (_HAS_PAYLOAD if message.payload is not None else 0)
+    request_flag, request_id = _optional(message.request_id, _HAS_REQUEST_ID)
+    offset_flag, offset = _optional(message.offset, _HAS_OFFSET)
+    limit_flag, limit = _optional(message.limit, _HAS_LIMIT)
+    flags |= request_flag | offset_flag | limit_flag
+    header = _MESSAGE_HEADER.pack(
+        _KIND_MESSAGE, flags, int(message.timestamp), request_id, offset, limit, len(topic), len(payload)
+    )
+    return header + topic + payload
+
+
+def _decode_message(data: bytes, pos: int):
+    """Decode the message starting at pos.
+
+    :return: Message and the position after it
+    """
+    try:
+        kind, flags, timestamp, request_id, offset, limit, topic_length, payload_length = _MESSAGE_HEADER.unpack_from(
+            data, pos
+        )
+    except struct.error as error:
+        raise ValueError(str(error)) from error
+    if kind != _KIND_MESSAGE:
+        raise ValueError("Not a message")
+    pos += _MESSAGE_HEADER.size
+    end = pos + topic_length + payload_length
+    if end > len(data):
+        raise ValueError("Message is truncated")
+    # The header guarantees the types of the fields, so the validation of the model is skipped
+    message = TransportMessage.construct(
+        timestamp=timestamp,
+        topic=bytes(data[pos : pos + topic_length]).decode() if flags & _HAS_TOPIC else None,
+        payload=bytes(data[pos + topic_length : end]).decode() if flags & _HAS_PAYLOAD else None,
+        request_id=request_id if flags & _HAS_REQUEST_ID else None,
+        offset=offset if flags & _HAS_OFFSET else None,
+        limit=limit if flags & _HAS_LIMIT else None,
+    )
+    return message, end
@@ -0,0 +1,323 @@
+"""Metrics of the server in the Prometheus text exposition format.
+
+The metrics are kept in plain Python objects without locks, because the server runs on a single event loop. Recording
+a value is an attribute update for a counter and a bisection of the bucket bounds for a histogram, so the handlers can
+be instrumented without noticeable overhead. Values that are cheap to read from the server state, like the number of
+topics, are not recorded at all but read by gauges when the metrics are scraped.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""content type of the text exposition format"""
+
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+"""bucket bounds in seconds for the durations of the handlers"""
+
+SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+"""bucket bounds for counts, e.g. the subscribers an update is sent to"""
+
+
+class CounterValue:
+    """Value of a counter for one combination of label values."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase the counter.
+
+        :param amount: non-negative increase
+        """
+        self.value += amount
+
+
+class HistogramValue:
+    """Observations of a histogram for one combination of label values.
+    Every observation is counted in its own bucket only, the cumulative counts are computed when the metrics are
+    rendered.
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        """observations per bucket, the last one is the +Inf bucket"""
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record an observation.
+
+        :param value: observed value
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    """Metric with optional labels. The values of the label combinations are created on first use."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *label_values: str):
+        """Get the value of a combination of label values.
+        Hot paths should keep the returned value instead of looking it up for every observation.
+
+        :param label_values: one value per label name
+        :return: CounterValue or HistogramValue
+        """
+        if len(label_values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.label_names)}")
+        value = self._values.get(label_values)
+        if value is None:
+            value = self._values[label_values] = self._new_value()
+        return value
+
+    @property
+    def family(self) -> str:
+        """Name of the metric in the HELP and TYPE lines, which has to be the name of its samples."""
+        return self.name
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Get the samples of the metric.
+
+        :return: name, labels and value of every sample
+        """
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Value that only increases, e.g. the number of handled requests."""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], Union[float, Dict[Tuple[str, ...], float]]]] = None,
+    ) -> None:
+        """Constructor of Counter class.
+
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param label_names: names of the labels
+        :param function: reads the value, or the value of every combination of label values if there are labels,
+            from a counter the server keeps anyway. Default is to count with inc
+        """
+        super().__init__(name, documentation, label_names)
+        self.function = function
+        if not self.label_names:
+            # A counter without labels is rendered as 0 before it is increased the first time
+            self.labels()
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase the counter without labels.
+
+        :param amount: non-negative increase
+        """
+        self.labels().inc(amount)
+
+    @property
+    def family(self) -> str:
+        return f"{self.name}_total"
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        if self.function is not None:
+            values = _read(self.function, self.label_names)
+        else:
+            values = {label_values: value.value for label_values, value in self._values.items()}
+        for label_values, value in values.items():
+            yield self.family, dict(zip(self.label_names, label_values)), value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in buckets, e.g. the durations of requests."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        if not self.label_names:
+            # A histogram without labels is rendered with empty buckets before the first observation
+            self.labels()
+
+    def observe(self, value: float) -> None:
+        """Record an observation without labels.
+
+        :param value: observed value
+        """
+        self.labels().observe(value)
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """Get the number and the sum of the observations of every combination of label values.
+
+        :return: number and sum by label values
+        """
+        return {label_values: (sum(value.counts), value.sum) for label_values, value in self._values.items()}
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for label_values, value in self._values.items():
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), value.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, value.sum
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Gauge(_Metric):
+    """Value read from the state of the server when the metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], Union[float, Dict[Tuple[str, ...], float]]],
+        label_names: Sequence[str] = (),
+    ) -> None:
+        """Constructor of Gauge class.
+
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param function: returns the value, or the value of every combination of label values if there are labels
+        :param label_names: names of the labels
+        """
+        super().__init__(name, documentation, label_names)
+        self.function = function
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for label_values, value in _read(self.function, self.label_names).items():
+            yield self.name, dict(zip(self.label_names, label_values)), value
+
+
+class MetricsRegistry:
+    """Collection of the metrics of a server."""
+
+    def __init__(self) -> None:
+        """Constructor of MetricsRegistry class."""
+        self._metrics: List[_Metric] = []
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], Union[float, Dict[Tuple[str, ...], float]]]] = None,
+    ) -> Counter:
+        """Create and register a counter. The suffix _total is added to its name in the exposition, like
+        prometheus_client does.
+
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param label_names: names of the labels
+        :param function: reads the value from a counter the server keeps anyway. Default is to count with inc
+        :return: Counter
+        """
+        return self._register(Counter(name, documentation, label_names, function))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        """Create and register a histogram.
+
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param label_names: names of the labels
+        :param buckets: upper bounds of the buckets. The +Inf bucket is added
+        :return: Histogram
+        """
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], Union[float, Dict[Tuple[str, ...], float]]],
+        label_names: Sequence[str] = (),
+    ) -> Gauge:
+        """Create and register a gauge read from the state of the server.
+
+        :param name: name of the metric
+        :param documentation: help text of the metric
+        :param function: returns the value, or the value of every combination of label values if there are labels
+        :param label_names: names of the labels
+        :return: Gauge
+        """
+        return self._register(Gauge(name, documentation, function, label_names))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format.
+
+        :return: text of the metrics
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.family} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.family} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    label_text = ",".join(f'{key}="{_escape(str(val), True)}"' for key, val in labels.items())
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"Metric {metric.name} already exists")
+        self._metrics.append(metric)
+        return metric
+
+
+def _read(function: Callable, label_names: Sequence[str]) -> Dict[Tuple[str, ...], float]:
+    """Call the function of a metric and get the value of every combination of label values."""
+    values = function()
+    return values if label_names else {(): values}
+
+
+def _escape(text: str, quotes: bool = False) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,356 @@
+"""Durable storage of the topic contents, so a restarted server starts with the topics it had before.
+
+The store in a directory consists of a compact snapshot of the topic table and a write-ahead log of the changes made
+since. Publishes are appended to the log before they are applied, and depending on the durability mode the server
+waits until they reached the disk before it applies and acknowledges them. Once enough records are logged, a new
+snapshot is written and the log segments it covers are deleted. A snapshot only covers the records up to the first
+publish that still waits for the disk, because the state of the server does not contain that publish yet. On startup,
+the snapshot is memory-mapped and only the log tail written after it is replayed.
+
+Durability modes:
+
+- ``async``: records are written at once and synced to disk about once per second. A crash loses at most that second
+- ``group``: publishes wait until their record is synced. All records appended while a sync is running are synced
+  together by the next one (group commit), so the cost of a sync is shared by all concurrent publishes
+- ``sync``: every publish syncs its records on its own instead of sharing the sync with other publishes
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DURABILITY_MODES = ("async", "group", "sync")
+"""names of the durability modes"""
+
+_RECORD_HEADER = struct.Struct("!IIQ")
+"""header of a log record: length and CRC32 of the JSON encoded record and its sequence number"""
+
+_SNAPSHOT_HEADER = struct.Struct("!8sQQ")
+"""header of a snapshot: magic, sequence number of the last record it contains and number of topics"""
+
+_SNAPSHOT_ENTRY = struct.Struct("!IIqQ")
+"""header of a topic in a snapshot: length of name and content, timestamp and next offset of the topic"""
+
+_SNAPSHOT_MAGIC = b"PUBSUB01"
+
+_SNAPSHOT_FILE = "snapshot"
+
+_SEGMENT_SUFFIX = ".wal"
+
+TopicState = Tuple[str, str, int, int]
+"""name, content, timestamp and next offset of a topic"""
+
+
+def write_snapshot(path: str, seq: int, topics: Iterable[TopicState]) -> None:
+    """Write a snapshot atomically. The file is replaced only after the new snapshot was synced to disk.
+
+    :param path: path of the snapshot
+    :param seq: sequence number of the last log record contained in the snapshot
+    :param topics: state of all topics with content
+    """
+    topics = list(topics)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, seq, len(topics)))
+        for name, content, timestamp, next_offset in topics:
+            name_bytes = name.encode()
+            content_bytes = content.encode()
+            file.write(_SNAPSHOT_ENTRY.pack(len(name_bytes), len(content_bytes), int(timestamp), next_offset))
+            file.write(name_bytes)
+            file.write(content_bytes)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _sync_directory(os.path.dirname(path))
+
+
+def read_snapshot(path: str) -> Tuple[int, Dict[str, List]]:
+    """Read a snapshot through a memory map.
+
+    :param path: path of the snapshot
+    :return: sequence number of the last log record contained in the snapshot and the content, timestamp and next
+        offset of every topic by name. Without snapshot, the sequence number is 0 and there are no topics
+    """
+    if not os.path.exists(path):
+        return 0, {}
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, seq, count = _SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        topics = {}
+        pos = _SNAPSHOT_HEADER.size
+        unpack = _SNAPSHOT_ENTRY.unpack_from
+        for _ in range(count):
+            name_length, content_length, timestamp, next_offset = unpack(data, pos)
+            pos += _SNAPSHOT_ENTRY.size
+            name = data[pos : pos + name_length].decode()
+            pos += name_length
+            topics[name] = [data[pos : pos + content_length].decode(), timestamp, next_offset]
+            pos += content_length
+    return seq, topics
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, list]]:
+    """Read the records of a log segment. A torn or corrupt record at the end, left by a crash during a write, is cut
+    off the file, so that records appended later are not hidden behind it.
+
+    :param path: path of the segment
+    :return: sequence number and content of every record
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    pos = 0
+    while pos < len(data):
+        if pos + _RECORD_HEADER.size > len(data):
+            break
+        length, crc, seq = _RECORD_HEADER.unpack_from(data, pos)
+        body = data[pos + _RECORD_HEADER.size : pos + _RECORD_HEADER.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            break
+        yield seq, json.loads(body)
+        pos += _RECORD_HEADER.size + length
+    if pos < len(data):
+        logging.warning("Cutting off %s bytes of an incomplete record at the end of %s.", len(data) - pos, path)
+        with open(path, "r+b") as file:
+            file.truncate(pos)
+            os.fsync(file.fileno())
+
+
+def _sync_directory(path: str) -> None:
+    """Sync a directory, so that created, renamed and deleted files in it are durable."""
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class TopicStore:
+    """Snapshot and write-ahead log of the topic contents in a directory."""
+
+    def __init__(self, directory: str, durability: str = "group", snapshot_every: int = 100_000) -> None:
+        """Constructor of TopicStore class.
+
+        :param directory: directory of the store. It is created if it does not exist
+        :param durability: one of DURABILITY_MODES
+        :param snapshot_every: number of log records after which a new snapshot is written
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode {durability}")
+        self.directory = directory
+        self.durability = durability
+        self.snapshot_every = snapshot_every
+        self._seq = 0
+        self._file = None
+        self._state: Optional[Callable[[], List[TopicState]]] = None
+        self._since_snapshot = 0
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._committer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._file_lock: Optional[asyncio.Lock] = None
+        self._waiters: List[asyncio.Future] = []
+        self._unapplied: Deque[int] = deque()
+        """sequence number of the first record of every publish that was not returned to the caller yet"""
+        self._applied: Optional[asyncio.Event] = None
+        """set while no publish waits to be applied"""
+        self._closed = False
+
+    def restore(self) -> Dict[str, List]:
+        """Read the latest snapshot and replay the log records written after it.
+
+        :return: content, timestamp and next offset of every topic by name
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq, topics = read_snapshot(os.path.join(self.directory, _SNAPSHOT_FILE))
+        for path in self._segments():
+            for seq, record in read_segment(path):
+                if seq <= self._seq:
+                    continue
+                self._seq = seq
+                self._since_snapshot += 1
+                if record[0] == "publish":
+                    _, name, payload, timestamp = record
+                    previous = topics.get(name)
+                    topics[name] = [payload, timestamp, previous[2] + 1 if previous is not None else 1]
+                elif record[0] == "remove":
+                    topics.pop(record[1], None)
+        return topics
+
+    def start(self, state: Callable[[], List[TopicState]]) -> None:
+        """Start logging. Has to be called on the event loop after restore.
+
+        :param state: function returning the state of all topics with content for snapshots
+        """
+        self._state = state
+        self._wakeup = asyncio.Event()
+        self._file_lock = asyncio.Lock()
+        self._applied = asyncio.Event()
+        self._applied.set()
+        self._open_segment()
+        _sync_directory(self.directory)
+        self._committer = asyncio.create_task(self._commit())
+
+    async def publish(self, entries: List[Tuple[str, str, int]]) -> None:
+        """Log publishes. Depending on the durability mode, wait until they were synced to disk.
+        The caller has to apply the publishes to the state right after the call returned, before it awaits anything
+        else. Until then, snapshots do not cover the records.
+
+        :param entries: List of topic name, message and timestamp
+        """
+        if self._closed or not entries:
+            return
+        first = self._seq + 1
+        self._unapplied.append(first)
+        self._applied.clear()
+        try:
+            for name, payload, timestamp in entries:
+                self._write(["publish", name, payload, timestamp])
+            await self._sync()
+        finally:
+            self._unapplied.remove(first)
+            if not self._unapplied:
+                self._applied.set()
+
+    def remove(self, name: str) -> None:
+        """Log the removal of a topic. The removal is synced with the next publish or within a second.
+
+        :param name: name of the topic
+        """
+        if self._closed:
+            return
+        self._write(["remove", name])
+        if self.durability == "group":
+            self._wakeup.set()
+
+    async def close(self) -> None:
+        """Sync the log, write a final snapshot and stop logging. Later records are ignored."""
+        if self._closed or self._committer is None:
+            return
+        self._closed = True
+        self._committer.cancel()
+        if self._snapshot_task is not None:
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+        await self._flush()
+        self._release_waiters()
+        # The released publishes are applied before the final snapshot is taken
+        await self._applied.wait()
+        await self.snapshot()
+        self._file.close()
+
+    async def snapshot(self) -> None:
+        """Write a snapshot of the current state and delete the log segments it covers.
+        The state is captured on the event loop, encoding and writing it happens in a thread. The snapshot covers the
+        records up to the first publish that was not applied yet, the segments with later records are kept for the
+        replay.
+        """
+        written = self._seq
+        seq = self._unapplied[0] - 1 if self._unapplied else written
+        topics = self._state()
+        self._since_snapshot = 0
+        if not self._closed:
+            # Records after the snapshot go to a new segment, so the old segments can be deleted as a whole
+            await self._rotate()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_snapshot, os.path.join(self.directory, _SNAPSHOT_FILE), seq, topics)
+        segments = self._segments()
+        # A segment ends before the next one starts. The last segment is still written to, unless the store is closed
+        ends = [self._first_seq(path) - 1 for path in segments[1:]] + [written if self._closed else None]
+        for path, end in zip(segments, ends):
+            if end is not None and end <= seq:
+                os.remove(path)
+        logging.info("Snapshot of %s topics written up to record %s.", len(topics), seq)
+
+    def _write(self, record: list) -> None:
+        self._seq += 1
+        self._since_snapshot += 1
+        body = json.dumps(record, separators=(",", ":")).encode()
+        self._file.write(_RECORD_HEADER.pack(len(body), zlib.crc32(body), self._seq) + body)
+        if self._since_snapshot >= self.snapshot_every and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_in_background())
+
+    async def _sync(self) -> None:
+        if self.durability == "sync":
+            await self._flush()
+        elif self.durability == "group":
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._wakeup.set()
+            await waiter
+
+    async def _commit(self) -> None:
+        """Sync the log in the background. In group mode, every sync covers all records written before it started."""
+        while True:
+            if self.durability == "group":
+                await self._wakeup.wait()
+                self._wakeup.clear()
+            else:
+                await asyncio.sleep(1)
+            waiters, self._waiters = self._waiters, []
+            try:
+                await self._flush()
+            except asyncio.CancelledError:
+                # Released by close
+                self._waiters[:0] = waiters
+                raise
+            except Exception as error:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(error)
+                continue
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _flush(self) -> None:
+        async with self._file_lock:
+            file = self._file
+            file.flush()
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, file.fileno())
+
+    async def _rotate(self) -> None:
+        """Continue the log in a new segment. The log stays locked until the old segment is synced, so the records in
+        it are durable before a sync of the new segment releases any publish.
+        """
+        async with self._file_lock:
+            old = self._file
+            self._open_segment()
+            old.flush()
+            await asyncio.get_running_loop().run_in_executor(None, self._close_segment, old)
+
+    def _close_segment(self, file) -> None:
+        """Sync and close a segment the log was continued after, together with the directory of the new segment."""
+        os.fsync(file.fileno())
+        file.close()
+        _sync_directory(self.directory)
+
+    async def _snapshot_in_background(self) -> None:
+        try:
+            await self.snapshot()
+        except Exception:
+            logging.exception("Writing the snapshot failed.")
+        finally:
+            self._snapshot_task = None
+
+    def _release_waiters(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _open_segment(self) -> None:
+        self._file = open(os.path.join(self.directory, f"{self._seq + 1:020d}{_SEGMENT_SUFFIX}"), "ab")
+
+    def _segments(self) -> List[str]:
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(_SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    @staticmethod
+    def _first_seq(path: str) -> int:
+        """Sequence number of the first record of a segment, which is its name"""
+        return int(os.path.basename(path)[: -len(_SEGMENT_SUFFIX)])
@@ -0,0 +1,244 @@
+"""Profiling of a running server.
+
+A profile is recorded in one of two modes:
+
+- ``sampler``: a thread takes the stack of the event loop thread at a fixed interval. The stacks are written in the
+  collapsed format of flame graph tools, one line per stack with the frames separated by ``;`` and the number of
+  samples, e.g. for ``flamegraph.pl`` or speedscope. The overhead only depends on the interval, so it is suited for
+  a server under load.
+- ``cprofile``: the deterministic profiler of the standard library records every call on the event loop thread. The
+  statistics are written for ``pstats`` and as text sorted by cumulative time. Every call gets slower, so it is
+  suited for finding where a single slow request spends its time.
+
+The time spent in every event handler while the profile was recorded and the lag of the event loop are written next to
+it.
+"""
+
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter as CounterDict
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import Histogram
+
+PROFILE_MODES = ("sampler", "cprofile")
+"""names of the profiling modes"""
+
+HandlerTotals = Dict[str, Tuple[int, float]]
+"""number of calls and total duration in seconds of every event handler"""
+
+
+class StackSampler:
+    """Thread recording the stacks of another thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        """Constructor of StackSampler class.
+
+        :param thread_id: identifier of the sampled thread
+        :param interval: seconds between two samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: CounterDict = CounterDict()
+        """number of samples of every collapsed stack"""
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampling thread."""
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Get the samples in the collapsed format of flame graph tools.
+
+        :return: one line per stack with the frames from the outermost one on and the number of samples
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+
+class Profiler:
+    """Records profiles of the event loop thread on request and measures the lag of the event loop."""
+
+    def __init__(
+        self,
+        directory: str,
+        handler_totals: Optional[Callable[[], HandlerTotals]] = None,
+        lag_histogram: Optional[Histogram] = None,
+    ) -> None:
+        """Constructor of Profiler class.
+
+        :param directory: directory the profiles are written to. It is created with the first profile
+        :param handler_totals: returns the calls and the total duration of every event handler since the start
+        :param lag_histogram: histogram the measured lag of the event loop is recorded in
+        """
+        self.directory = directory
+        self.handler_totals = handler_totals
+        self.lag_histogram = lag_histogram
+        self.mode: Optional[str] = None
+        """mode of the running profile, None if no profile is recorded"""
+        self.max_lag = 0.0
+        """longest lag of the event loop in seconds while the current profile was recorded"""
+        self._started = 0.0
+        self._handlers_at_start: HandlerTotals = {}
+        self._sampler: Optional[StackSampler] = None
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def running(self) -> bool:
+        """True while a profile is recorded"""
+        return self.mode is not None
+
+    def start(self, mode: str = "sampler", interval: float = 0.005) -> None:
+        """Start recording a profile. Has to be called on the event loop thread.
+
+        :param mode: one of PROFILE_MODES
+        :param interval: seconds between two samples of the sampler
+        :raise ValueError: if the mode is unknown or the interval is not a positive number
+        :raise RuntimeError: if a profile is already recorded
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode {mode}")
+        # Also rejects nan, which would make the sampler spin like an interval of 0
+        if not 0 < interval < float("inf"):
+            raise ValueError(f"Invalid sampling interval {interval}, expected a positive number of seconds")
+        if self.running:
+            raise RuntimeError(f"A {self.mode} profile is already recorded")
+        self._handlers_at_start = self.handler_totals() if self.handler_totals is not None else {}
+        self._started = time.time()
+        self.max_lag = 0.0
+        if mode == "sampler":
+            self._sampler = StackSampler(threading.get_ident(), interval)
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self.mode = mode
+
+    async def stop(self) -> Dict[str, str]:
+        """Stop recording and write the profile. Has to be called on the event loop thread. The profile is formatted
+        and written in a thread, so the event loop keeps serving the clients meanwhile.
+
+        :return: paths of the written files by their kind
+        :raise RuntimeError: if no profile is recorded
+        """
+        if not self.running:
+            raise RuntimeError("No profile is recorded")
+        if self._profile is not None:
+            self._profile.disable()
+        summary = {
+            "mode": self.mode,
+            "duration": time.time() - self._started,
+            "max_loop_lag": self.max_lag,
+            "handlers": self._handler_summary(),
+        }
+        recorded = (self.directory, self._started, self._sampler, self._profile, summary)
+        self._sampler = None
+        self._profile = None
+        self.mode = None
+        return await asyncio.get_running_loop().run_in_executor(None, _write_profile, *recorded)
+
+    def status(self) -> dict:
+        """Get the state of the profiler.
+
+        :return: mode and duration of the running profile and the longest lag of the event loop meanwhile
+        """
+        return {
+            "mode": self.mode,
+            "duration": time.time() - self._started if self.running else None,
+            "max_loop_lag": self.max_lag,
+        }
+
+    async def monitor_loop_lag(self, interval: float = 0.1) -> None:
+        """Measure how late the event loop wakes up a sleeping task until cancelled.
+        A lag means that a handler or a callback blocked the event loop for that long.
+
+        :param interval: seconds between two measurements
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - start - interval)
+            self.max_lag = max(self.max_lag, lag)
+            if self.lag_histogram is not None:
+                self.lag_histogram.observe(lag)
+
+    def _handler_summary(self) -> Dict[str, dict]:
+        """Get the calls and durations of the event handlers while the profile was recorded."""
+        if self.handler_totals is None:
+            return {}
+        summary = {}
+        for handler, (calls, total) in sorted(self.handler_totals().items()):
+            calls_before, total_before = self._handlers_at_start.get(handler, (0, 0.0))
+            calls -= calls_before
+            total -= total_before
+            if calls:
+                summary[handler] = {"calls": calls, "total": total, "mean": total / calls}
+        return summary
+
+
+def _collapse(frame) -> str:
+    """Get a stack in the collapsed format, from the outermost frame to the given one."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+def _write_profile(
+    directory: str,
+    started: float,
+    sampler: Optional[StackSampler],
+    profile: Optional[cProfile.Profile],
+    summary: dict,
+) -> Dict[str, str]:
+    """Write a recorded profile and its summary.
+
+    :param directory: directory the profile is written to
+    :param started: time the profile was started at
+    :param sampler: sampler of a profile in sampler mode, which is stopped first
+    :param profile: stopped profile in cprofile mode
+    :param summary: mode, duration, longest lag of the event loop and the event handlers of the profile
+    :return: paths of the written files by their kind
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Workers started with --workers write to the same directory
+    prefix = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{os.getpid()}")
+    files = {}
+    if sampler is not None:
+        sampler.stop()
+        files["stacks"] = _write(f"{prefix}.collapsed", sampler.collapsed())
+    else:
+        files["pstats"] = f"{prefix}.pstats"
+        profile.dump_stats(files["pstats"])
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(100)
+        files["text"] = _write(f"{prefix}.txt", text.getvalue())
+    files["summary"] = _write(f"{prefix}.json", json.dumps(summary, indent=2))
+    return files
+
+
+def _write(path: str, text: str) -> str:
+    with open(path, "w") as file:
+        file.write(text)
+    return path
@@ -0,0 +1,141 @@
+"""Bounded queues of the messages waiting to be sent to a client.
+
+Every client gets its own queue, which is drained by its own task, so a slow or stalled connection only delays its own
+messages. Publishers and the other subscribers do not wait for it. When the queue of a client is full, the overflow
+policy decides what happens to a new update:
+
+- ``drop-oldest``: the oldest queued update is dropped
+- ``conflate``: a queued update of the same topic is replaced by the new one, so the client skips intermediate values
+  but receives the latest one. Without queued update of the topic, the oldest queued update is dropped
+- ``disconnect``: the client is disconnected
+
+Responses and the kept messages sent on subscribe are never dropped, they are queued even if the queue is full. If the
+queue only holds such messages, a new update is dropped instead of an older one.
+"""
+
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+OVERFLOW_POLICIES = ("drop-oldest", "conflate", "disconnect")
+"""names of the overflow policies"""
+
+QUEUED = "queued"
+DROPPED = "dropped"
+CONFLATED = "conflated"
+OVERFLOW = "overflow"
+
+
+class SendQueue:
+    """Bounded queue of the encoded messages for one client."""
+
+    __slots__ = ("max_size", "policy", "_items", "_latest", "_ready", "closed", "idle")
+
+    def __init__(self, max_size: int, policy: str = "drop-oldest") -> None:
+        """Constructor of SendQueue class.
+
+        :param max_size: maximum number of queued messages
+        :param policy: one of OVERFLOW_POLICIES
+        """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy}")
+        self.max_size = max_size
+        self.policy = policy
+        self._items: Deque[list] = deque()
+        """queued items as lists of key, packets, waiter and whether the item is an update"""
+        self._latest: Dict[str, list] = {}
+        """latest queued item of every key"""
+        self._ready: Optional[asyncio.Event] = None
+        self.closed = False
+        self.idle = False
+        """True while the queue is empty and waited on, so nothing is being sent to the client"""
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(
+        self,
+        packets: List[object],
+        key: Optional[str] = None,
+        waiter: Optional[asyncio.Future] = None,
+        update: bool = False,
+    ) -> str:
+        """Queue a message. A full queue is handled according to the overflow policy if the message is an update.
+
+        :param packets: encoded message
+        :param key: topic of an update, which allows to conflate it with a newer update of the topic
+        :param waiter: future resolved once the message was sent, dropped or the queue was closed
+        :param update: whether the message is an update, which may be dropped. Other messages are always queued
+        :return: QUEUED, DROPPED if the oldest update or the message itself was dropped, CONFLATED if it replaced an
+            older update or OVERFLOW if the queue is full and the client has to be disconnected. Then the message is
+            not queued
+        """
+        if self.closed:
+            _release(waiter)
+            return QUEUED
+        result = QUEUED
+        if update and len(self._items) >= self.max_size:
+            if self.policy == "disconnect":
+                _release(waiter)
+                return OVERFLOW
+            if self.policy == "conflate" and key is not None:
+                item = self._latest.get(key)
+                if item is not None:
+                    # The update keeps the place of the one it replaces
+                    _release(item[2])
+                    item[1] = packets
+                    item[2] = waiter
+                    return CONFLATED
+            index = next((i for i, item in enumerate(self._items) if item[3]), None)
+            if index is None:
+                # Only messages that are never dropped are queued
+                _release(waiter)
+                return DROPPED
+            oldest = self._items[index]
+            del self._items[index]
+            self._forget(oldest)
+            result = DROPPED
+
+        item = [key, packets, waiter, update]
+        self._items.append(item)
+        if key is not None:
+            self._latest[key] = item
+        if self._ready is not None:
+            self._ready.set()
+        return result
+
+    async def get(self) -> Tuple[List[object], Optional[asyncio.Future]]:
+        """Wait for the next message.
+
+        :return: encoded message and its waiter
+        """
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        while not self._items:
+            self._ready.clear()
+            self.idle = True
+            try:
+                await self._ready.wait()
+            finally:
+                self.idle = False
+        item = self._items.popleft()
+        if item[0] is not None and self._latest.get(item[0]) is item:
+            del self._latest[item[0]]
+        return item[1], item[2]
+
+    def close(self) -> None:
+        """Drop all queued messages and ignore later ones."""
+        self.closed = True
+        while self._items:
+            self._forget(self._items.popleft())
+
+    def _forget(self, item: list) -> None:
+        """Drop an item taken from the queue."""
+        if item[0] is not None and self._latest.get(item[0]) is item:
+            del self._latest[item[0]]
+        _release(item[2])
+
+
+def _release(waiter: Optional[asyncio.Future]) -> None:
+    if waiter is not None and not waiter.done():
+        waiter.set_result(None)
@@ -1,99 +1,670 @@
 """Server for publisher subscriber system. For more information, please run `python server.py --help`"""
 
 import asyncio
+import bisect
+import heapq
+import itertools
+import json
 import logging
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import tempfile
 import time
 import functools
-from argparse import ArgumentParser
+import gc
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import deque
 from datetime import datetime
-from threading import Lock, Thread
-from typing import List, Optional, Union, Dict
+from fnmatch import fnmatchcase, translate
+from logging.handlers import QueueHandler, QueueListener
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
 
 import socketio
 from aiohttp import web
+from engineio import packet as eio_packet
 
-from transport_message import TransportMessage
+from backplane import BackplaneHub, UnixSocketManager
+from codec import decode_batch, decode_message, encode, encode_binary
+from metrics import CONTENT_TYPE, SIZE_BUCKETS, MetricsRegistry
+from persistence import DURABILITY_MODES, TopicState, TopicStore
+from profiling import PROFILE_MODES, HandlerTotals, Profiler
+from send_queue import CONFLATED, DROPPED, OVERFLOW, OVERFLOW_POLICIES, SendQueue
+from topic_trie import TopicTrie, is_pattern, validate_pattern
+from transport_message import TransportMessage, TransportMessageBatch
 
+LIST_PAGE_SIZE = 1000
+"""number of topics listed in one message"""
 
-## Setup logging ##
-# Set all loggers to ERROR level
-loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict]
-for logger in loggers:
-    logger.setLevel(logging.ERROR)
+STATUS_SAMPLE_SIZE = 10
+"""number of subscribers listed in the status of a topic by default"""
 
-# Set server logger to INFO level
-# Create file handler which logs even debug messages
-file_handler = logging.FileHandler("server.log")
-file_handler.setLevel(logging.DEBUG)
+MAX_STATUS_SAMPLE_SIZE = 1000
+"""maximum number of subscribers listed in the status of a topic"""
 
-# Create console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
+HEART_BEAT_KEY = web.AppKey("heart_beat", asyncio.Task)
+"""key of the heart beat task in the application"""
 
-# Create formatter and add it to the handlers
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
+LOOP_LAG_KEY = web.AppKey("loop_lag", asyncio.Task)
+"""key of the task measuring the lag of the event loop in the application"""
 
-# Add the handlers to the logger
-logging.getLogger().addHandler(file_handler)
-logging.getLogger().addHandler(console_handler)
-logging.getLogger().setLevel(logging.DEBUG)
 
-# logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-
-
-class ParallelTimer(Thread):
-    """Class to manage a parallel timer in different thread on the server triggering a heart beat algorithm every 20 seconds."""
+class PayloadTruncationFilter(logging.Filter):
+    """Logging filter which shortens long string arguments of log records, e.g. published messages.
+    The record is formatted on the event loop before it is handed to the logging thread, so arbitrarily large
+    payloads would otherwise be copied into every log line.
+    """
 
-    def __init__(self, server) -> None:
-        """Constructor of ParallelTimer class.
+    def __init__(self, limit: int) -> None:
+        """Constructor of PayloadTruncationFilter class.
 
-        :param server: server object
+        :param limit: maximum length of a string argument. 0 disables the truncation
         """
         super().__init__()
-        self.server = server
+        self.limit = limit
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit and isinstance(record.args, tuple):
+            record.args = tuple(self._shorten(arg) for arg in record.args)
+        return True
+
+    def _shorten(self, arg):
+        if isinstance(arg, str) and len(arg) > self.limit:
+            return f"{arg[:self.limit]}... ({len(arg)} characters)"
+        return arg
+
+
+def setup_logging(
+    level: str = "INFO", payload_limit: int = 256, log_file: str = "server.log", stream=None
+) -> QueueListener:
+    """Set up logging to a file and the console without blocking the event loop.
+    Log records are put into a queue and written by a QueueListener in its own thread.
+
+    :param level: name of the log level of the server
+    :param payload_limit: maximum length of a string argument in a log line. 0 disables the truncation
+    :param log_file: path of the log file
+    :param stream: stream of the console handler. Default is stderr
+    :return: started QueueListener, which has to be stopped on shutdown to flush the remaining records
+    """
+    # Set all loggers to ERROR level
+    loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict]
+    for logger in loggers:
+        logger.setLevel(logging.ERROR)
 
-    def run(self):
-        """
-        Starting parallel timer in loop.
-        """
-        while 1:
-            heartbeat = self.server.heart_beat(20)
-            asyncio.run(heartbeat)
+    # Create file handler and console handler
+    file_handler = logging.FileHandler(log_file)
+    console_handler = logging.StreamHandler(stream)
+
+    # Create formatter and add it to the handlers
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
+
+    # Only the queue handler is called on the event loop, the listener writes in its own thread
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(PayloadTruncationFilter(payload_limit))
+    listener = QueueListener(log_queue, file_handler, console_handler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener.start()
+    return listener
 
 
 class Topic:
-    """Class to manage the Topics with needed data."""
+    """Class to manage the Topics with needed data.
+    The attributes are stored in slots instead of an instance dictionary, which keeps every topic compact.
+    """
 
-    name: Union[None, str] = None
+    __slots__ = ("name", "content", "subscribers", "timestamp", "last_update", "log", "status")
+
+    name: Optional[str]
     """name of the topic"""
-    content: Union[None, str] = None
+    content: Optional[str]
     """content of the topic"""
-    subscribers: List[str] = []
-    """list of subscribers"""
-    timestamp: Union[None, int] = None
+    subscribers: Set[str]
+    """set of subscriber session ids"""
+    timestamp: Optional[int]
     """timestamp"""
-    last_update: Union[None, int] = None
+    last_update: Optional[int]
     """last update of topic"""
+    log: Optional["TopicLog"]
+    """recent messages of the topic, created with the first publish"""
+    status: Optional[str]
+    """encoded status with the default subscriber sample, reset when the topic or its subscribers change"""
 
+    def __init__(self, name: Optional[str] = None) -> None:
+        """Constructor of Topic class.
+
+        :param name: name of the topic
+        """
+        self.name = name
+        self.content = None
+        self.subscribers = set()
+        self.timestamp = None
+        self.last_update = None
+        self.log = None
+        self.status = None
+
+
+class TopicLog:
+    """Bounded log of the recent messages of a topic.
+    Every message gets an offset one higher than the one before. The oldest messages are dropped as soon as the log
+    holds more than max_messages messages or more than max_bytes bytes of UTF-8 encoded messages, so memory per topic
+    is bounded while the offsets keep increasing.
+    """
+
+    __slots__ = ("max_messages", "max_bytes", "next_offset", "size", "_entries")
+
+    def __init__(self, max_messages: int, max_bytes: int) -> None:
+        """Constructor of TopicLog class.
+
+        :param max_messages: maximum number of messages kept. 0 keeps no messages, only the offsets are counted
+        :param max_bytes: maximum size of the kept messages in bytes
+        """
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.next_offset = 0
+        """offset the next message will get"""
+        self.size = 0
+        """size of the kept messages in bytes"""
+        self._entries: Deque[Tuple[int, int, str, int]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def first_offset(self) -> int:
+        """Offset of the oldest kept message, or the next offset if no message is kept"""
+        return self._entries[0][0] if self._entries else self.next_offset
+
+    def append(self, payload: str, timestamp: int) -> int:
+        """Append a message and drop the oldest messages exceeding the limits.
+
+        :param payload: content of the message
+        :param timestamp: timestamp of the message
+        :return: offset of the message
+        """
+        offset = self.next_offset
+        self.next_offset += 1
+        size = len(payload.encode())
+        self._entries.append((offset, timestamp, payload, size))
+        self.size += size
+        while self._entries and (len(self._entries) > self.max_messages or self.size > self.max_bytes):
+            self.size -= self._entries.popleft()[3]
+        return offset
+
+    def read(self, offset: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple[int, int, str]]:
+        """Read kept messages in the order of their offsets.
+
+        :param offset: first offset to read. Default is the oldest kept message
+        :param limit: read at most the last limit messages
+        :return: offset, timestamp and content of every message
+        """
+        start = 0 if offset is None else max(0, offset - self.first_offset)
+        if limit is not None:
+            start = max(start, len(self._entries) - limit)
+        return [entry[:3] for entry in itertools.islice(self._entries, start, None)]
+
+
+class TopicRegistry:
+    """Index of all topics on the server.
+
+    Topics are stored in a dictionary keyed by name and every session id is mapped to the names of the topics it is
+    subscribed to, so lookups, adding and removing topics and subscriptions are O(1).
+    """
+
+    def __init__(self) -> None:
+        """Constructor of TopicRegistry class."""
+        self._topics: Dict[str, Topic] = {}
+        self._subscriptions: Dict[str, Set[str]] = {}
+        self.subscription_count = 0
+        """number of subscriptions of all topics"""
+
+    def __len__(self) -> int:
+        return len(self._topics)
+
+    def __iter__(self) -> Iterator[Topic]:
+        return iter(list(self._topics.values()))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._topics
+
+    def get(self, name: str) -> Optional[Topic]:
+        """Get a topic by its name.
+
+        :param name: Name of the topic
+        :return: Topic object or None if the topic does not exist
+        """
+        return self._topics.get(name)
+
+    def add(self, topic: Topic) -> None:
+        """Add a topic and index its current subscribers.
+
+        :param topic: Topic object
+        """
+        self._topics[topic.name] = topic
+        for sid in topic.subscribers:
+            self._subscriptions.setdefault(sid, set()).add(topic.name)
+        self.subscription_count += len(topic.subscribers)
+
+    def remove(self, topic: Topic) -> None:
+        """Remove a topic and all of its subscriptions.
+
+        :param topic: Topic object
+        """
+        del self._topics[topic.name]
+        for sid in topic.subscribers:
+            self._forget_subscription(sid, topic.name)
+        self.subscription_count -= len(topic.subscribers)
+
+    def subscribe(self, topic: Topic, sid: str) -> bool:
+        """Subscribe a session id to a topic.
+
+        :param topic: Topic object
+        :param sid: Session id of the subscriber
+        :return: False if the session id was already subscribed, True otherwise
+        """
+        if sid in topic.subscribers:
+            return False
+        topic.subscribers.add(sid)
+        topic.status = None
+        self._subscriptions.setdefault(sid, set()).add(topic.name)
+        self.subscription_count += 1
+        return True
+
+    def unsubscribe(self, topic: Topic, sid: str) -> bool:
+        """Unsubscribe a session id from a topic.
+
+        :param topic: Topic object
+        :param sid: Session id of the subscriber
+        :return: False if the session id was not subscribed, True otherwise
+        """
+        if sid not in topic.subscribers:
+            return False
+        topic.subscribers.discard(sid)
+        topic.status = None
+        self._forget_subscription(sid, topic.name)
+        self.subscription_count -= 1
+        return True
+
+    def topics_of(self, sid: str) -> Set[str]:
+        """Get the names of all topics a session id is subscribed to.
+
+        :param sid: Session id of the subscriber
+        :return: Set of topic names
+        """
+        return set(self._subscriptions.get(sid, ()))
+
+    def _forget_subscription(self, sid: str, name: str) -> None:
+        names = self._subscriptions.get(sid)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del self._subscriptions[sid]
+
+
+class TopicIndex:
+    """Sorted index of topic names for listing them page by page.
+
+    New names are appended and removed names are only remembered, so changing the index is O(1). The list is
+    brought into order when it is read the next time. Sorting a sorted list with a few appended names is close to
+    linear, because the sort detects the sorted part.
+    """
 
-class Server:
     def __init__(self) -> None:
-        self._list_of_topics: List[Topic] = []
+        """Constructor of TopicIndex class."""
+        self._names: List[str] = []
+        self._members: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._members
+
+    def add(self, name: str) -> None:
+        """Add a name to the index.
+
+        :param name: Name of the topic
+        """
+        if name in self._members:
+            return
+        self._members.add(name)
+        if name in self._removed:
+            # The name is still in the list
+            self._removed.discard(name)
+        else:
+            self._names.append(name)
+            self._sorted = False
+
+    def discard(self, name: str) -> None:
+        """Remove a name from the index if it is in the index.
+
+        :param name: Name of the topic
+        """
+        if name in self._members:
+            self._members.discard(name)
+            self._removed.add(name)
+
+    def page(self, pattern: Optional[str] = None, after: Optional[str] = None, limit: int = 1000) -> List[str]:
+        """Get the names in alphabetical order.
+
+        :param pattern: prefix of the names, or glob pattern like sensors/*/temp if it contains *, ? or [
+        :param after: only names after this one, i.e. the last name of the previous page
+        :param limit: maximum number of names
+        :return: names of the page
+        """
+        names = self._ordered()
+        glob = pattern is not None and any(char in pattern for char in "*?[")
+        prefix = pattern or ""
+        if glob:
+            # Only the part before the first wildcard narrows the range to look at
+            prefix = prefix[: min(prefix.index(char) for char in "*?[" if char in prefix)]
+        start = bisect.bisect_left(names, prefix)
+        if after is not None:
+            start = max(start, bisect.bisect_right(names, after))
+        # The names starting with the prefix are sorted before the prefix followed by the highest character
+        end = bisect.bisect_left(names, prefix + "\U0010ffff", start) if prefix else len(names)
+        candidates = map(names.__getitem__, range(start, end))
+        if glob:
+            candidates = filter(re.compile(translate(pattern)).match, candidates)
+        return list(itertools.islice(candidates, limit))
+
+    def _ordered(self) -> List[str]:
+        if self._removed:
+            self._names = [name for name in self._names if name not in self._removed]
+            self._removed.clear()
+        if not self._sorted:
+            self._names.sort()
+            self._sorted = True
+        return self._names
+
+
+class HeartBeat:
+    """Class to manage the heart beat algorithm as a background task on the event loop of the server.
+    Topics are kept in a heap ordered by the time their heart beat is due, so only topics that were not updated for
+    the interval are touched and the task sleeps while nothing is due.
+    """
+
+    def __init__(self, server, interval: int = 20) -> None:
+        """Constructor of HeartBeat class.
+
+        :param server: server object
+        :param interval: seconds without update after which a topic is sent to its subscribers again
+        """
+        self.server = server
+        self.interval = interval
+        self._deadlines: List[Tuple[int, int, str]] = []
+        self._scheduled: Set[str] = set()
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sweep_start: Optional[float] = None
+        """start of the current pass over the due topics"""
+
+    def schedule(self, topic: Topic) -> None:
+        """Schedule the heart beat of a topic relative to its last update.
+        A topic is in the heap at most once. If it is updated again before its entry is due, the entry is moved back
+        when it is popped.
+
+        :param topic: Topic object
+        """
+        if topic.name in self._scheduled:
+            return
+        due = topic.last_update + self.interval
+        if self._wakeup is not None and (not self._deadlines or due < self._deadlines[0][0]):
+            self._wakeup.set()
+        heapq.heappush(self._deadlines, (due, next(self._counter), topic.name))
+        self._scheduled.add(topic.name)
+
+    async def run(self) -> None:
+        """Send every topic to its subscribers again once it was not updated for the interval."""
+        self._wakeup = asyncio.Event()
+        while True:
+            if not self._deadlines:
+                await self._wait(None)
+                continue
+            due, _, name = self._deadlines[0]
+            delay = due - time.time()
+            if delay > 0:
+                await self._wait(delay)
+                continue
+
+            if self._sweep_start is None:
+                self._sweep_start = time.perf_counter()
+            heapq.heappop(self._deadlines)
+            self._scheduled.discard(name)
+            topic = self.server._get_topic_by_name(name)
+            if topic is None or topic.last_update is None:
+                # Topic was removed in the meantime
+                continue
+            if topic.last_update + self.interval > due:
+                # Topic was updated in the meantime
+                self.schedule(topic)
+                continue
+            await self.server.update_topic(topic)
+            logging.info("Topic %s was updated through heart beat.", topic.name)
+
+    async def _wait(self, timeout: Optional[float]) -> None:
+        """Sleep until timeout expired or an earlier heart beat was scheduled."""
+        if self._sweep_start is not None:
+            # All due topics were sent
+            self.server._heart_beat_sweeps.observe(time.perf_counter() - self._sweep_start)
+            self._sweep_start = None
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class IndexedRoomManager(socketio.AsyncManager):
+    """Socket.IO client manager which keeps an index of the rooms of every session id.
+    The default manager scans all rooms when a client disconnects, which is O(topics) per disconnect because every
+    topic has its own room. With the index only the rooms the client joined are touched.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._rooms_of: Dict[Tuple[str, str], Set[Optional[str]]] = {}
+
+    def basic_enter_room(self, sid, namespace, room, eio_sid=None):
+        super().basic_enter_room(sid, namespace, room, eio_sid=eio_sid)
+        self._rooms_of.setdefault((namespace, sid), set()).add(room)
+
+    def basic_leave_room(self, sid, namespace, room):
+        super().basic_leave_room(sid, namespace, room)
+        rooms = self._rooms_of.get((namespace, sid))
+        if rooms is not None:
+            rooms.discard(room)
+            if not rooms:
+                del self._rooms_of[(namespace, sid)]
+
+    def basic_disconnect(self, sid, namespace, **kwargs):
+        for room in list(self._rooms_of.get((namespace, sid), ())):
+            self.basic_leave_room(sid, namespace, room)
+        # The session is in no room anymore, but the base class would still scan the rooms of all topics for it. It
+        # only gets an empty room set of the namespace, so it just does its own bookkeeping, e.g. of the callbacks
+        rooms = self.rooms.get(namespace)
+        self.rooms[namespace] = {}
+        try:
+            super().basic_disconnect(sid, namespace, **kwargs)
+        finally:
+            if rooms is not None:
+                self.rooms[namespace] = rooms
+            else:
+                self.rooms.pop(namespace, None)
+
+    def get_rooms(self, sid, namespace):
+        return [room for room in self._rooms_of.get((namespace, sid), ()) if room is not None]
+
+
+class IndexedBackplaneManager(IndexedRoomManager, UnixSocketManager):
+    """Client manager of a worker process: connects to the backplane and keeps an index of the rooms of every sid."""
+
+
+class Server:
+    def __init__(
+        self,
+        heart_beat_interval: int = 20,
+        client_manager: Optional[socketio.AsyncManager] = None,
+        retention_messages: int = 100,
+        retention_bytes: int = 1024 * 1024,
+        store: Optional[TopicStore] = None,
+        send_queue_size: int = 1000,
+        overflow_policy: str = "drop-oldest",
+        conflation_windows: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Constructor of Server class.
+
+        :param heart_beat_interval: seconds without update after which a topic is sent to its subscribers again
+        :param client_manager: Socket.IO client manager. A UnixSocketManager connects this server to the other worker
+            processes. Default is an IndexedRoomManager for a single process
+        :param retention_messages: number of recent messages kept per topic for late subscribers
+        :param retention_bytes: maximum size of the recent messages kept per topic in bytes
+        :param store: durable storage of the topic contents. Default is to keep the topics in memory only
+        :param send_queue_size: maximum number of messages waiting to be sent to a client
+        :param overflow_policy: what happens when the send queue of a client is full, one of OVERFLOW_POLICIES
+        :param conflation_windows: conflation window in milliseconds for the topics matching a glob pattern like
+            sensors/*. Publishes within the window only update the topic and its subscribers receive the latest
+            content when the window closes. The first matching pattern counts. Default is no conflation
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow_policy}")
+        self.retention_messages = retention_messages
+        self.retention_bytes = retention_bytes
+        self.store = store
+        self.send_queue_size = send_queue_size
+        self.overflow_policy = overflow_policy
+        self._send_queues: Dict[str, SendQueue] = {}
+        self._drain_tasks: Dict[str, asyncio.Task] = {}
+        self._disconnect_tasks: Set[asyncio.Task] = set()
+        self._send_counters = {DROPPED: 0, CONFLATED: 0, "disconnected": 0}
+        self.conflation_windows = dict(conflation_windows or {})
+        self._pending_updates: Dict[str, asyncio.TimerHandle] = {}
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._conflation_counters = {"coalesced": 0, "flushed": 0}
+        self._topics = TopicRegistry()
+        self._patterns = TopicTrie()
+        self._remote_topics: Dict[str, Set[str]] = {}
+        self._topic_index = TopicIndex()
+        """names of the topics of all processes"""
+        self._remote_patterns = TopicTrie()
         self._sid_ip_mapping: Dict[str, str] = {}
-        self._lock = Lock()
+        self._binary_sids: Set[str] = set()
+        self.heart_beat = HeartBeat(self, heart_beat_interval)
+        self.metrics = MetricsRegistry()
+        self._register_metrics()
+
+        self._backplane: Optional[UnixSocketManager] = None
+        if isinstance(client_manager, UnixSocketManager):
+            self._backplane = client_manager
+            self._backplane.on_message = self._handle_backplane_message
 
         self.sio = socketio.AsyncServer(
-            async_mode="aiohttp", cors_allowed_origins="*", logger=False, engineio_logger=False
+            async_mode="aiohttp",
+            client_manager=client_manager or IndexedRoomManager(),
+            cors_allowed_origins="*",
+            logger=False,
+            engineio_logger=False,
         )
         self.sio.event(self.connect)
+        self.sio.event(self.disconnect)
         self.sio.on("SUBSCRIBE_TOPIC", self.handle_subscribe)
         self.sio.on("UNSUBSCRIBE_TOPIC", self.handle_unsubscribe)
         self.sio.on("PUBLISH_TOPIC", self.handle_publish)
+        self.sio.on("PUBLISH_BATCH", self.handle_publish_batch)
+        self.sio.on("SUBSCRIBE_BATCH", self.handle_subscribe_batch)
         self.sio.on("LIST_TOPICS", self.handle_list_topics)
         self.sio.on("GET_TOPIC_STATUS", self.handle_topic_status)
 
+    def _register_metrics(self) -> None:
+        """Create the metrics recorded by the server and the gauges read from its state when they are scraped."""
+        metrics = self.metrics
+        self._handler_durations = metrics.histogram(
+            "pubsub_handler_duration_seconds", "Duration of the Socket.IO event handlers.", ("handler",)
+        )
+        self._handler_exceptions = metrics.counter(
+            "pubsub_handler_exceptions", "Exceptions raised by the Socket.IO event handlers.", ("handler",)
+        )
+        self._fanout_sizes = metrics.histogram(
+            "pubsub_fanout_subscribers", "Subscribers an update of a topic is sent to.", buckets=SIZE_BUCKETS
+        )
+        self._fanout_durations = metrics.histogram(
+            "pubsub_fanout_duration_seconds", "Duration of queueing an update of a topic for all of its subscribers."
+        )
+        self._heart_beat_sweeps = metrics.histogram(
+            "pubsub_heartbeat_sweep_duration_seconds", "Duration of sending the heart beats of all due topics."
+        )
+        metrics.gauge("pubsub_topics", "Topics of this process.", lambda: len(self._topics))
+        metrics.gauge(
+            "pubsub_subscriptions",
+            "Subscriptions of the topics of this process.",
+            lambda: self._topics.subscription_count,
+        )
+        metrics.gauge("pubsub_patterns", "Subscribed wildcard patterns.", lambda: len(self._patterns))
+        metrics.gauge(
+            "pubsub_connected_clients",
+            "Connected clients by encoding.",
+            lambda: {
+                ("json",): len(self._sid_ip_mapping) - len(self._binary_sids),
+                ("binary",): len(self._binary_sids),
+            },
+            ("codec",),
+        )
+        metrics.gauge("pubsub_send_queue_messages", "Messages waiting in the send queues.", self._queued_messages)
+        metrics.counter(
+            "pubsub_send_queue_overflows",
+            "Messages dropped or conflated and clients disconnected because their send queue was full.",
+            ("result",),
+            lambda: {(result,): count for result, count in self._send_counters.items()},
+        )
+        metrics.gauge(
+            "pubsub_conflation_windows", "Topics with an open conflation window.", lambda: len(self._pending_updates)
+        )
+        metrics.counter(
+            "pubsub_conflation_coalesced_publishes",
+            "Publishes coalesced into a later update of the topic.",
+            function=lambda: self._conflation_counters["coalesced"],
+        )
+
+    def handler_totals(self) -> HandlerTotals:
+        """Get the number of calls and the total duration of every event handler since the start.
+
+        :return: calls and duration in seconds by name of the handler
+        """
+        return {labels[0]: totals for labels, totals in self._handler_durations.totals().items()}
+
+    def _queued_messages(self) -> int:
+        return sum(len(queue) for queue in self._send_queues.values())
+
+    def _measure_decorator(func):
+        """Decorator for recording the duration and the exceptions of an event handler in the metrics."""
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            except Exception:
+                self._handler_exceptions.labels(name).inc()
+                raise
+            finally:
+                self._handler_durations.labels(name).observe(time.perf_counter() - start)
+
+        return wrapper
+
     def _check_data_none_decorator(func):
         """Decorator for checking if data is None.
         If data is None, the client will receive an error message.
@@ -107,110 +678,198 @@ class Server:
                 response = TransportMessage(
                     timestamp=int(time.time()), payload="Missing payload of type TransportMessage."
                 )
-                await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
                 logging.error("%s - %s", self._sid_ip_mapping[sid], response.payload)
-                return None
+                return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response)
             return await func(self, *args, **kwargs)
 
         return wrapper
 
     def _check_topic_decorator(func):
-        """Decorator for checking if topic exists.
-        If topic does not exist, the client will receive an error message.
+        """Decorator for parsing the data and checking if the topic is set.
+        The data is parsed into a TransportMessage exactly once and the typed message is handed to the decorated
+        handler. If the data is invalid or the topic is missing, the client will receive an error message.
         """
 
         @functools.wraps(func)
-        async def wrapper(self, *args, **kwargs):
-            sid = args[0]
-            data = args[1] if len(args) > 1 else None
+        async def wrapper(self, sid, data=None):
             try:
-                parsed_data = TransportMessage.parse_raw(data)
+                parsed_data = decode_message(data)
             except Exception:
                 response = TransportMessage(timestamp=int(time.time()), payload="Invalid payload.")
-                await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
                 logging.error("%s - %s", self._sid_ip_mapping[sid], response.payload)
-                return None
+                return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response)
 
             # Check if data contains topic
             if parsed_data.topic is None:
                 response = TransportMessage(timestamp=int(time.time()), payload="Missing parameter topic.")
-                await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
                 logging.error("%s - %s", self._sid_ip_mapping[sid], response.payload)
-                return None
-            return await func(self, *args, **kwargs)
+                return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, parsed_data)
+            return await func(self, sid, parsed_data)
 
         return wrapper
 
+    def _check_batch_decorator(func):
+        """Decorator for parsing the data into a TransportMessageBatch.
+        The typed batch is handed to the decorated handler. If the data is invalid, the client will receive an error
+        message.
+        """
+
+        @functools.wraps(func)
+        async def wrapper(self, sid, data=None):
+            try:
+                parsed_data = decode_batch(data)
+            except Exception:
+                response = TransportMessage(timestamp=int(time.time()), payload="Invalid payload.")
+                logging.error("%s - %s", self._sid_ip_mapping[sid], response.payload)
+                return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response)
+            return await func(self, sid, parsed_data)
+
+        return wrapper
+
+    @_measure_decorator
     async def connect(self, sid, environ, auth=None):
         """Called when a client connects to the server.
 
         :param sid: Generated session id
         :param environ: Environment variables
-        :param auth: Unused
+        :param auth: Auth data of the client. With {"codec": "binary"}, the client is sent binary encoded messages
         """
         logging.info("%s - SID: %s connected", environ["aiohttp.request"].remote, sid)
         self._sid_ip_mapping[sid] = environ["aiohttp.request"].remote
+        if isinstance(auth, dict) and auth.get("codec") == "binary":
+            self._binary_sids.add(sid)
+
+    @_measure_decorator
+    async def disconnect(self, sid, reason=None) -> None:
+        """Called when a client disconnects from the server.
+        The client is unsubscribed from all of its topics. Topics without subscribers left will be deleted.
 
+        :param sid: Generated session id
+        :param reason: Reason of the disconnect
+        """
+        self._close_send_queue(sid)
+        for name in self._topics.topics_of(sid):
+            topic = self._get_topic_by_name(name)
+            self._topics.unsubscribe(topic, sid)
+            # Delete topic if no subscribers left
+            if len(topic.subscribers) == 0:
+                await self._remove_topic(topic)
+        for pattern in self._patterns.remove_all(sid):
+            if pattern not in self._patterns:
+                await self._share({"action": "pattern_removed", "pattern": pattern})
+        self._binary_sids.discard(sid)
+        logging.info("%s - SID: %s disconnected", self._sid_ip_mapping.pop(sid, None), sid)
+
+    @_measure_decorator
     @_check_data_none_decorator
     @_check_topic_decorator
-    async def handle_subscribe(self, sid, data=None) -> None:
+    async def handle_subscribe(self, sid, data: TransportMessage) -> Optional[str]:
         """Called when a client subscribes to a topic.
         If the topic does not exist, it will be created. If the client is already subscribed to the topic, nothing
         changes. Otherwise the client will be subscribed to the topic and will receive updates.
+        If the message contains an offset or a limit, the kept messages of the topic from that offset on, at most the
+        last limit of them, are sent in one PRINT_MESSAGE_BATCH before the response. The response carries the offset
+        the next message of the topic gets, so the client can resume from it after a reconnect.
+        If the topic is a wildcard pattern like sensors/+/temp, the client receives the updates of all matching topics.
 
         :param sid: Generated session id
-        :param data: Data sent by the client
+        :param data: Message sent by the client
         """
-        data = TransportMessage.parse_raw(data)
-        topic = self._get_topic_by_name(data.topic)
-        if topic is not None:
-            # Check if sid already subscribed to topic
-            if sid in topic.subscribers:
-                response = TransportMessage(timestamp=int(time.time()), payload=f"Already subscribed to {data.topic}.")
-            else:
-                # Subscribe to topic
-                topic.subscribers.append(sid)
-                response = TransportMessage(
-                    timestamp=int(time.time()), payload=f"Successfully subscribed to {data.topic}."
-                )
+        if is_pattern(data.topic):
+            return await self._subscribe_pattern(sid, data)
+        result, history = await self._subscribe(sid, data)
+        log = self._get_topic_by_name(data.topic).log
+        next_offset = 0 if log is None else log.next_offset
+        if history:
+            batch = TransportMessageBatch(timestamp=int(time.time()), messages=history)
+            await self._emit("PRINT_MESSAGE_BATCH", batch, sid)
+        if result == "created":
+            response_msg = f"Created {data.topic} and successfully subscribed."
+        elif result == "subscribed":
+            response_msg = f"Successfully subscribed to {data.topic}."
         else:
-            # Create new topic if not already existing and subscribe
-            new_topic = Topic()
-            new_topic.name = data.topic
-            new_topic.subscribers.append(sid)
-            self._add_topic(new_topic)
-            response = TransportMessage(
-                timestamp=int(time.time()), payload=f"Created {data.topic} and successfully subscribed."
-            )
+            response_msg = f"Already subscribed to {data.topic}."
+        response = TransportMessage(timestamp=int(time.time()), payload=response_msg, offset=next_offset)
 
-        await self.sio.emit("PRINT_MESSAGE", response.json(), room=sid)
         logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE", response, data)
 
+    @_measure_decorator
+    @_check_data_none_decorator
+    @_check_batch_decorator
+    async def handle_subscribe_batch(self, sid, data: TransportMessageBatch) -> Optional[str]:
+        """Called when a client subscribes to several topics at once.
+        Every message of the batch is handled like a SUBSCRIBE_TOPIC with its own offset and limit. The kept messages
+        of all topics are sent in a single PRINT_MESSAGE_BATCH before the response, and the client receives one
+        response for the whole batch.
+
+        :param sid: Generated session id
+        :param data: Batch sent by the client
+        """
+        results = {"created": 0, "subscribed": 0, "already subscribed": 0}
+        invalid = 0
+        history = []
+        created = []
+        for message in data.messages:
+            if message.topic is None:
+                invalid += 1
+            elif is_pattern(message.topic):
+                try:
+                    validate_pattern(message.topic)
+                except ValueError:
+                    invalid += 1
+                    continue
+                results["subscribed" if await self._add_pattern(sid, message.topic) else "already subscribed"] += 1
+            else:
+                result, messages = await self._subscribe(sid, message, share=False)
+                results[result] += 1
+                history += messages
+                if result == "created":
+                    created.append(message.topic)
+        if created:
+            # The other worker processes learn about all new topics of the batch at once
+            await self._share({"action": "topics_added", "topics": created})
+        if history:
+            batch = TransportMessageBatch(timestamp=int(time.time()), messages=history)
+            await self._emit("PRINT_MESSAGE_BATCH", batch, sid)
+
+        response_msg = f"Successfully subscribed to {results['created'] + results['subscribed']} topics."
+        if results["created"]:
+            response_msg += f" Created {results['created']} of them."
+        if results["already subscribed"]:
+            response_msg += f" Already subscribed to {results['already subscribed']} topics."
+        if invalid:
+            response_msg += f" {invalid} messages without valid topic were skipped."
+        response = TransportMessage(timestamp=int(time.time()), payload=response_msg)
+        logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE", response, data)
+
+    @_measure_decorator
     @_check_data_none_decorator
     @_check_topic_decorator
-    async def handle_unsubscribe(self, sid, data=None) -> None:
+    async def handle_unsubscribe(self, sid, data: TransportMessage) -> Optional[str]:
         """Called when a client unsubscribes from a topic.
         If the client is not subscribed to the topic or topic does not exist, the client will receive an error message.
         Otherwise the client will be unsubscribed from the topic and will not receive any updates.
         If the topic has no subscribers left it will be deleted.
 
         :param sid: Generated session id
-        :param data: Data sent by the client
+        :param data: Message sent by the client
         """
-
-        data = TransportMessage.parse_raw(data)
+        if is_pattern(data.topic):
+            return await self._unsubscribe_pattern(sid, data)
         topic = self._get_topic_by_name(data.topic)
 
         if topic is not None:
             # Check if sid subscribed to topic and unsubscribe
-            if sid in topic.subscribers:
-                topic.subscribers.remove(sid)
+            if self._topics.unsubscribe(topic, sid):
+                await self.sio.leave_room(sid, self._topic_room(topic.name, sid in self._binary_sids))
                 response = TransportMessage(
                     timestamp=int(time.time()), payload=f"Successfully unsubscribed from {data.topic}."
                 )
                 # Delete topic if no subscribers left
                 if len(topic.subscribers) == 0:
-                    self._remove_topic(topic)
+                    await self._remove_topic(topic)
             else:
                 # Not subscribed
                 response = TransportMessage(timestamp=int(time.time()), payload=f"Not subscribed to {data.topic}.")
@@ -219,114 +878,504 @@ class Server:
             # Topic not existing
             response = TransportMessage(timestamp=int(time.time()), payload=f"{data.topic} does not exist.")
 
-        await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
         logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
 
+    @_measure_decorator
     @_check_data_none_decorator
     @_check_topic_decorator
-    async def handle_publish(self, sid, data=None) -> None:
+    async def handle_publish(self, sid, data: TransportMessage) -> Optional[str]:
         """Called when a client publishes a message to a topic.
         The message will be published to the topic and all subscribers will receive the message.
 
         :param sid: Generated session id
-        :param data: Data sent by the client
+        :param data: Message sent by the client
         """
-        data = TransportMessage.parse_raw(data)
         topic = self._get_topic_by_name(data.topic)
 
         # Check if data contains payload
         if data.payload is None:
             response = TransportMessage(timestamp=int(time.time()), payload="Missing parameter message.")
-            await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
-            return None
+            return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
 
-        if topic is not None:
-            # Publish message to topic
-            topic.content = data.payload
-            topic.timestamp = data.timestamp
+        # Wildcard patterns can only be subscribed, a message always belongs to one topic
+        if is_pattern(data.topic):
+            response = TransportMessage(
+                timestamp=int(time.time()),
+                payload=f"Invalid topic {data.topic}: wildcards are only allowed when subscribing.",
+            )
+            logging.error("%s - %s", self._sid_ip_mapping[sid], response.payload)
+            return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
+
+        if topic is not None or self._has_receivers(data.topic):
+            # Publish message to topic and to the topic of the other worker processes
+            if topic is not None and self.store is not None:
+                # Log the message before it is applied. The topic may be removed while waiting for the disk
+                await self.store.publish([(data.topic, data.payload, data.timestamp)])
+            await self._publish(data.topic, data.payload, data.timestamp)
+            await self._share(
+                {"action": "publish", "topic": data.topic, "payload": data.payload, "timestamp": data.timestamp}
+            )
             response = TransportMessage(
                 timestamp=int(time.time()), payload=f"Successfully published message to {data.topic}."
             )
-            await self.update_topic(topic)
         else:
             # Topic not existing
             response = TransportMessage(timestamp=int(time.time()), payload=f"{data.topic} does not exist.")
 
-        await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
         logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
 
-    async def handle_list_topics(self, sid, data=None) -> None:
-        """Called when a client requests a list of all topics.
-        The client will receive a list of all topics.
+    @_measure_decorator
+    @_check_data_none_decorator
+    @_check_batch_decorator
+    async def handle_publish_batch(self, sid, data: TransportMessageBatch) -> Optional[str]:
+        """Called when a client publishes several messages at once.
+        All messages are applied in one pass and every subscriber receives the messages of all its topics in a single
+        PRINT_MESSAGE_BATCH. The client receives one acknowledgement for the whole batch.
 
         :param sid: Generated session id
-        :param data: Data sent by the client. Unused
+        :param data: Batch sent by the client
         """
-        response_msg = "All topics on the server:"
-        for topic in self._list_of_topics:
-            response_msg += f"\n{topic.name}"
-
+        entries = []
+        invalid = 0
+        missing = []
+        for message in data.messages:
+            if message.topic is None or message.payload is None or is_pattern(message.topic):
+                invalid += 1
+            elif message.topic in self._topics or self._has_receivers(message.topic):
+                entries.append((message.topic, message.payload, message.timestamp))
+            else:
+                missing.append(message.topic)
+
+        if entries:
+            if self.store is not None:
+                # Messages that only reach wildcard subscribers do not belong to a topic that could be restored
+                await self.store.publish([entry for entry in entries if entry[0] in self._topics])
+            self._publish_entries(entries)
+            await self._share({"action": "publish_batch", "entries": entries})
+
+        response_msg = f"Successfully published {len(entries)} messages to {len({e[0] for e in entries})} topics."
+        if invalid:
+            response_msg += f" {invalid} messages without valid topic or message were skipped."
+        if missing:
+            response_msg += f" Topics that do not exist: {', '.join(dict.fromkeys(missing))}."
         response = TransportMessage(timestamp=int(time.time()), payload=response_msg)
-        await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
         logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
+
+    @_measure_decorator
+    async def handle_list_topics(self, sid, data=None) -> Optional[str]:
+        """Called when a client requests a list of the topics.
+        The topics are listed in alphabetical order. The topic of the request filters them by a prefix or, if it
+        contains *, ? or [, by a glob pattern. The payload is a cursor, only topics after this name are listed, and the
+        limit is the maximum number of listed topics.
+        A request with request id is answered with one page of at most limit topics, by default and at most
+        LIST_PAGE_SIZE, and the next page starts after its last topic. Otherwise the topics are streamed in chunks of LIST_PAGE_SIZE, all
+        but the last sent as PRINT_MESSAGE, so neither the server nor the client has to hold the whole list.
 
+        :param sid: Generated session id
+        :param data: Data sent by the client
+        """
+        request = None
+        if data is not None:
+            try:
+                request = decode_message(data)
+            except Exception:
+                # The list does not depend on the request, so it is sent anyway
+                pass
+        pattern = request.topic if request is not None else None
+        after = request.payload if request is not None else None
+        limit = request.limit if request is not None and request.limit is not None else None
+
+        header = "All topics on the server:"
+        if request is not None and request.request_id is not None:
+            # A page is never larger than LIST_PAGE_SIZE, no matter which limit the client asks for
+            size = LIST_PAGE_SIZE if limit is None else max(1, min(limit, LIST_PAGE_SIZE))
+            names = self._topic_index.page(pattern, after, size)
+            response = TransportMessage(timestamp=int(time.time()), payload="\n".join([header, *names]))
+            logging.info("%s - Listed %s topics.", self._sid_ip_mapping[sid], len(names))
+            return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, request)
+
+        # Look one chunk ahead to know which chunk is the last one
+        listed = 0
+        chunk = [header]
+        while True:
+            size = LIST_PAGE_SIZE if limit is None else min(LIST_PAGE_SIZE, limit - listed)
+            names = self._topic_index.page(pattern, after, size) if size > 0 else []
+            if not names:
+                break
+            if len(chunk) > 1:
+                message = TransportMessage(timestamp=int(time.time()), payload="\n".join(chunk))
+                await self._emit("PRINT_MESSAGE", message, sid)
+                # Read the next chunk only once the connection took this one
+                await self._written(self.sio.manager.eio_sid_from_sid(sid, "/"))
+                chunk = []
+            chunk += names
+            listed += len(names)
+            after = names[-1]
+            if len(names) < size:
+                break
+
+        response = TransportMessage(timestamp=int(time.time()), payload="\n".join(chunk))
+        logging.info("%s - Listed %s topics.", self._sid_ip_mapping[sid], listed)
+        return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, request)
+
+    @_measure_decorator
     @_check_data_none_decorator
     @_check_topic_decorator
-    async def handle_topic_status(self, sid, data=None) -> None:
+    async def handle_topic_status(self, sid, data: TransportMessage) -> Optional[str]:
         """Called when a client requests the status of a topic.
-        The client will receive the status of the topic.
+        The client will receive the status of the topic as JSON object: its name, the time and content of the last
+        publish, the number of subscribers and the addresses of a sample of them. The limit of the request is the
+        size of the sample, by default STATUS_SAMPLE_SIZE and at most MAX_STATUS_SAMPLE_SIZE. With several worker
+        processes the status only contains the subscribers of this worker.
 
         :param sid: Generated session id
-        :param data: Data sent by the client
+        :param data: Message sent by the client
         """
-
-        data = TransportMessage.parse_raw(data)
         topic = self._get_topic_by_name(data.topic)
 
         if topic is not None:
-            subscribers = ""
-            for subscriber in topic.subscribers:
-                subscribers += f"\t{self._sid_ip_mapping[subscriber]}\n\t"
-
-            if topic.content is None or topic.timestamp is None:
-                topic_status = (
-                    f"\ntopic name:\t{topic.name}\n\nsubscribers:{subscribers}\nThere was no publish on this topic yet."
-                )
-            else:
-                topic_status = f"\ntopic name:\t{topic.name}\n\ntimestamp:\t{datetime.fromtimestamp(int(topic.timestamp)).strftime('%d-%m-%Y %H:%M:%S')}\n\ncontent:\t{topic.content}\n\nsubscribers:{subscribers}"
-
-            response = TransportMessage(timestamp=int(time.time()), payload=topic_status)
+            sample_size = STATUS_SAMPLE_SIZE if data.limit is None else max(0, min(data.limit, MAX_STATUS_SAMPLE_SIZE))
+            response = TransportMessage(timestamp=int(time.time()), payload=self._topic_status(topic, sample_size))
+        elif data.topic in self._remote_topics:
+            # Topic only has subscribers on other worker processes
+            response = TransportMessage(
+                timestamp=int(time.time()), payload=f"{data.topic} is managed by another worker process."
+            )
         else:
             # Topic not existing
             response = TransportMessage(timestamp=int(time.time()), payload=f"{data.topic} does not exist.")
 
-        await self.sio.emit("PRINT_MESSAGE_AND_EXIT", response.json(), room=sid)
         logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
 
     async def update_topic(self, topic: Topic) -> None:
         """Called when a topic is updated.
-        The subscribers of the topic will receive the updated topic.
+        The subscribers of the topic and of the matching wildcard patterns will receive the updated topic.
 
         :param topic: The topic
         """
         topic.last_update = int(time.time())
-        response = TransportMessage(
+        self.heart_beat.schedule(topic)
+        start = time.perf_counter()
+        receivers = await self._broadcast("PRINT_MESSAGE", self._update_message(topic), topic.name)
+        self._fanout_durations.observe(time.perf_counter() - start)
+        self._fanout_sizes.observe(receivers)
+
+    def _publish_entries(self, entries: List[Tuple[str, str, int]]) -> None:
+        """Publish several messages to the topics of this process in one pass.
+        The updates are coalesced per subscriber, so every subscriber receives one PRINT_MESSAGE_BATCH with the
+        messages of all of its topics in the order they were published. Like the update of a single publish, the
+        batches are queued without waiting until the subscribers received them.
+
+        :param entries: List of topic name, message and timestamp
+        """
+        updates: Dict[str, List[TransportMessage]] = {}
+        now = int(time.time())
+        for name, payload, timestamp in entries:
+            topic = self._get_topic_by_name(name)
+            pattern_subscribers = self._patterns.match(name)
+            if topic is not None:
+                self._append(topic, payload, timestamp)
+                if self._conflate(topic):
+                    continue
+                topic.last_update = now
+                self.heart_beat.schedule(topic)
+                message = self._update_message(topic)
+                receivers = topic.subscribers.union(pattern_subscribers) if pattern_subscribers else topic.subscribers
+            elif pattern_subscribers:
+                message = self._format_update(name, None, timestamp, payload)
+                receivers = pattern_subscribers
+            else:
+                continue
+            for sid in receivers:
+                updates.setdefault(sid, []).append(message)
+
+        for sid, messages in updates.items():
+            eio_sid = self.sio.manager.eio_sid_from_sid(sid, "/")
+            if eio_sid is None:
+                # Client disconnected in the meantime
+                continue
+            batch = TransportMessageBatch(timestamp=now, messages=messages)
+            self._enqueue(sid, eio_sid, self._packets("PRINT_MESSAGE_BATCH", self._encode(batch, sid)), update=True)
+
+    async def _publish(self, name: str, payload: str, timestamp: int) -> None:
+        """Publish a message to a topic of this process and to the matching wildcard patterns.
+        Without topic of that name, only the subscribers of the patterns receive the message, which is not kept.
+
+        :param name: Name of the topic
+        :param payload: Message
+        :param timestamp: Timestamp of the message
+        """
+        topic = self._get_topic_by_name(name)
+        if topic is not None:
+            self._append(topic, payload, timestamp)
+            if not self._conflate(topic):
+                await self.update_topic(topic)
+            return
+        if self._patterns.match(name):
+            await self._broadcast("PRINT_MESSAGE", self._format_update(name, None, timestamp, payload), name)
+
+    def conflation_stats(self) -> Dict[str, int]:
+        """Get the state of the conflation of high-frequency topics.
+
+        :return: number of topics with an open conflation window, and the number of publishes coalesced into a later
+            update and of updates sent when a window closed since the start
+        """
+        return {"pending": len(self._pending_updates), **self._conflation_counters}
+
+    def _conflate(self, topic: Topic) -> bool:
+        """Hold back the update of a topic with a conflation window.
+        The first publish opens the window. Publishes within the window are coalesced, because the update sent when
+        the window closes carries the latest content of the topic.
+
+        :param topic: The topic, which was just published to
+        :return: True if the update is sent when the window closes, False if it has to be sent right away
+        """
+        if not self.conflation_windows:
+            return False
+        if topic.name in self._pending_updates:
+            self._conflation_counters["coalesced"] += 1
+            return True
+        window = self._conflation_window(topic.name)
+        if window is None:
+            return False
+        self._pending_updates[topic.name] = asyncio.get_running_loop().call_later(
+            window / 1000, self._close_conflation_window, topic
+        )
+        return True
+
+    def _conflation_window(self, name: str) -> Optional[int]:
+        """Get the conflation window of a topic.
+
+        :param name: Name of the topic
+        :return: Window in milliseconds or None if the topic is not conflated
+        """
+        for pattern, window in self.conflation_windows.items():
+            if fnmatchcase(name, pattern):
+                return window
+        return None
+
+    def _close_conflation_window(self, topic: Topic) -> None:
+        """Send the latest content of a topic to its subscribers when its conflation window closes."""
+        del self._pending_updates[topic.name]
+        if self._get_topic_by_name(topic.name) is not topic:
+            # Topic was removed in the meantime
+            return
+        self._conflation_counters["flushed"] += 1
+        # The event loop only keeps a weak reference to a task
+        task = asyncio.create_task(self.update_topic(topic))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _subscribe(
+        self, sid: str, data: TransportMessage, share: bool = True
+    ) -> Tuple[str, List[TransportMessage]]:
+        """Subscribe a client to a topic, which is created if it does not exist.
+
+        :param sid: Generated session id
+        :param data: Message sent by the client, with the name of the topic
+        :param share: Whether a created topic is announced to the other worker processes right away
+        :return: "created", "subscribed" or "already subscribed" and the kept messages requested by the offset and
+            the limit of the message
+        """
+        topic = self._get_topic_by_name(data.topic)
+        if topic is None:
+            new_topic = Topic(data.topic)
+            new_topic.subscribers.add(sid)
+            await self._add_topic(new_topic, share)
+            await self.sio.enter_room(sid, self._topic_room(new_topic.name, sid in self._binary_sids))
+            return "created", []
+
+        # Subscribe to topic if sid is not already subscribed
+        if self._topics.subscribe(topic, sid):
+            await self.sio.enter_room(sid, self._topic_room(topic.name, sid in self._binary_sids))
+            result = "subscribed"
+        else:
+            result = "already subscribed"
+        history = []
+        if (data.offset is not None or data.limit is not None) and topic.log is not None:
+            # Read the history only after entering the room, so no update in between is missed
+            history = [
+                self._format_update(topic.name, offset, timestamp, content)
+                for offset, timestamp, content in topic.log.read(data.offset, data.limit)
+            ]
+        return result, history
+
+    async def _subscribe_pattern(self, sid: str, data: TransportMessage) -> Optional[str]:
+        """Subscribe a client to a wildcard pattern. The kept messages of the matching topics are not sent.
+
+        :param sid: Generated session id
+        :param data: Message sent by the client
+        """
+        try:
+            validate_pattern(data.topic)
+        except ValueError as error:
+            response = TransportMessage(timestamp=int(time.time()), payload=f"Invalid pattern {data.topic}: {error}.")
+            logging.error("%s - %s", self._sid_ip_mapping[sid], response.payload)
+            return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
+
+        if await self._add_pattern(sid, data.topic):
+            response = TransportMessage(timestamp=int(time.time()), payload=f"Successfully subscribed to {data.topic}.")
+        else:
+            response = TransportMessage(timestamp=int(time.time()), payload=f"Already subscribed to {data.topic}.")
+
+        logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE", response, data)
+
+    async def _add_pattern(self, sid: str, pattern: str) -> bool:
+        """Subscribe a client to a valid wildcard pattern and tell the other worker processes about new patterns.
+
+        :param sid: Generated session id
+        :param pattern: The pattern
+        :return: True if the client was not subscribed to the pattern before
+        """
+        is_new = pattern not in self._patterns
+        if not self._patterns.add(pattern, sid):
+            return False
+        if is_new:
+            await self._share({"action": "patterns_added", "patterns": [pattern]})
+        return True
+
+    async def _unsubscribe_pattern(self, sid: str, data: TransportMessage) -> Optional[str]:
+        """Unsubscribe a client from a wildcard pattern.
+
+        :param sid: Generated session id
+        :param data: Message sent by the client
+        """
+        if self._patterns.remove(data.topic, sid):
+            response = TransportMessage(
+                timestamp=int(time.time()), payload=f"Successfully unsubscribed from {data.topic}."
+            )
+            if data.topic not in self._patterns:
+                await self._share({"action": "pattern_removed", "pattern": data.topic})
+        else:
+            response = TransportMessage(timestamp=int(time.time()), payload=f"Not subscribed to {data.topic}.")
+
+        logging.info("%s - %s", self._sid_ip_mapping[sid], response.payload)
+        return await self._reply(sid, "PRINT_MESSAGE_AND_EXIT", response, data)
+
+    def _topic_status(self, topic: Topic, sample_size: int) -> str:
+        """Get the status of a topic.
+        The status with the default sample is encoded once and kept until the topic is published to or its
+        subscribers change, so requesting the status of a topic with many subscribers does not cost more than that of
+        any other topic.
+
+        :param topic: The topic
+        :param sample_size: Number of subscribers listed
+        :return: JSON object with the name, timestamp and content of the topic, the number of subscribers and the
+            addresses of the sample
+        """
+        if sample_size == STATUS_SAMPLE_SIZE and topic.status is not None:
+            return topic.status
+
+        status = json.dumps(
+            {
+                "topic": topic.name,
+                "timestamp": topic.timestamp,
+                "content": topic.content,
+                "subscribers": len(topic.subscribers),
+                "sample": [
+                    self._sid_ip_mapping.get(subscriber)
+                    for subscriber in itertools.islice(topic.subscribers, sample_size)
+                ],
+            }
+        )
+        if sample_size == STATUS_SAMPLE_SIZE:
+            topic.status = status
+        return status
+
+    def _has_receivers(self, name: str) -> bool:
+        """Check if a message to a topic without local topic object reaches any subscriber.
+
+        :param name: Name of the topic
+        :return: True if another worker process has the topic or a pattern of any process matches it
+        """
+        return (
+            name in self._remote_topics or bool(self._patterns.match(name)) or bool(self._remote_patterns.match(name))
+        )
+
+    def restore_topics(self) -> None:
+        """Create the topics of the store with their last content and start logging to the store.
+        The restored topics have no subscribers until the clients subscribe again.
+        """
+        # Millions of new objects would trigger many full collections, although none of them is garbage
+        gc.disable()
+        try:
+            for name, (content, timestamp, next_offset) in self.store.restore().items():
+                topic = Topic(name)
+                topic.log = TopicLog(self.retention_messages, self.retention_bytes)
+                # The last content keeps the offset it had before the restart
+                topic.log.next_offset = next_offset - 1
+                self._append(topic, content, timestamp)
+                self._topics.add(topic)
+                self._topic_index.add(name)
+        finally:
+            gc.enable()
+        logging.info("Restored %s topics.", len(self._topics))
+        self.store.start(self._topic_states)
+
+    def _topic_states(self) -> List[TopicState]:
+        """Get the state of all topics with content for a snapshot of the store."""
+        return [
+            (topic.name, topic.content, topic.timestamp, topic.log.next_offset)
+            for topic in self._topics
+            if topic.content is not None
+        ]
+
+    def _append(self, topic: Topic, payload: str, timestamp: int) -> None:
+        """Set the content of a topic and append it to the log of the topic.
+
+        :param topic: The topic
+        :param payload: New content of the topic
+        :param timestamp: Timestamp of the content
+        """
+        topic.content = payload
+        topic.timestamp = timestamp
+        topic.status = None
+        if topic.log is None:
+            topic.log = TopicLog(self.retention_messages, self.retention_bytes)
+        topic.log.append(payload, timestamp)
+
+    @classmethod
+    def _update_message(cls, topic: Topic) -> TransportMessage:
+        """Create the message the subscribers receive when a topic is updated.
+
+        :param topic: The topic
+        :return: Message with the name, timestamp and content of the topic
+        """
+        return cls._format_update(topic.name, topic.log.next_offset - 1, topic.timestamp, topic.content)
+
+    @staticmethod
+    def _format_update(name: str, offset: Optional[int], timestamp: int, content: str) -> TransportMessage:
+        """Create the message a subscriber receives for a message of a topic.
+
+        :param name: Name of the topic
+        :param offset: Offset of the message in the log of the topic. None if the message is not kept
+        :param timestamp: Timestamp of the message
+        :param content: Content of the message
+        :return: Message with the name, timestamp and content
+        """
+        return TransportMessage(
             timestamp=int(time.time()),
-            payload=f"{topic.name} ({datetime.fromtimestamp(int(topic.timestamp)).strftime('%d-%m-%Y %H:%M:%S')}): {topic.content}",
+            topic=name,
+            offset=offset,
+            payload=f"{name} ({datetime.fromtimestamp(int(timestamp)).strftime('%d-%m-%Y %H:%M:%S')}): {content}",
         )
-        for sub in topic.subscribers:
-            await self.sio.emit("PRINT_MESSAGE", response.json(), room=sub)
 
-    async def heart_beat(self, time_delta):
-        """Go through all topics and check if they were updated in the last time_delta seconds.
-        If not, update the topic.
+    @staticmethod
+    def _topic_room(name: str, binary: bool = False) -> str:
+        """Get the name of the Socket.IO room the subscribers of a topic are in.
+        The prefix keeps topic rooms apart from the rooms Socket.IO creates for every session id. Subscribers using
+        the binary encoding are in a room of their own, so every room receives the message in a single encoding.
 
-        :param time_delta: Time in seconds
+        :param name: Name of the topic
+        :param binary: True for the room of the subscribers using the binary encoding
+        :return: Name of the room
         """
-        for topic in self._list_of_topics:
-            if topic.last_update is not None and int(time.time()) - topic.last_update > time_delta:
-                await self.update_topic(topic)
-                logging.info("Topic %s was updated through heart beat.", topic.name)
+        return f"topic-binary:{name}" if binary else f"topic:{name}"
 
     def _get_topic_by_name(self, name: str) -> Optional[Topic]:
         """Get a topic by its name.
@@ -334,45 +1383,518 @@ class Server:
         :param name: Name of the topic
         :return: Topic object
         """
-        for topic in self._list_of_topics:
-            if topic.name == name:
-                return topic
-        return None
+        return self._topics.get(name)
 
-    def _add_topic(self, topic: Topic) -> None:
-        """Add a topic to the list of topics.
+    async def _add_topic(self, topic: Topic, share: bool = True) -> None:
+        """Add a topic to the topic registry and announce it to the other worker processes.
 
         :param topic: Topic object
+        :param share: Whether the topic is announced right away. Otherwise the caller announces it together with others
         """
-        with self._lock:
-            self._list_of_topics.append(topic)
+        self._topics.add(topic)
+        self._topic_index.add(topic.name)
+        if share:
+            await self._share({"action": "topics_added", "topics": [topic.name]})
 
-    def _remove_topic(self, topic: Topic) -> None:
-        """Remove a topic from the list of topics.
+    async def _remove_topic(self, topic: Topic) -> None:
+        """Remove a topic from the topic registry and announce it to the other worker processes.
 
         :param topic: Topic object
         """
-        with self._lock:
-            logging.warning("Topic %s was removed.", topic.name)
-            self._list_of_topics.remove(topic)
+        logging.warning("Topic %s was removed.", topic.name)
+        self._topics.remove(topic)
+        if topic.name not in self._remote_topics:
+            self._topic_index.discard(topic.name)
+        pending = self._pending_updates.pop(topic.name, None)
+        if pending is not None:
+            pending.cancel()
+        if self.store is not None:
+            self.store.remove(topic.name)
+        await self._share({"action": "topic_removed", "topic": topic.name})
+
+    async def _reply(
+        self,
+        sid: str,
+        event: str,
+        response: TransportMessage,
+        request: Optional[Union[TransportMessage, TransportMessageBatch]] = None,
+    ) -> Optional[str]:
+        """Answer a request of a client.
+        Requests with a request id are answered through the Socket.IO acknowledgement the client awaits and the
+        response carries the same request id. All other requests are answered with an event.
+
+        :param sid: Session id of the client
+        :param event: Name of the event used for requests without request id
+        :param response: Response to the request
+        :param request: Request of the client, if it could be parsed
+        :return: JSON encoded response to acknowledge the request with or None if the response was sent as event
+        """
+        if request is not None and request.request_id is not None:
+            response.request_id = request.request_id
+            return self._encode(response, sid)
+        await self._emit(event, response, sid)
+        return None
 
+    async def _emit(self, event: str, message: Union[TransportMessage, TransportMessageBatch], sid: str) -> None:
+        """Send a message to a client in the encoding of the client.
+        The message is queued behind the other messages for the client and the call returns once it was sent, so a
+        response sent afterwards through an acknowledgement does not overtake it.
+        Every worker process serves its own clients, so events are never relayed through the backplane.
 
-def get_app():
+        :param event: Name of the event
+        :param message: Message to send
+        :param sid: Session id of the client
+        """
+        eio_sid = self.sio.manager.eio_sid_from_sid(sid, "/")
+        if eio_sid is None:
+            # Client disconnected in the meantime
+            return
+        packets = self._packets(event, self._encode(message, sid))
+        queue = self._send_queues.get(sid)
+        if queue is None or (queue.idle and not len(queue)):
+            # Nothing is waiting or being sent to the client, so the message cannot overtake another one. Sending it
+            # right away also delivers the response to a client that disconnects right after its request
+            for packet in packets:
+                await self.sio.eio.send_packet(eio_sid, packet)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._enqueue(sid, eio_sid, packets, None, waiter)
+        await waiter
+
+    async def _broadcast(self, event: str, message: TransportMessage, name: str) -> int:
+        """Send a message to the subscribers of a topic and of the matching wildcard patterns.
+        The message is encoded once per encoding in use and queued for every subscriber, a client that is in several
+        of the rooms receives it only once. The call does not wait until the subscribers received it.
+
+        :param event: Name of the event
+        :param message: Message to send
+        :param name: Name of the topic
+        :return: number of subscribers the message was queued for
+        """
+        receivers = 0
+        json_rooms = [self._topic_room(name)]
+        binary_rooms = [self._topic_room(name, binary=True)]
+        for sid in self._patterns.match(name):
+            (binary_rooms if sid in self._binary_sids else json_rooms).append(sid)
+        targets = [(json_rooms, message.json)]
+        if self._binary_sids:
+            targets.append((binary_rooms, functools.partial(encode_binary, message)))
+        for rooms, encode_message in targets:
+            packets = None
+            for sid, eio_sid in self.sio.manager.get_participants("/", rooms):
+                if packets is None:
+                    packets = self._packets(event, encode_message())
+                self._enqueue(sid, eio_sid, packets, name, update=True)
+                receivers += 1
+        return receivers
+
+    def send_queue_stats(self) -> Dict[str, int]:
+        """Get the state of the send queues of the clients.
+
+        :return: number of queues, messages queued in total and in the longest queue, and the number of messages
+            dropped and conflated and of clients disconnected because their queue overflowed since the start
+        """
+        depths = [len(queue) for queue in self._send_queues.values()]
+        return {
+            "queues": len(depths),
+            "queued": sum(depths),
+            "max_depth": max(depths, default=0),
+            **self._send_counters,
+        }
+
+    def _packets(self, event: str, data: Union[str, bytes]) -> List[eio_packet.Packet]:
+        """Encode an event into the Engine.IO packets carrying it, so it is encoded once for any number of clients.
+
+        :param event: Name of the event
+        :param data: Encoded message
+        :return: Engine.IO packets, more than one for binary data
+        """
+        encoded = self.sio.packet_class(socketio.packet.EVENT, namespace="/", data=[event, data]).encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        return [eio_packet.Packet(eio_packet.MESSAGE, part) for part in encoded]
+
+    def _enqueue(
+        self,
+        sid: str,
+        eio_sid: str,
+        packets: List[eio_packet.Packet],
+        key: Optional[str] = None,
+        waiter: Optional[asyncio.Future] = None,
+        update: bool = False,
+    ) -> None:
+        """Queue packets for a client. The queue and the task sending its packets are created with the first message.
+
+        :param sid: Session id of the client
+        :param eio_sid: Engine.IO session id of the client
+        :param packets: Engine.IO packets of the message
+        :param key: Topic of an update, so it can be conflated with a newer update of the topic
+        :param waiter: Future resolved once the message was sent or dropped
+        :param update: Whether the message is an update, which the overflow policy applies to
+        """
+        queue = self._send_queues.get(sid)
+        if queue is None:
+            queue = self._send_queues[sid] = SendQueue(self.send_queue_size, self.overflow_policy)
+            self._drain_tasks[sid] = asyncio.create_task(self._drain(eio_sid, queue))
+        result = queue.put(packets, key, waiter, update)
+        if result == OVERFLOW:
+            logging.warning(
+                "%s - SID: %s does not keep up with its messages and is disconnected.",
+                self._sid_ip_mapping.get(sid),
+                sid,
+            )
+            self._send_counters["disconnected"] += 1
+            queue.close()
+            # The event loop only keeps a weak reference to a task
+            task = asyncio.create_task(self.sio.disconnect(sid))
+            self._disconnect_tasks.add(task)
+            task.add_done_callback(self._disconnect_tasks.discard)
+        elif result in self._send_counters:
+            self._send_counters[result] += 1
+
+    async def _drain(self, eio_sid: str, queue: SendQueue) -> None:
+        """Send the queued messages of a client one after the other.
+
+        :param eio_sid: Engine.IO session id of the client
+        :param queue: Send queue of the client
+        """
+        while True:
+            packets, waiter = await queue.get()
+            for packet in packets:
+                await self.sio.eio.send_packet(eio_sid, packet)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+            # Engine.IO queues without limit. Waiting until the writer of the connection took the packets keeps the
+            # backlog of a slow connection in the bounded send queue, where the overflow policy applies
+            await self._written(eio_sid)
+
+    async def _written(self, eio_sid: Optional[str]) -> None:
+        """Wait until the writer of the connection of a client took all packets sent to it.
+
+        :param eio_sid: Engine.IO session id of the client
+        """
+        socket = self.sio.eio.sockets.get(eio_sid) if eio_sid is not None else None
+        if socket is not None:
+            await socket.queue.join()
+
+    def _close_send_queue(self, sid: str) -> None:
+        """Stop sending to a client and drop its queued messages.
+
+        :param sid: Session id of the client
+        """
+        queue = self._send_queues.pop(sid, None)
+        if queue is not None:
+            queue.close()
+            self._drain_tasks.pop(sid).cancel()
+
+    def _encode(self, message: Union[TransportMessage, TransportMessageBatch], sid: str) -> Union[str, bytes]:
+        """Encode a message in the encoding of a client.
+
+        :param message: Message to send
+        :param sid: Session id of the client
+        :return: JSON string or bytes
+        """
+        return encode(message, "binary" if sid in self._binary_sids else "json")
+
+    async def _share(self, message: dict) -> None:
+        """Send a change of the topic state to the other worker processes. Does nothing in a single process.
+
+        :param message: Message with the action and its parameters
+        """
+        if self._backplane is not None:
+            await self._backplane.send(message)
+
+    async def _handle_backplane_message(self, message: dict) -> None:
+        """Called with the messages of the other worker processes.
+        The topics other workers have are tracked, so publishes reach the subscribers of all workers.
+
+        :param message: Message received through the backplane
+        """
+        host_id = message["host_id"]
+        if message["method"] == "hello":
+            # A worker (re)started and needs to know the topics of this worker
+            await self._share({"action": "topics_added", "topics": [topic.name for topic in self._topics]})
+            await self._share({"action": "patterns_added", "patterns": list(self._patterns)})
+        elif message["method"] == "host_gone":
+            for name in list(self._remote_topics):
+                self._forget_remote_topic(name, host_id)
+            self._remote_patterns.remove_all(host_id)
+        elif message["action"] == "topics_added":
+            for name in message["topics"]:
+                self._remote_topics.setdefault(name, set()).add(host_id)
+                self._topic_index.add(name)
+        elif message["action"] == "topic_removed":
+            self._forget_remote_topic(message["topic"], host_id)
+        elif message["action"] == "patterns_added":
+            for pattern in message["patterns"]:
+                self._remote_patterns.add(pattern, host_id)
+        elif message["action"] == "pattern_removed":
+            self._remote_patterns.remove(message["pattern"], host_id)
+        elif message["action"] == "publish":
+            await self._publish(message["topic"], message["payload"], message["timestamp"])
+        elif message["action"] == "publish_batch":
+            self._publish_entries([tuple(entry) for entry in message["entries"]])
+
+    def _forget_remote_topic(self, name: str, host_id: str) -> None:
+        hosts = self._remote_topics.get(name)
+        if hosts is not None:
+            hosts.discard(host_id)
+            if not hosts:
+                del self._remote_topics[name]
+                if name not in self._topics:
+                    self._topic_index.discard(name)
+
+
+def get_app(
+    heart_beat_interval: int = 20,
+    client_manager: Optional[socketio.AsyncManager] = None,
+    retention_messages: int = 100,
+    retention_bytes: int = 1024 * 1024,
+    store: Optional[TopicStore] = None,
+    send_queue_size: int = 1000,
+    overflow_policy: str = "drop-oldest",
+    conflation_windows: Optional[Dict[str, int]] = None,
+    profile: Optional[str] = None,
+    profile_dir: str = "profiles",
+):
     """Create an ASGI application for the server.
 
+    :param heart_beat_interval: seconds without update after which a topic is sent to its subscribers again
+    :param client_manager: Socket.IO client manager. Default is an IndexedRoomManager for a single process
+    :param retention_messages: number of recent messages kept per topic for late subscribers
+    :param retention_bytes: maximum size of the recent messages kept per topic in bytes
+    :param store: durable storage of the topic contents, restored on startup. Default is to keep the topics in memory
+    :param send_queue_size: maximum number of messages waiting to be sent to a client
+    :param overflow_policy: what happens when the send queue of a client is full, one of OVERFLOW_POLICIES
+    :param conflation_windows: conflation window in milliseconds for the topics matching a glob pattern
+    :param profile: one of PROFILE_MODES to record a profile from the start on. Default is to only record the profiles
+        requested through the admin route /admin/profile
+    :param profile_dir: directory the profiles are written to
     :return: ASGI application
     """
-    server = Server()
+    server = Server(
+        heart_beat_interval,
+        client_manager,
+        retention_messages,
+        retention_bytes,
+        store,
+        send_queue_size,
+        overflow_policy,
+        conflation_windows,
+    )
     application = web.Application(logger=None)
 
     server.sio.attach(application)
 
-    timer = ParallelTimer(server)
-    timer.start()
+    async def start_heart_beat(app):
+        if server.store is not None:
+            server.restore_topics()
+        app[HEART_BEAT_KEY] = asyncio.create_task(server.heart_beat.run())
+        if server._backplane is not None:
+            # Listen to the other workers right away and not only when the first client connects
+            server.sio.manager_initialized = True
+            server.sio.manager.initialize()
+
+    async def stop_heart_beat(app):
+        app[HEART_BEAT_KEY].cancel()
+
+    async def close_backplane(app):
+        # Runs after the connections are closed, so the topics removed by the disconnects still reach the other workers
+        if server._backplane is not None:
+            await server._backplane.close()
+
+    async def close_store(app):
+        # Runs before the connections are closed, so the topics removed by the disconnects are not logged
+        if server.store is not None:
+            await server.store.close()
+
+    async def metrics(request):
+        return web.Response(body=server.metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    application.router.add_get("/metrics", metrics)
+    application.on_startup.append(start_heart_beat)
+    add_profiling(application, server, profile, profile_dir)
+    application.on_shutdown.append(close_store)
+    application.on_cleanup.append(stop_heart_beat)
+    application.on_cleanup.append(close_backplane)
 
     return application
 
 
+def add_profiling(application: web.Application, server: Server, mode: Optional[str], directory: str) -> None:
+    """Add the admin route /admin/profile and measure the lag of the event loop.
+    GET returns the state of the profiler. POST stops the running profile and returns the paths of the written files,
+    or starts a profile in the mode and with the sampling interval given as query parameters mode and interval.
+    The route only answers requests from the local host.
+
+    :param application: application of the server
+    :param server: Server object
+    :param mode: one of PROFILE_MODES to record a profile from the start of the application on. Without mode, no
+        profile is recorded until one is requested
+    :param directory: directory the profiles are written to
+    """
+    lag = server.metrics.histogram(
+        "pubsub_event_loop_lag_seconds", "Delay of the event loop in waking up a sleeping task."
+    )
+    profiler = Profiler(directory, server.handler_totals, lag)
+
+    def check_local(request: web.Request) -> None:
+        if request.remote not in ("127.0.0.1", "::1"):
+            raise web.HTTPForbidden(text="Profiling is only available from the local host.")
+
+    async def profile_status(request):
+        check_local(request)
+        return web.json_response(profiler.status())
+
+    async def toggle_profile(request):
+        check_local(request)
+        if profiler.running:
+            files = await profiler.stop()
+            logging.info("Profile was written to %s", ", ".join(files.values()))
+            return web.json_response({"running": False, "files": files})
+        try:
+            interval = float(request.query.get("interval", 0.005))
+            profiler.start(request.query.get("mode", mode or "sampler"), interval)
+        except ValueError as error:
+            raise web.HTTPBadRequest(text=str(error))
+        logging.info("Started %s profile.", profiler.mode)
+        return web.json_response({"running": True, "mode": profiler.mode})
+
+    async def start_profiling(app):
+        if mode is not None:
+            profiler.start(mode)
+        app[LOOP_LAG_KEY] = asyncio.create_task(profiler.monitor_loop_lag())
+
+    async def stop_profiling(app):
+        app[LOOP_LAG_KEY].cancel()
+        if profiler.running:
+            logging.info("Profile was written to %s", ", ".join((await profiler.stop()).values()))
+
+    application.router.add_get("/admin/profile", profile_status)
+    application.router.add_post("/admin/profile", toggle_profile)
+    application.on_startup.append(start_profiling)
+    application.on_cleanup.append(stop_profiling)
+
+
+def conflation_window(value: str) -> Tuple[str, int]:
+    """Parse a conflation window of the command line.
+
+    :param value: glob pattern and window in milliseconds separated by a colon, e.g. sensors/*:100
+    :return: glob pattern and window
+    :raise ArgumentTypeError: if the value is not valid
+    """
+    pattern, _, window = value.rpartition(":")
+    if not pattern or not window.isdigit() or int(window) == 0:
+        raise ArgumentTypeError(
+            f"{value} is not a glob pattern and a positive number of milliseconds like sensors/*:100"
+        )
+    return pattern, int(window)
+
+
+def run_workers(
+    host: str,
+    port: int,
+    workers: int,
+    heart_beat_interval: int,
+    log_level: str,
+    log_payload_limit: int,
+    retention_messages: int = 100,
+    retention_bytes: int = 1024 * 1024,
+    send_queue_size: int = 1000,
+    overflow_policy: str = "drop-oldest",
+    conflation_windows: Optional[Dict[str, int]] = None,
+    profile: Optional[str] = None,
+    profile_dir: str = "profiles",
+):
+    """Run the server in several worker processes until it is interrupted.
+    The workers share the listening socket and are connected through a backplane hub in this process. Clients have to
+    use the websocket transport, because the requests of the polling transport may reach different workers.
+
+    :param host: Host to run the server on
+    :param port: Port to run the server on
+    :param workers: Number of worker processes
+    :param heart_beat_interval: seconds without update after which a topic is sent to its subscribers again
+    :param log_level: name of the log level of the server
+    :param log_payload_limit: maximum length of a string argument in a log line. 0 disables the truncation
+    :param retention_messages: number of recent messages kept per topic for late subscribers
+    :param retention_bytes: maximum size of the recent messages kept per topic in bytes
+    :param send_queue_size: maximum number of messages waiting to be sent to a client
+    :param overflow_policy: what happens when the send queue of a client is full, one of OVERFLOW_POLICIES
+    :param conflation_windows: conflation window in milliseconds for the topics matching a glob pattern
+    :param profile: one of PROFILE_MODES to profile every worker from the start on
+    :param profile_dir: directory the profiles are written to
+    """
+    sock = socket.create_server((host, int(port)))
+    hub_dir = tempfile.mkdtemp(prefix="pubsub-backplane-")
+    hub_path = os.path.join(hub_dir, "hub.sock")
+    hub_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    hub_sock.bind(hub_path)
+    hub_sock.listen()
+
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Worker process
+            hub_sock.close()
+            log_listener = setup_logging(log_level, log_payload_limit)
+            try:
+                app = get_app(
+                    heart_beat_interval,
+                    IndexedBackplaneManager(hub_path),
+                    retention_messages,
+                    retention_bytes,
+                    None,
+                    send_queue_size,
+                    overflow_policy,
+                    conflation_windows,
+                    profile,
+                    profile_dir,
+                )
+                web.run_app(app, sock=sock, print=None)
+            finally:
+                log_listener.stop()
+                os._exit(0)
+        pids.append(pid)
+    sock.close()
+
+    log_listener = setup_logging(log_level, log_payload_limit)
+    print(f"======== Running on http://{host}:{port} with {workers} workers ========\n(Press CTRL+C to quit)")
+
+    def stop_workers():
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        while pids:
+            os.waitpid(pids.pop(), 0)
+
+    async def serve_hub():
+        hub = asyncio.create_task(BackplaneHub(hub_sock).serve())
+        interrupted = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, interrupted.set)
+        interrupt = asyncio.create_task(interrupted.wait())
+        await asyncio.wait((hub, interrupt), return_when=asyncio.FIRST_COMPLETED)
+        # The hub keeps relaying until the workers are gone, so no worker loses the backplane while it is running
+        await loop.run_in_executor(None, stop_workers)
+        interrupt.cancel()
+        hub.cancel()
+        try:
+            await hub
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(serve_hub())
+    finally:
+        stop_workers()
+        shutil.rmtree(hub_dir, ignore_errors=True)
+        log_listener.stop()
+
+
 if __name__ == "__main__":
     parser = ArgumentParser(prog="server.py", description="Starts a server for publisher subscriber system")
     parser.add_argument(
@@ -381,8 +1903,153 @@ if __name__ == "__main__":
     parser.add_argument(
         "--host", type=str, help="Host to run the server on. Default is localhost", default="127.0.0.1", metavar="STRING"
     )
+    parser.add_argument(
+        "--heartbeat",
+        type=int,
+        help="Seconds without update after which a topic is sent to its subscribers again. Default is 20",
+        default=20,
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        help="Log level of the server. Default is INFO",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    )
+    parser.add_argument(
+        "--log-payload-limit",
+        type=int,
+        help="Maximum number of characters of a message in the log, 0 logs messages in full. Default is 256",
+        default=256,
+        metavar="CHARACTERS",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of worker processes sharing the port. Clients have to use the websocket transport if there is "
+        "more than one. Default is 1",
+        default=1,
+        metavar="NUMBER",
+    )
+    parser.add_argument(
+        "--retention-messages",
+        type=int,
+        help="Number of recent messages kept per topic for subscribers asking for history. Default is 100",
+        default=100,
+        metavar="NUMBER",
+    )
+    parser.add_argument(
+        "--retention-bytes",
+        type=int,
+        help="Maximum size of the recent messages kept per topic. Default is 1048576",
+        default=1024 * 1024,
+        metavar="BYTES",
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        help="Directory to store the topics in, so they are restored after a restart. Default is to keep them in memory",
+        metavar="PATH",
+    )
+    parser.add_argument(
+        "--durability",
+        type=str,
+        help="With --data-dir: async syncs to disk every second, group acknowledges publishes after a sync shared by "
+        "all concurrent publishes, sync syncs every publish on its own. Default is group",
+        default="group",
+        choices=DURABILITY_MODES,
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        help="With --data-dir: number of logged publishes after which a snapshot is written. Default is 100000",
+        default=100_000,
+        metavar="NUMBER",
+    )
+    parser.add_argument(
+        "--send-queue-size",
+        type=int,
+        help="Maximum number of messages waiting to be sent to a client. Default is 1000",
+        default=1000,
+        metavar="NUMBER",
+    )
+    parser.add_argument(
+        "--overflow-policy",
+        type=str,
+        help="What happens when the send queue of a slow client is full: drop-oldest drops its oldest message, "
+        "conflate replaces a queued update of the same topic, disconnect disconnects the client. Default is drop-oldest",
+        default="drop-oldest",
+        choices=OVERFLOW_POLICIES,
+    )
+    parser.add_argument(
+        "--conflate",
+        type=conflation_window,
+        action="append",
+        help="Coalesce the publishes to the topics matching a glob pattern within a window, so their subscribers only "
+        "receive the latest content when the window closes, e.g. 'sensors/*:100'. Can be given several times, the "
+        "first matching pattern counts. Default is no conflation",
+        default=[],
+        metavar="GLOB:MILLISECONDS",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="sampler",
+        help="Record a profile from the start on. Without it, profiles are only recorded on request through the admin "
+        "route /admin/profile, where GET shows the state and POST stops the profile and writes it or starts a new one. "
+        "sampler writes flame graph stacks, cprofile profiles every call. Default mode is sampler",
+        choices=PROFILE_MODES,
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        help="Directory the profiles are written to. Default is profiles",
+        default="profiles",
+        metavar="PATH",
+    )
     params = parser.parse_args()
-
-    # wrap with ASGI application
-    app = get_app()
-    web.run_app(app, host=params.host, port=params.port)
+    if params.data_dir is not None and params.workers > 1:
+        parser.error("--data-dir is only supported with a single worker process")
+
+    if params.workers > 1:
+        run_workers(
+            params.host,
+            params.port,
+            params.workers,
+            params.heartbeat,
+            params.log_level,
+            params.log_payload_limit,
+            params.retention_messages,
+            params.retention_bytes,
+            params.send_queue_size,
+            params.overflow_policy,
+            dict(params.conflate),
+            params.profile,
+            params.profile_dir,
+        )
+    else:
+        log_listener = setup_logging(params.log_level, params.log_payload_limit)
+
+        # wrap with ASGI application
+        store = None
+        if params.data_dir is not None:
+            store = TopicStore(params.data_dir, params.durability, params.snapshot_every)
+        app = get_app(
+            params.heartbeat,
+            None,
+            params.retention_messages,
+            params.retention_bytes,
+            store,
+            params.send_queue_size,
+            params.overflow_policy,
+            dict(params.conflate),
+            params.profile,
+            params.profile_dir,
+        )
+        try:
+            web.run_app(app, host=params.host, port=params.port)
+        finally:
+            log_listener.stop()
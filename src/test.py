@@ -1,480 +1,1710 @@
-import socketio
+import asyncio
+import io
+import json
+import logging
+import os
+import socket
+import threading
 import time
-import pytest
-from client import Client
-from transport_message import TransportMessage
+from logging.handlers import QueueHandler
 
-RESPOSE1 = None
-RESPOSE2 = None
+import aiohttp
+import pytest
+import pytest_asyncio
+import socketio
+from aiohttp import web
+
+from backplane import BackplaneHub, encode_frame, read_frame
+from client import AsyncClient, Client, ClientSession
+from codec import decode_batch, decode_message, encode
+from persistence import TopicStore
+from send_queue import CONFLATED, DROPPED, OVERFLOW, QUEUED, SendQueue
+from server import (
+    IndexedBackplaneManager,
+    PayloadTruncationFilter,
+    Server,
+    Topic,
+    TopicRegistry,
+    get_app,
+    setup_logging,
+)
+from topic_trie import TopicTrie
+from transport_message import TransportMessage, TransportMessageBatch
+
+pytestmark = [
+    pytest.mark.asyncio,
+    # The user client exits its receiving thread after PRINT_MESSAGE_AND_EXIT
+    pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning"),
+]
+
+TIMEOUT = 5
+"""Seconds to wait for an expected event"""
+
+SILENCE = 0.2
+"""Seconds without event after which no event is expected anymore"""
+
+
+class EventClient:
+    """Socket.IO client which collects the received events, so that tests can await them"""
+
+    def __init__(self) -> None:
+        self.sio = socketio.AsyncClient()
+        self.sio.on("*", self._on_event)
+        self.events = asyncio.Queue()
+
+    @property
+    def connected(self) -> bool:
+        return self.sio.connected
+
+    async def emit(self, event, data=None) -> None:
+        await self.sio.emit(event, data)
+
+    async def call(self, event, data=None):
+        return await self.sio.call(event, data, timeout=TIMEOUT)
+
+    async def receive(self, event=None):
+        """Wait for the next event.
+
+        :param event: expected name of the event
+        :return: name of the event and its data
+        """
+        name, data = await asyncio.wait_for(self.events.get(), TIMEOUT)
+        if event is not None:
+            assert name == event
+        return name, data
+
+    async def receive_message(self, event, topic=None):
+        """Wait for the next event and parse it.
+
+        :param event: expected name of the event
+        :param topic: expected topic of the message. Only updates of a topic name their topic
+        :return: TransportMessage sent with the event
+        """
+        _, data = await self.receive(event)
+        message = decode_message(data)
+        assert message.timestamp is not None
+        assert message.topic == topic
+        return message
+
+    async def receive_batch(self):
+        """Wait for the next PRINT_MESSAGE_BATCH and parse it.
+
+        :return: TransportMessageBatch sent with the event
+        """
+        _, data = await self.receive("PRINT_MESSAGE_BATCH")
+        return decode_batch(data)
+
+    async def assert_silent(self, duration=SILENCE) -> None:
+        """Check that no event arrives within duration seconds"""
+        await asyncio.sleep(duration)
+        assert self.events.empty()
+
+    async def _on_event(self, event, data=None) -> None:
+        await self.events.put((event, data))
+
+
+async def read_output(capsys, *expected):
+    """Collect the lines printed by the user clients until all expected lines were printed or the timeout expired.
+
+    :param expected: expected lines
+    :return: printed lines
+    """
+    lines = []
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        lines += [line for line in capsys.readouterr().out.split("\n") if line]
+        if all(line in lines for line in expected):
+            break
+        await asyncio.sleep(0.01)
+    return lines
+
+
+async def start_app(port=0, **kwargs):
+    """Start a server on a random port.
+
+    :param port: port to start the server on instead, e.g. to restart a server
+    :param kwargs: arguments of get_app
+    :return: runner of the server, which has to be cleaned up, and URL of the server
+    """
+    # Connections still open on cleanup are closed after the shutdown timeout instead of the default minute
+    runner = web.AppRunner(get_app(**kwargs), shutdown_timeout=0.5)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+@pytest_asyncio.fixture
+async def server(request):
+    """Start an isolated server on a random port. The arguments of get_app can be passed with indirect
+    parametrization, e.g. the heart beat interval.
+
+    :return: URL of the server
+    """
+    runner, url = await start_app(**getattr(request, "param", {}))
+    yield url
+    await runner.cleanup()
+
+
+async def connect(server, auth=None):
+    client = EventClient()
+    await client.sio.connect(server, auth=auth)
+    return client
+
+
+@pytest_asyncio.fixture
+async def client(server):
+    client = await connect(server)
+    yield client
+    await client.sio.disconnect()
 
 
-def answers1(*data):
-    global RESPOSE1
-    RESPOSE1 = data
+@pytest_asyncio.fixture
+async def client2(server):
+    client = await connect(server)
+    yield client
+    await client.sio.disconnect()
 
 
-def answers2(*data):
-    global RESPOSE2
-    RESPOSE2 = data
+@pytest_asyncio.fixture
+async def client3(server):
+    client = await connect(server)
+    yield client
+    await client.sio.disconnect()
 
 
-@pytest.fixture
-def client():
-    client = socketio.Client()
-    client.connect("http://localhost:8080")
-    client.on("*", answers1)
-    yield client
-    client.disconnect()
+# The user clients are synchronous and block, so they are used from threads while the server runs in the event loop
 
 
-@pytest.fixture
-def client2():
-    client = socketio.Client(logger=False)
-    client.connect("http://localhost:8080")
-    client.on("*", answers2)
+@pytest_asyncio.fixture
+async def user_client(server):
+    client = await asyncio.to_thread(Client, server)
     yield client
-    client.disconnect()
+    await asyncio.to_thread(client.disconnect)
 
 
-@pytest.fixture
-def user_client():
-    client = Client("http://localhost:8080")
+@pytest_asyncio.fixture
+async def user_client2(server):
+    client = await asyncio.to_thread(Client, server)
     yield client
-    client.disconnect()
+    await asyncio.to_thread(client.disconnect)
 
 
-@pytest.fixture
-def user_client2():
-    client = Client("http://localhost:8080")
-    yield client
-    client.disconnect()
+@pytest_asyncio.fixture
+async def session(server):
+    updates = []
+    session = await asyncio.to_thread(ClientSession, server, on_update=updates.append)
+    session.updates = updates
+    yield session
+    await asyncio.to_thread(session.close)
 
 
-def test_subscribe(client, client2):
-    global RESPOSE1
-    global RESPOSE2
-    RESPOSE1 = None
-    RESPOSE2 = None
+async def test_subscribe(client, client2):
     sub_topic = "test"
     emit_topic = "SUBSCRIBE_TOPIC"
 
-    # TODO: Check topic is None
-
     # Subscribe to new topic wihout payload
-    client.emit(emit_topic)
-    time.sleep(0.5)
-
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
+    await client.emit(emit_topic)
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == "Missing payload of type TransportMessage."
-
-    RESPOSE1 = None
+    assert client.connected
 
     # Subscribe to new topic without topic
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time())).json())
-    time.sleep(0.5)
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time())).json())
 
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == "Missing parameter topic."
-
-    RESPOSE1 = None
+    assert client.connected
 
     # Subscribe to new topic
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
     # Check message for the first client
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE")
     assert data.payload == f"Created {sub_topic} and successfully subscribed."
 
-    RESPOSE1 = None
-
     # Check message for the second client
-    assert client2.connected
-    assert RESPOSE2 is None
+    await client2.assert_silent()
 
     # Subscribe to the same topic
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE"
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE")
     assert data.payload == f"Already subscribed to {sub_topic}."
 
-    RESPOSE1 = None
-
     # Check message for the second client
-    assert client2.connected
-    assert RESPOSE2 is None
+    await client2.assert_silent()
 
     # Subscribe to a new topic that already exists
-    client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-    assert client2.connected
-    assert RESPOSE2[0] == "PRINT_MESSAGE"
-
-    data = TransportMessage.parse_raw(RESPOSE2[1])
-    assert data.timestamp is not None
-    assert data.topic is None
-    assert data.payload == f"Successfully subscribed to {sub_topic}."
+    await client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    RESPOSE2 = None
+    data = await client2.receive_message("PRINT_MESSAGE")
+    assert data.payload == f"Successfully subscribed to {sub_topic}."
 
     # Check message for the first client
-    assert client.connected
-    assert RESPOSE1 is None
+    await client.assert_silent()
 
 
-def test_subscribe_client(capsys, user_client):
+async def test_subscribe_client(capsys, user_client):
     sub_topic = "test_topic"
 
-    user_client.subscribe(sub_topic)
-    time.sleep(0.5)
+    await asyncio.to_thread(user_client.subscribe, sub_topic)
 
     expected_str = f"======= SUBSCRIBED TO {sub_topic} ======="
-    output_list = capsys.readouterr()[0].split("\n")
+    output_list = await read_output(capsys, expected_str, f"Created {sub_topic} and successfully subscribed.")
 
     assert output_list[0] == expected_str
 
 
-def test_publish(client, client2):
-    global RESPOSE1
-    global RESPOSE2
-    RESPOSE1 = None
-    RESPOSE2 = None
+async def test_publish(client, client2):
     sub_topic = "test"
     emit_topic = "PUBLISH_TOPIC"
     payload = "test payload"
 
     # Publish to topic that does not exist
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json())
-    time.sleep(0.5)
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json())
 
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == f"{sub_topic} does not exist."
 
-    RESPOSE1 = None
-
     # Create new topic and subscribe
-    client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-
-    # Publish to topic
-    client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json())
-    time.sleep(0.5)
-
-    # Check if publisher is notified
-    assert client2.connected
-    assert RESPOSE2[0] == "PRINT_MESSAGE_AND_EXIT"
-
-    data = TransportMessage.parse_raw(RESPOSE2[1])
-    assert data.timestamp is not None
-    assert data.topic is None
-    assert data.payload == f"Successfully published message to {sub_topic}."
-
-    # Check if the message is published
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
-    assert data.payload.split(": ")[1] == payload
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
 
-    RESPOSE1 = None
-    RESPOSE2 = None
+    for offset in range(2):
+        # Publish to topic
+        await client2.emit(
+            emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json()
+        )
 
-    # Publish second message to topic
-    client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json())
-    time.sleep(0.5)
+        # Check if publisher is notified
+        data = await client2.receive_message("PRINT_MESSAGE_AND_EXIT")
+        assert data.payload == f"Successfully published message to {sub_topic}."
 
-    # Check if publisher is notified
-    assert client2.connected
-    assert RESPOSE2[0] == "PRINT_MESSAGE_AND_EXIT"
+        # Check if the message is published
+        data = await client.receive_message("PRINT_MESSAGE", sub_topic)
+        assert data.payload.split(": ")[1] == payload
+        assert data.offset == offset
 
-    data = TransportMessage.parse_raw(RESPOSE2[1])
-    assert data.timestamp is not None
-    assert data.topic is None
-    assert data.payload == f"Successfully published message to {sub_topic}."
 
-    # Check if the message is published
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
-    assert data.payload.split(": ")[1] == payload
-
-    RESPOSE1 = None
-    RESPOSE2 = None
-
-
-def test_publish_client(capsys, user_client, user_client2):
+async def test_publish_client(capsys, user_client, user_client2):
     sub_topic = "test_topic"
     not_sub_topic = "i do not exist"
     msg_publish = "this is a message"
 
-    with capsys.disabled():
-        user_client2.subscribe(sub_topic)
-        time.sleep(0.5)
+    await asyncio.to_thread(user_client2.subscribe, sub_topic)
+    await read_output(capsys, f"Created {sub_topic} and successfully subscribed.")
 
     # Publish to a topic
-    user_client.publish(sub_topic, msg_publish)
-    time.sleep(0.5)
+    await asyncio.to_thread(user_client.publish, sub_topic, msg_publish)
 
     expected_msg1 = f"Message: {msg_publish}"
     expected_msg2 = f"Successfully published message to {sub_topic}."
-    output_list = capsys.readouterr()[0].split("\n")
+    output_list = await read_output(capsys, expected_msg2)
 
     assert output_list[1] == expected_msg1
-    # from user_client2 "test_topic (06-06-2023 10:21:16): this is a message""
-    assert output_list[3] == expected_msg2
+    assert expected_msg2 in output_list
+    # from user_client2 "test_topic (06-06-2023 10:21:16): this is a message"
+    assert any(line.startswith(f"{sub_topic} (") and line.endswith(msg_publish) for line in output_list)
 
     # Publish to a topic that does not exist
-    user_client2.publish(not_sub_topic, msg_publish)
-    time.sleep(0.5)
+    await asyncio.to_thread(user_client2.publish, not_sub_topic, msg_publish)
 
     expected_msg = f"{not_sub_topic} does not exist."
-    output_list2 = capsys.readouterr()[0].split("\n")
+    output_list2 = await read_output(capsys, expected_msg)
 
     assert output_list2[2] == expected_msg
 
 
-def test_unsubscribe(client, client2):
-    global RESPOSE1
-    global RESPOSE2
-    RESPOSE1 = None
-    RESPOSE2 = None
+async def test_unsubscribe(client, client2):
     sub_topic = "test"
     emit_topic = "UNSUBSCRIBE_TOPIC"
 
     # Unsubscribe from topic that does not exist
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == f"{sub_topic} does not exist."
 
-    RESPOSE1 = None
-
     # Create new topic and subscribe
-    client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
 
     # Unsubscribe from topic that is already unsubscribed
-    client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-
-    assert client2.connected
-    assert RESPOSE2[0] == "PRINT_MESSAGE_AND_EXIT"
+    await client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    data = TransportMessage.parse_raw(RESPOSE2[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client2.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == f"Not subscribed to {sub_topic}."
 
     # Unsubscribe from topic
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    # Check if the message is published
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
-
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == f"Successfully unsubscribed from {sub_topic}."
 
-    RESPOSE1 = None
 
+async def test_unsubscribe_client(capsys, user_client):
+    sub_topic = "test_topic"
 
-def test_unsubscribe_client():
-    pass
+    await asyncio.to_thread(user_client.subscribe, sub_topic)
+    await read_output(capsys, f"Created {sub_topic} and successfully subscribed.")
 
+    await asyncio.to_thread(user_client.unsubscibe)
 
-def test_list_topics(client):
-    global RESPOSE1
-    RESPOSE1 = None
+    expected_str = f"======= UNSUBSCRIBED FROM {sub_topic} ======="
+    output_list = await read_output(capsys, expected_str, f"Successfully unsubscribed from {sub_topic}.")
+
+    assert output_list[0] == expected_str
+
+
+async def test_list_topics(client):
     sub_topic = "test"
     emit_topic = "LIST_TOPICS"
 
     # List topics when there are no topics
-    client.emit(emit_topic)
-    time.sleep(0.5)
-
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
+    await client.emit(emit_topic)
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == "All topics on the server:"
 
-    RESPOSE1 = None
-
     # Create new topic and subscribe
-    client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
 
     # List topics
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time())).json())
-    time.sleep(0.5)
-
-    # Check if the message is published
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time())).json())
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == f"All topics on the server:\n{sub_topic}"
 
-    RESPOSE1 = None
 
+async def test_list_topics_client(capsys, user_client, user_client2):
+    sub_topic = "test_topic"
+
+    await asyncio.to_thread(user_client2.subscribe, sub_topic)
+    await read_output(capsys, f"Created {sub_topic} and successfully subscribed.")
 
-def test_list_topics_client():
-    pass
+    await asyncio.to_thread(user_client.listTopics)
 
+    output_list = await read_output(capsys, "All topics on the server:", sub_topic)
 
-def test_get_topic_status(client):
-    global RESPOSE1
-    RESPOSE1 = None
+    assert output_list == ["All topics on the server:", sub_topic]
+
+
+async def test_get_topic_status(client):
     sub_topic = "test"
     emit_topic = "GET_TOPIC_STATUS"
 
     # Get status of topic that does not exist
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert data.payload == f"{sub_topic} does not exist."
 
-    RESPOSE1 = None
-
     # Create new topic and subscribe
-    client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
 
     # Get status of topic
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-
-    # Check if the message is published
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE_AND_EXIT"
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
     assert isinstance(data.payload, str)  # only check if it is a string
 
-    RESPOSE1 = None
 
+async def test_get_topic_status_client(capsys, user_client, user_client2):
+    sub_topic = "test_topic"
 
-def test_get_topic_status_client():
-    pass
+    await asyncio.to_thread(user_client2.subscribe, sub_topic)
+    await read_output(capsys, f"Created {sub_topic} and successfully subscribed.")
 
+    await asyncio.to_thread(user_client.getTopicStatus, sub_topic)
 
-def test_heartbeat(client, client2):
-    global RESPOSE1
-    RESPOSE1 = None
-    sub_topic = "test"
-    emit_topic = "SUBSCRIBE_TOPIC"
+    output_list = await read_output(capsys, "There was no publish on this topic yet.")
 
-    # Create new topic and subscribe
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    assert "topic name:\ttest_topic" in output_list
+    assert "There was no publish on this topic yet." in output_list
 
-    # publish first message
-    client2.emit("PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="12345").json())
-    time.sleep(0.5)
 
-    assert RESPOSE1 is not None
-    RESPOSE1 = None
-
-    # Wait 10 seconds
-    time.sleep(10)
+# The last update is stored in whole seconds, so the heart beat follows after 1 to 2 seconds
+@pytest.mark.parametrize("server", [{"heart_beat_interval": 2}], indirect=True)
+async def test_heartbeat(client, client2):
+    sub_topic = "test"
 
-    # No message should be received
-    assert RESPOSE1 is None
+    # Create new topic and subscribe
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
 
-    # Wait 15 seconds. In sum 25 seconds (heartbeat interval is 20 seconds)
-    time.sleep(15)
+    # publish first message
+    await client2.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="12345").json()
+    )
+    await client.receive("PRINT_MESSAGE")
 
-    # Check if the message is published
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE"
+    # No message should be received within the first second
+    await client.assert_silent(0.9)
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    # Check if the message is published again
+    data = await client.receive_message("PRINT_MESSAGE", sub_topic)
     assert sub_topic in data.payload
     assert "12345" in data.payload
 
 
-def test_cleanup_topic(client):
-    global RESPOSE1
-    RESPOSE1 = None
+async def test_cleanup_topic(client):
     sub_topic = "test"
     emit_topic = "SUBSCRIBE_TOPIC"
 
     # Create new topic and subscribe
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
 
     # publish first message
-    client.emit("PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="12345").json())
-    time.sleep(0.5)
-
-    assert RESPOSE1 is not None
-    RESPOSE1 = None
+    await client.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="12345").json()
+    )
+    await client.receive()
+    await client.receive()
 
     # Unsubscribe from topic
-    client.emit("UNSUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
+    await client.emit("UNSUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE_AND_EXIT")
 
     # Subscribe again and check if the topic is created again
-    client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
-    time.sleep(0.5)
-
-    assert client.connected
-    assert RESPOSE1[0] == "PRINT_MESSAGE"
+    await client.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
 
-    data = TransportMessage.parse_raw(RESPOSE1[1])
-    assert data.timestamp is not None
-    assert data.topic is None
+    data = await client.receive_message("PRINT_MESSAGE")
     assert data.payload == f"Created {sub_topic} and successfully subscribed."
+
+
+async def test_disconnect(client, client2):
+    sub_topic = "test"
+
+    # Create new topic and subscribe
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
+
+    # Disconnect the only subscriber
+    await client.sio.disconnect()
+
+    # Topic must be deleted
+    await client2.emit("LIST_TOPICS", TransportMessage(timestamp=int(time.time())).json())
+
+    data = await client2.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == "All topics on the server:"
+
+
+async def test_disconnect_rooms():
+    server = Server()
+
+    async def send_packet(eio_sid, pkt):
+        pass
+
+    server.sio.eio.send_packet = send_packet
+    manager = server.sio.manager
+    sids = []
+    for i in range(2):
+        sid = await manager.connect(f"subscriber-{i}", "/")
+        server._sid_ip_mapping[sid] = "127.0.0.1"
+        sids.append(sid)
+    for sid, topics in zip(sids, (["a", "b", "c"], ["a", "b"])):
+        for topic in topics:
+            await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic=topic).json())
+    rooms_of_other = set(manager.get_rooms(sids[1], "/"))
+    manager.callbacks[sids[0]] = {1: print}
+
+    # The indexed rooms and the bookkeeping of the base class are cleaned up, the other session keeps its rooms
+    await manager.disconnect(sids[0], "/")
+    assert ("/", sids[0]) not in manager._rooms_of
+    assert sids[0] not in manager.callbacks
+    assert not any(sids[0] in room for room in manager.rooms["/"].values())
+    assert set(manager.get_rooms(sids[1], "/")) == rooms_of_other
+    assert all(sids[1] in manager.rooms["/"][room] for room in rooms_of_other)
+
+    await manager.disconnect(sids[1], "/")
+    assert manager._rooms_of == {}
+    assert "/" not in manager.rooms
+
+
+async def test_publish_batch(client, client2):
+    sub_topic = "test"
+    sub_topic2 = "test2"
+    emit_topic = "PUBLISH_BATCH"
+
+    # Create two topics and subscribe
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic2).json())
+    await client.receive("PRINT_MESSAGE")
+    await client.receive("PRINT_MESSAGE")
+
+    # Publish three messages, one to a topic that does not exist
+    batch = TransportMessageBatch(
+        timestamp=int(time.time()),
+        messages=[
+            TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="first"),
+            TransportMessage(timestamp=int(time.time()), topic="i do not exist", payload="second"),
+            TransportMessage(timestamp=int(time.time()), topic=sub_topic2, payload="third"),
+        ],
+    )
+    await client2.emit(emit_topic, batch.json())
+
+    # Check if publisher is notified once
+    data = await client2.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == (
+        "Successfully published 2 messages to 2 topics. Topics that do not exist: i do not exist."
+    )
+    await client2.assert_silent()
+
+    # Check if the subscriber receives both messages in one frame
+    data = await client.receive_batch()
+    assert [message.payload.split(": ")[1] for message in data.messages] == ["first", "third"]
+
+    # Publish invalid batch
+    await client2.emit(emit_topic, TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+
+    data = await client2.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == "Invalid payload."
+
+
+async def test_request_id(client):
+    sub_topic = "test"
+
+    # Requests with request id are answered through the acknowledgement
+    response = await client.call(
+        "GET_TOPIC_STATUS", TransportMessage(timestamp=int(time.time()), topic=sub_topic, request_id=7).json()
+    )
+
+    data = TransportMessage.parse_raw(response)
+    assert data.request_id == 7
+    assert data.payload == f"{sub_topic} does not exist."
+
+    # No event is sent in addition
+    await client.assert_silent()
+
+    # Errors are answered through the acknowledgement as well
+    response = await client.call("PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), request_id=8).json())
+
+    data = TransportMessage.parse_raw(response)
+    assert data.request_id == 8
+    assert data.payload == "Missing parameter topic."
+
+
+async def test_client_session(session):
+    sub_topic = "test"
+
+    def requests():
+        # Several requests over one connection
+        assert session.listTopics() == "All topics on the server:"
+        assert session.subscribe(sub_topic) == [f"Created {sub_topic} and successfully subscribed."]
+        assert session.publish(sub_topic, "first") == f"Successfully published message to {sub_topic}."
+        assert session.publish("i do not exist", "second") == "i do not exist does not exist."
+        assert session.publish_many([(sub_topic, "third")]) == "Successfully published 1 messages to 1 topics."
+        assert "content:\tthird" in session.getTopicStatus(sub_topic)
+        assert session.listTopics() == f"All topics on the server:\n{sub_topic}"
+
+    await asyncio.to_thread(requests)
+    await asyncio.sleep(SILENCE)
+
+    # Updates of the subscribed topic are passed to the callback
+    assert [update.payload.split(": ")[1] for update in session.updates] == ["first", "third"]
+
+    assert await asyncio.to_thread(session.unsubscribe, sub_topic) == [f"Successfully unsubscribed from {sub_topic}."]
+    assert session.socket.connected
+
+
+async def test_subscribe_history(client, client2, client3):
+    sub_topic = "test"
+
+    # Create new topic and subscribe
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
+
+    # Publish three messages
+    for payload in ("first", "second", "third"):
+        await client2.emit(
+            "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json()
+        )
+        await client2.receive("PRINT_MESSAGE_AND_EXIT")
+        await client.receive_message("PRINT_MESSAGE", sub_topic)
+
+    # A late subscriber asks for the last two messages
+    await client3.emit(
+        "SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, limit=2).json()
+    )
+
+    data = await client3.receive_batch()
+    assert [message.offset for message in data.messages] == [1, 2]
+    assert [message.payload.split(": ")[1] for message in data.messages] == ["second", "third"]
+    assert all(message.topic == sub_topic for message in data.messages)
+
+    data = await client3.receive_message("PRINT_MESSAGE")
+    assert data.payload == f"Successfully subscribed to {sub_topic}."
+
+    # Ask again for all messages from an offset
+    await client3.emit(
+        "SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, offset=0).json()
+    )
+
+    data = await client3.receive_batch()
+    assert [message.offset for message in data.messages] == [0, 1, 2]
+
+    data = await client3.receive_message("PRINT_MESSAGE")
+    assert data.payload == f"Already subscribed to {sub_topic}."
+
+    # Without offset and limit no history is sent
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive_message("PRINT_MESSAGE")
+    await client.assert_silent()
+
+
+@pytest.mark.parametrize("server", [{"retention_messages": 3, "retention_bytes": 10}], indirect=True)
+async def test_retention_limits(client, client2):
+    sub_topic = "test"
+
+    # Create new topic and subscribe
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
+
+    # Publish four messages of four bytes each
+    for payload in ("aaaa", "bbbb", "cccc", "dddd"):
+        await client2.emit(
+            "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json()
+        )
+        await client2.receive("PRINT_MESSAGE_AND_EXIT")
+
+    # Only two messages fit into ten bytes, the offsets of the dropped messages are not reused
+    await client2.emit(
+        "SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, offset=0).json()
+    )
+
+    data = await client2.receive_batch()
+    assert [message.offset for message in data.messages] == [2, 3]
+    assert [message.payload.split(": ")[1] for message in data.messages] == ["cccc", "dddd"]
+
+
+async def test_restart(tmp_path):
+    sub_topic = "test"
+    runner, url = await start_app(store=TopicStore(str(tmp_path)))
+    try:
+        client = await connect(url)
+        client2 = await connect(url)
+
+        # Create new topic and publish two messages
+        await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+        await client.receive("PRINT_MESSAGE")
+        for payload in ("first", "second"):
+            await client2.emit(
+                "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=payload).json()
+            )
+            await client2.receive("PRINT_MESSAGE_AND_EXIT")
+            await client.receive_message("PRINT_MESSAGE", sub_topic)
+    finally:
+        # The store is closed before the connections, so the topic is not removed by the disconnect
+        await runner.cleanup()
+    await client.sio.disconnect()
+    await client2.sio.disconnect()
+
+    runner, url = await start_app(store=TopicStore(str(tmp_path)))
+    try:
+        client = await connect(url)
+
+        await client.emit("LIST_TOPICS", TransportMessage(timestamp=int(time.time())).json())
+        data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
+        assert data.payload == f"All topics on the server:\n{sub_topic}"
+
+        # The last message is restored with its offset
+        await client.emit(
+            "SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, offset=0).json()
+        )
+        data = await client.receive_batch()
+        assert [message.offset for message in data.messages] == [1]
+        assert [message.payload.split(": ")[1] for message in data.messages] == ["second"]
+        await client.receive_message("PRINT_MESSAGE")
+        await client.sio.disconnect()
+    finally:
+        await runner.cleanup()
+
+
+async def test_topic_store_replay(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    store = TopicStore(directory, "sync")
+    assert store.restore() == {}
+    store.start(lambda: [("a", "x", 1, 1), ("b", "y", 2, 1)])
+
+    # Neither the syncs of the publishes nor the one of the rotated segment block the event loop
+    loop_thread = threading.current_thread()
+    fsync = os.fsync
+
+    def fsync_in_thread(fd):
+        assert threading.current_thread() is not loop_thread
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", fsync_in_thread)
+
+    await store.publish([("a", "x", 1), ("b", "y", 2)])
+    await store.snapshot()
+
+    # Log tail after the snapshot
+    await store.publish([("a", "z", 3)])
+    store.remove("b")
+    await store.publish([("c", "w", 4)])
+
+    # The segment covered by the snapshot was deleted
+    segments = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".wal")]
+    assert len(segments) == 1
+    size = os.path.getsize(segments[0])
+    monkeypatch.undo()
+
+    # Crash in the middle of writing a record
+    store._committer.cancel()
+    store._file.write(b"\x00\x00\x01")
+    store._file.close()
+
+    assert TopicStore(directory).restore() == {"a": ["z", 3, 2], "c": ["w", 4, 1]}
+    # The torn record was cut off
+    assert os.path.getsize(segments[0]) == size
+
+
+async def test_topic_store_applied(tmp_path):
+    async def start_server(directory):
+        server = Server(store=TopicStore(directory, "group", snapshot_every=3))
+        server.sio.eio.send_packet = send_packet
+        server.restore_topics()
+        sid = await server.sio.manager.connect("publisher", "/")
+        server._sid_ip_mapping[sid] = "127.0.0.1"
+        await server.handle_subscribe(sid, TransportMessage(timestamp=1, topic="test").json())
+        return server, sid
+
+    async def send_packet(eio_sid, pkt):
+        pass
+
+    def publish(server, sid, payload):
+        return server.handle_publish(sid, TransportMessage(timestamp=1, topic="test", payload=payload).json())
+
+    # The third publish starts a snapshot while its record waits for the disk. A crash afterwards keeps the record
+    server, sid = await start_server(str(tmp_path / "crash"))
+    for payload in ("first", "second", "third"):
+        await publish(server, sid, payload)
+    await wait_until(lambda: server.store._snapshot_task is None)
+    server.store._committer.cancel()
+    server.store._file.close()
+    assert TopicStore(str(tmp_path / "crash")).restore() == {"test": ["third", 1, 3]}
+
+    # Closing the store releases the waiting publishes and the final snapshot contains them
+    server, sid = await start_server(str(tmp_path / "close"))
+    publishes = [asyncio.create_task(publish(server, sid, payload)) for payload in ("first", "second")]
+    await asyncio.sleep(0)
+    await server.store.close()
+    await asyncio.gather(*publishes)
+    assert server._get_topic_by_name("test").content == "second"
+    assert TopicStore(str(tmp_path / "close")).restore() == {"test": ["second", 1, 2]}
+
+
+async def test_wildcard_subscribe(client, client2, client3):
+    pattern = "sensors/+/temp"
+
+    # Subscribe to a pattern and to a matching topic
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=pattern).json())
+    data = await client.receive_message("PRINT_MESSAGE")
+    assert data.payload == f"Successfully subscribed to {pattern}."
+
+    await client2.emit(
+        "SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/kitchen/temp").json()
+    )
+    await client2.receive_message("PRINT_MESSAGE")
+
+    # Publish to the topic, both subscribers receive it
+    await client3.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/kitchen/temp", payload="21").json()
+    )
+    await client3.receive("PRINT_MESSAGE_AND_EXIT")
+    data = await client.receive_message("PRINT_MESSAGE", "sensors/kitchen/temp")
+    assert data.offset == 0
+    await client2.receive_message("PRINT_MESSAGE", "sensors/kitchen/temp")
+
+    # A topic without subscribers of its own only reaches the pattern and is not kept
+    await client3.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/garden/temp", payload="12").json()
+    )
+    data = await client3.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == "Successfully published message to sensors/garden/temp."
+    data = await client.receive_message("PRINT_MESSAGE", "sensors/garden/temp")
+    assert data.offset is None
+    assert data.payload.split(": ")[1] == "12"
+    await client2.assert_silent()
+
+    # Topics not matching any pattern still have to exist
+    await client3.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/garden/wind", payload="3").json()
+    )
+    data = await client3.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == "sensors/garden/wind does not exist."
+
+    # Invalid pattern
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/#/temp").json())
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload.startswith("Invalid pattern sensors/#/temp")
+
+    # Overlapping patterns deliver an update only once
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/#").json())
+    await client.receive_message("PRINT_MESSAGE")
+    await client3.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/kitchen/temp", payload="22").json()
+    )
+    await client3.receive("PRINT_MESSAGE_AND_EXIT")
+    await client.receive_message("PRINT_MESSAGE", "sensors/kitchen/temp")
+    await client2.receive_message("PRINT_MESSAGE", "sensors/kitchen/temp")
+    await client.assert_silent()
+
+    # Unsubscribe from both patterns
+    for topic in (pattern, "sensors/#"):
+        await client.emit("UNSUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=topic).json())
+        data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
+        assert data.payload == f"Successfully unsubscribed from {topic}."
+    await client3.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/garden/temp", payload="13").json()
+    )
+    data = await client3.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == "sensors/garden/temp does not exist."
+
+
+async def test_publish_pattern(client, client2):
+    # Everything published reaches the subscriber of #
+    await client2.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic="#").json())
+    await client2.receive_message("PRINT_MESSAGE")
+
+    # A wildcard pattern is no topic to publish to
+    await client.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="sensors/+/temp", payload="21").json()
+    )
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == "Invalid topic sensors/+/temp: wildcards are only allowed when subscribing."
+    await client2.assert_silent()
+
+    # Patterns in a batch are skipped
+    batch = TransportMessageBatch(
+        timestamp=int(time.time()),
+        messages=[
+            TransportMessage(timestamp=int(time.time()), topic="sensors/#", payload="21"),
+            TransportMessage(timestamp=int(time.time()), topic="sensors/kitchen/temp", payload="22"),
+        ],
+    )
+    await client.emit("PUBLISH_BATCH", batch.json())
+    data = await client.receive_message("PRINT_MESSAGE_AND_EXIT")
+    assert data.payload == (
+        "Successfully published 1 messages to 1 topics. 1 messages without valid topic or message were skipped."
+    )
+    data = await client2.receive_batch()
+    assert [message.topic for message in data.messages] == ["sensors/kitchen/temp"]
+    await client2.assert_silent()
+
+
+async def test_topic_registry():
+    registry = TopicRegistry()
+    first = Topic("first")
+    first.subscribers.add("s1")
+    registry.add(first)
+    second = Topic("second")
+    registry.add(second)
+    assert len(registry) == 2 and "second" in registry
+    assert registry.get("first") is first
+    assert registry.topics_of("s1") == {"first"}
+
+    # Subscribing twice and unsubscribing without subscription change nothing
+    assert registry.subscribe(second, "s1")
+    assert not registry.subscribe(second, "s1")
+    assert registry.subscribe(second, "s2")
+    assert not registry.unsubscribe(first, "s2")
+    assert registry.topics_of("s1") == {"first", "second"}
+    assert registry.topics_of("s2") == {"second"}
+    assert registry.subscription_count == 3
+
+    # The returned set is a copy
+    registry.topics_of("s1").clear()
+    assert registry.topics_of("s1") == {"first", "second"}
+
+    # Removing the last subscriber of a session forgets the session
+    assert registry.unsubscribe(second, "s2")
+    assert registry.topics_of("s2") == set()
+    assert "s2" not in registry._subscriptions
+    assert second.subscribers == {"s1"}
+
+    # Removing a topic removes its subscriptions
+    registry.remove(second)
+    assert "second" not in registry and registry.get("second") is None
+    assert registry.topics_of("s1") == {"first"}
+    assert registry.unsubscribe(first, "s1")
+    assert registry.topics_of("s1") == set()
+    assert registry._subscriptions == {}
+    assert registry.subscription_count == 0
+    assert [topic.name for topic in registry] == ["first"]
+
+
+async def test_topic_trie():
+    trie = TopicTrie()
+    trie.add("a/+/c", "s1")
+    trie.add("a/#", "s2")
+    trie.add("+/b/+", "s3")
+    trie.add("#", "s4")
+    assert len(trie) == 4
+
+    assert trie.match("a/b/c") == {"s1", "s2", "s3", "s4"}
+    assert trie.match("a") == {"s2", "s4"}
+    assert trie.match("a/b") == {"s2", "s4"}
+    assert trie.match("x/b/y") == {"s3", "s4"}
+    assert trie.match("x/b/y/z") == {"s4"}
+
+    assert trie.remove_all("s4") == ["#"]
+    assert not trie.remove("a/+/c", "s2")
+    assert trie.remove("a/#", "s2")
+    assert trie.match("a") == set()
+    assert sorted(trie) == ["+/b/+", "a/+/c"]
+
+
+async def test_topic_slots():
+    topic = Topic("slotted")
+    assert not hasattr(topic, "__dict__")
+    with pytest.raises(AttributeError):
+        topic.unknown = None
+    assert (topic.content, topic.timestamp, topic.last_update, topic.log, topic.status) == (None,) * 5
+
+    server = Server()
+    capture = []
+
+    async def send_packet(eio_sid, pkt):
+        capture.append(pkt)
+
+    server.sio.eio.send_packet = send_packet
+    sid = await server.sio.manager.connect("subscriber", "/")
+    server._sid_ip_mapping[sid] = "10.0.0.1"
+    await server.handle_subscribe(sid, TransportMessage(timestamp=1, topic="slotted").json())
+    await server.handle_publish(sid, TransportMessage(timestamp=1, topic="slotted", payload="first").json())
+    await server.handle_publish(sid, TransportMessage(timestamp=2, topic="slotted", payload="second").json())
+
+    # The fields set by the handlers are read back from the slots
+    topic = server._get_topic_by_name("slotted")
+    assert (topic.name, topic.content, topic.timestamp) == ("slotted", "second", 2)
+    assert topic.subscribers == {sid}
+    assert topic.last_update is not None
+    assert topic.log.next_offset == 2
+    update = server._update_message(topic)
+    assert (update.topic, update.offset) == ("slotted", 1)
+    assert update.payload.endswith("second")
+    request = TransportMessage(timestamp=int(time.time()), topic="slotted", request_id=1).json()
+    status = decode_message(await server.handle_topic_status(sid, request)).payload
+    assert topic.status == status
+
+
+async def test_backplane(tmp_path, caplog):
+    # Frames keep the messages apart and the end of the connection is read as None
+    reader = asyncio.StreamReader()
+    reader.feed_data(encode_frame({"method": "hello", "host_id": "a"}) + encode_frame({"payload": "ä" * 3}))
+    reader.feed_eof()
+    assert await read_frame(reader) == {"method": "hello", "host_id": "a"}
+    assert await read_frame(reader) == {"payload": "äää"}
+    assert await read_frame(reader) is None
+
+    path = str(tmp_path / "hub.sock")
+    hub_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    hub_sock.bind(path)
+    hub_sock.listen()
+    hub = asyncio.create_task(BackplaneHub(hub_sock).serve())
+    runner, url = await start_app(client_manager=IndexedBackplaneManager(path))
+    runner2, url2 = await start_app(client_manager=IndexedBackplaneManager(path))
+    subscriber = await connect(url)
+    publisher = await connect(url2)
+    local_subscriber = await connect(url2)
+
+    async def status(client):
+        await client.emit("GET_TOPIC_STATUS", TransportMessage(timestamp=int(time.time()), topic="shared").json())
+        return (await client.receive_message("PRINT_MESSAGE_AND_EXIT")).payload
+
+    try:
+        await subscriber.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic="shared").json())
+        await subscriber.receive_message("PRINT_MESSAGE")
+
+        # The other worker learns about the topic through the hub
+        deadline = time.monotonic() + TIMEOUT
+        while await status(publisher) != "shared is managed by another worker process.":
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.01)
+
+        # A publish on one worker reaches the subscribers of the other worker
+        await publisher.emit(
+            "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic="shared", payload="hello").json()
+        )
+        await publisher.receive_message("PRINT_MESSAGE_AND_EXIT")
+        assert (await subscriber.receive_message("PRINT_MESSAGE", "shared")).payload.endswith("hello")
+
+        # The status of a topic only contains the subscribers of the worker answering the request
+        await local_subscriber.emit(
+            "SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic="shared").json()
+        )
+        await local_subscriber.receive_message("PRINT_MESSAGE")
+        assert json.loads(await status(subscriber))["subscribers"] == 1
+        assert json.loads(await status(local_subscriber))["subscribers"] == 1
+    finally:
+        for client in (subscriber, publisher, local_subscriber):
+            await client.sio.disconnect()
+        await runner2.cleanup()
+
+        # The hub closes the connections of the remaining workers when it stops
+        hub.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await hub
+        await asyncio.sleep(SILENCE)
+        await runner.cleanup()
+    assert not [record for record in caplog.records if record.name == "asyncio"]
+
+
+async def test_binary_codec(server, client, client2):
+    sub_topic = "test"
+    binary_client = await connect(server, {"codec": "binary"})
+    try:
+        # Subscribe with a binary and a JSON client
+        message = TransportMessage(timestamp=int(time.time()), topic=sub_topic)
+        await binary_client.emit("SUBSCRIBE_TOPIC", encode(message, "binary"))
+        _, data = await binary_client.receive("PRINT_MESSAGE")
+        assert isinstance(data, bytes)
+        assert decode_message(data).payload == f"Created {sub_topic} and successfully subscribed."
+
+        await client.emit("SUBSCRIBE_TOPIC", message.json())
+        await client.receive_message("PRINT_MESSAGE")
+
+        # Both receive the update of a publish in their own encoding
+        await client2.emit(
+            "PUBLISH_TOPIC",
+            TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="Grüße 😀").json(),
+        )
+        await client2.receive("PRINT_MESSAGE_AND_EXIT")
+        _, data = await binary_client.receive("PRINT_MESSAGE")
+        assert isinstance(data, bytes)
+        update = decode_message(data)
+        _, data = await client.receive("PRINT_MESSAGE")
+        assert isinstance(data, str)
+        assert decode_message(data) == update
+        assert update.topic == sub_topic
+        assert update.offset == 0
+        assert update.payload.endswith(": Grüße 😀")
+
+        # Requests with request id are acknowledged in binary
+        message = TransportMessage(timestamp=int(time.time()), topic=sub_topic, request_id=7)
+        data = await binary_client.call("GET_TOPIC_STATUS", encode(message, "binary"))
+        assert decode_message(data).request_id == 7
+
+        # Invalid binary data
+        await binary_client.emit("PUBLISH_TOPIC", b"\x01\x02")
+        data = await binary_client.receive_message("PRINT_MESSAGE_AND_EXIT")
+        assert data.payload == "Invalid payload."
+    finally:
+        await binary_client.sio.disconnect()
+
+
+async def test_codec_round_trip():
+    message = TransportMessage(timestamp=1, topic="töpic", payload="", offset=0, request_id=3)
+    assert decode_message(encode(message, "binary")) == message
+    assert decode_message(encode(message, "json")) == message
+
+    batch = TransportMessageBatch(
+        timestamp=2, messages=[message, TransportMessage(timestamp=3, payload="x" * 70000)], request_id=None
+    )
+    assert decode_batch(encode(batch, "binary")) == batch
+
+    with pytest.raises(ValueError):
+        decode_batch(encode(message, "binary"))
+    with pytest.raises(ValueError):
+        decode_message(encode(message, "binary")[:-1])
+
+
+async def wait_until(condition):
+    """Wait until condition() is true or the timeout expired."""
+    deadline = time.monotonic() + TIMEOUT
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    assert condition()
+
+
+async def test_send_queue_overflow():
+    async def contents(queue):
+        return [(await queue.get())[0] for _ in range(len(queue))]
+
+    # The oldest update is dropped, responses are queued beyond the size and never dropped
+    queue = SendQueue(2, "drop-oldest")
+    assert queue.put(["response 1"]) == QUEUED
+    assert queue.put(["a 1"], "a", update=True) == QUEUED
+    assert queue.put(["a 2"], "a", update=True) == DROPPED
+    assert queue.put(["response 2"]) == QUEUED
+    assert queue.put(["b 1"], "b", update=True) == DROPPED
+    assert await contents(queue) == [["response 1"], ["response 2"], ["b 1"]]
+
+    # Without queued update of the topic, the oldest update is dropped instead of being conflated
+    queue = SendQueue(2, "conflate")
+    assert queue.put(["response"]) == QUEUED
+    assert queue.put(["a 1"], "a", update=True) == QUEUED
+    assert queue.put(["a 2"], "a", update=True) == CONFLATED
+    assert queue.put(["b 1"], "b", update=True) == DROPPED
+    assert await contents(queue) == [["response"], ["b 1"]]
+
+    # Only an update makes the client be disconnected
+    queue = SendQueue(1, "disconnect")
+    assert queue.put(["a 1"], "a", update=True) == QUEUED
+    assert queue.put(["response"]) == QUEUED
+    assert queue.put(["a 2"], "a", update=True) == OVERFLOW
+
+    # A queue holding only responses drops the new update
+    queue = SendQueue(1, "drop-oldest")
+    assert queue.put(["response"]) == QUEUED
+    assert queue.put(["a 1"], "a", update=True) == DROPPED
+    assert await contents(queue) == [["response"]]
+
+
+@pytest.mark.parametrize("policy", ["drop-oldest", "conflate", "disconnect"])
+async def test_slow_consumer(policy):
+    sub_topic = "test"
+    server = Server(send_queue_size=3, overflow_policy=policy)
+
+    # Record the packets instead of sending them. The packets of the slow client hang until it is flowing again
+    flowing = asyncio.Event()
+    flowing.set()
+    sent = {}
+
+    async def send_packet(eio_sid, pkt):
+        if eio_sid == "slow":
+            await flowing.wait()
+        sent.setdefault(eio_sid, []).append((time.monotonic(), pkt))
+
+    server.sio.eio.send_packet = send_packet
+    sids = {}
+    for name in ("fast", "slow", "publisher"):
+        sids[name] = await server.sio.manager.connect(name, "/")
+        server._sid_ip_mapping[sids[name]] = "127.0.0.1"
+    for name in ("fast", "slow"):
+        await server.handle_subscribe(sids[name], TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+
+    def updates(name):
+        payloads = []
+        for sent_at, pkt in sent.get(name, [])[1:]:
+            event, data = json.loads(pkt.data[1:])
+            messages = decode_batch(data).messages if event == "PRINT_MESSAGE_BATCH" else [decode_message(data)]
+            payloads += [(sent_at, message.payload.split(": ")[1]) for message in messages]
+        return payloads
+
+    # The slow client stalls, the publisher and the fast client are not held up
+    flowing.clear()
+    published_at = []
+    for i in range(10):
+        published_at.append(time.monotonic())
+        message = TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=str(i))
+        await asyncio.wait_for(server.handle_publish(sids["publisher"], message.json()), TIMEOUT)
+    await wait_until(lambda: len(updates("fast")) == 10)
+    assert [payload for _, payload in updates("fast")] == [str(i) for i in range(10)]
+    assert max(sent_at - start for (sent_at, _), start in zip(updates("fast"), published_at)) < 0.5
+
+    # A batch is queued for the slow client like a single update, so its acknowledgement is not held up either
+    batch = TransportMessageBatch(
+        timestamp=int(time.time()),
+        messages=[TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=str(i)) for i in (10, 11)],
+        request_id=1,
+    )
+    response = await asyncio.wait_for(server.handle_publish_batch(sids["publisher"], batch.json()), TIMEOUT)
+    assert decode_message(response).payload == "Successfully published 2 messages to 1 topics."
+    await wait_until(lambda: len(updates("fast")) == 12)
+    assert [payload for _, payload in updates("fast")][10:] == ["10", "11"]
+
+    # One update is stuck in sending, three are queued, the others were dropped, conflated or caused a disconnect
+    stats = server.send_queue_stats()
+    if policy == "disconnect":
+        assert stats["disconnected"] == 1
+        flowing.set()
+        await wait_until(lambda: sids["slow"] not in server._get_topic_by_name(sub_topic).subscribers)
+        await wait_until(lambda: not server._disconnect_tasks)
+        return
+    assert stats["max_depth"] == 3
+    if policy == "drop-oldest":
+        assert stats["dropped"] == 7
+    else:
+        # The batch has no topic of its own to be conflated with
+        assert (stats["conflated"], stats["dropped"]) == (6, 1)
+
+    # Once the slow client is flowing again, it receives the queued updates including the latest ones
+    flowing.set()
+    await wait_until(lambda: len(updates("slow")) == 5)
+    payloads = [payload for _, payload in updates("slow")]
+    assert payloads[0] == "0"
+    assert payloads[2:] == ["9", "10", "11"]
+    assert server.send_queue_stats()["queued"] == 0
+
+
+async def test_conflation():
+    sensor_topic = "sensors/kitchen"
+    plain_topic = "plain"
+    server = Server(conflation_windows={"sensors/*": 200})
+
+    # Record the updates instead of sending them
+    sent = []
+
+    async def send_packet(eio_sid, pkt):
+        sent.append((eio_sid, pkt))
+
+    server.sio.eio.send_packet = send_packet
+    subscriber = await server.sio.manager.connect("subscriber", "/")
+    publisher = await server.sio.manager.connect("publisher", "/")
+    for sid in (subscriber, publisher):
+        server._sid_ip_mapping[sid] = "127.0.0.1"
+    for name in (sensor_topic, plain_topic):
+        await server.handle_subscribe(subscriber, TransportMessage(timestamp=int(time.time()), topic=name).json())
+
+    def updates():
+        messages = []
+        for eio_sid, pkt in sent:
+            event, data = json.loads(pkt.data[1:])
+            if eio_sid == "subscriber":
+                messages += decode_batch(data).messages if event == "PRINT_MESSAGE_BATCH" else [decode_message(data)]
+        # Only updates name their topic
+        return [(m.topic, m.offset, m.payload.split(": ")[1]) for m in messages if m.topic is not None]
+
+    # Publishes within the window only update the topic, topics without window are sent right away
+    for i in range(20):
+        message = TransportMessage(timestamp=int(time.time()), topic=sensor_topic, payload=str(i))
+        await server.handle_publish(publisher, message.json())
+    await server.handle_publish(
+        publisher, TransportMessage(timestamp=int(time.time()), topic=plain_topic, payload="plain").json()
+    )
+    await wait_until(lambda: len(updates()) == 1)
+    assert updates() == [(plain_topic, 0, "plain")]
+    assert server._get_topic_by_name(sensor_topic).content == "19"
+
+    # The latest content is sent once the window closes
+    await wait_until(lambda: len(updates()) == 2)
+    assert updates()[1] == (sensor_topic, 19, "19")
+    assert server.conflation_stats() == {"pending": 0, "coalesced": 19, "flushed": 1}
+    # The task sending the update is kept until it is done
+    await wait_until(lambda: not server._flush_tasks)
+
+    # Batches are conflated as well
+    batch = TransportMessageBatch(
+        timestamp=int(time.time()),
+        messages=[
+            TransportMessage(timestamp=int(time.time()), topic=sensor_topic, payload="batch 1"),
+            TransportMessage(timestamp=int(time.time()), topic=sensor_topic, payload="batch 2"),
+        ],
+    )
+    await server.handle_publish_batch(publisher, batch.json())
+    await wait_until(lambda: len(updates()) == 3)
+    assert updates()[2] == (sensor_topic, 21, "batch 2")
+    assert server.conflation_stats() == {"pending": 0, "coalesced": 20, "flushed": 2}
+
+
+async def test_metrics(server, client, client2):
+    sub_topic = "test"
+
+    await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+    await client.receive("PRINT_MESSAGE")
+    await client2.emit(
+        "PUBLISH_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="metrics").json()
+    )
+    await client2.receive("PRINT_MESSAGE_AND_EXIT")
+    await client.receive_message("PRINT_MESSAGE", sub_topic)
+
+    async with aiohttp.ClientSession() as http:
+        async with http.get(f"{server}/metrics") as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            lines = (await response.text()).splitlines()
+
+    # State of the server
+    assert "# TYPE pubsub_topics gauge" in lines
+    assert "pubsub_topics 1" in lines
+    assert "pubsub_subscriptions 1" in lines
+    assert 'pubsub_connected_clients{codec="json"} 2' in lines
+    assert 'pubsub_connected_clients{codec="binary"} 0' in lines
+    # A counter is declared under the name of its samples
+    index = lines.index("# TYPE pubsub_send_queue_overflows_total counter")
+    assert lines[index - 1 : index + 4] == [
+        "# HELP pubsub_send_queue_overflows_total Messages dropped or conflated and clients disconnected because their "
+        "send queue was full.",
+        "# TYPE pubsub_send_queue_overflows_total counter",
+        'pubsub_send_queue_overflows_total{result="dropped"} 0',
+        'pubsub_send_queue_overflows_total{result="conflated"} 0',
+        'pubsub_send_queue_overflows_total{result="disconnected"} 0',
+    ]
+
+    # Handlers and the fan-out of the update
+    assert "# TYPE pubsub_handler_duration_seconds histogram" in lines
+    assert 'pubsub_handler_duration_seconds_count{handler="handle_subscribe"} 1' in lines
+    assert 'pubsub_handler_duration_seconds_count{handler="handle_publish"} 1' in lines
+    assert 'pubsub_handler_duration_seconds_bucket{handler="handle_publish",le="+Inf"} 1' in lines
+    assert 'pubsub_fanout_subscribers_bucket{le="0"} 0' in lines
+    assert 'pubsub_fanout_subscribers_bucket{le="1"} 1' in lines
+    assert "pubsub_fanout_subscribers_sum 1" in lines
+
+
+async def test_profiling(tmp_path):
+    sub_topic = "test"
+
+    # The admin route and the event loop lag are available without profiling from the start on
+    runner, url = await start_app(profile_dir=str(tmp_path / "on-request"))
+    try:
+        async with aiohttp.ClientSession() as http:
+            async with http.get(f"{url}/admin/profile") as response:
+                assert (await response.json())["mode"] is None
+            async with http.post(f"{url}/admin/profile") as response:
+                assert (await response.json()) == {"running": True, "mode": "sampler"}
+            async with http.post(f"{url}/admin/profile") as response:
+                assert (await response.json())["running"] is False
+            async with http.get(f"{url}/metrics") as response:
+                assert "pubsub_event_loop_lag_seconds_count" in await response.text()
+    finally:
+        await runner.cleanup()
+
+    runner, url = await start_app(profile="sampler", profile_dir=str(tmp_path))
+    client = await connect(url)
+    client2 = await connect(url)
+    try:
+        await client.emit("SUBSCRIBE_TOPIC", TransportMessage(timestamp=int(time.time()), topic=sub_topic).json())
+        await client.receive("PRINT_MESSAGE")
+        for i in range(20):
+            message = TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload=str(i))
+            await client2.emit("PUBLISH_TOPIC", message.json())
+            await client2.receive("PRINT_MESSAGE_AND_EXIT")
+            await client.receive_message("PRINT_MESSAGE", sub_topic)
+
+        async with aiohttp.ClientSession() as http:
+            async with http.get(f"{url}/admin/profile") as response:
+                assert (await response.json())["mode"] == "sampler"
+
+            # Stop the profile started with the server
+            async with http.post(f"{url}/admin/profile") as response:
+                result = await response.json()
+            assert result["running"] is False
+            with open(result["files"]["stacks"]) as file:
+                stacks = file.read().splitlines()
+            assert stacks
+            stack, count = stacks[0].rsplit(" ", 1)
+            assert int(count) > 0
+            assert all(";" in line for line in stacks)
+            with open(result["files"]["summary"]) as file:
+                summary = json.load(file)
+            assert summary["handlers"]["handle_publish"]["calls"] == 20
+            assert summary["handlers"]["handle_subscribe"]["calls"] == 1
+
+            # Profile every call
+            async with http.post(f"{url}/admin/profile?mode=cprofile") as response:
+                assert (await response.json()) == {"running": True, "mode": "cprofile"}
+            message = TransportMessage(timestamp=int(time.time()), topic=sub_topic, payload="profiled")
+            await client2.emit("PUBLISH_TOPIC", message.json())
+            await client2.receive("PRINT_MESSAGE_AND_EXIT")
+            async with http.post(f"{url}/admin/profile") as response:
+                files = (await response.json())["files"]
+            assert os.path.getsize(files["pstats"]) > 0
+            with open(files["text"]) as file:
+                assert "handle_publish" in file.read()
+
+            async with http.post(f"{url}/admin/profile?mode=unknown") as response:
+                assert response.status == 400
+            # An interval that would make the sampler spin is rejected
+            for interval in ("0", "-1", "nan", "inf", "fast"):
+                async with http.post(f"{url}/admin/profile?interval={interval}") as response:
+                    assert response.status == 400
+            async with http.get(f"{url}/admin/profile") as response:
+                assert (await response.json())["mode"] is None
+            async with http.get(f"{url}/metrics") as response:
+                assert "pubsub_event_loop_lag_seconds_count" in await response.text()
+    finally:
+        await client.sio.disconnect()
+        await client2.sio.disconnect()
+        await runner.cleanup()
+
+
+async def test_logging(tmp_path):
+    # Long string arguments are shortened, other arguments are kept
+    record = logging.LogRecord("server", logging.INFO, __file__, 1, "%s %s %d", ("a" * 20, "short", 20), None)
+    assert PayloadTruncationFilter(10).filter(record)
+    assert record.getMessage() == "aaaaaaaaaa... (20 characters) short 20"
+    record = logging.LogRecord("server", logging.INFO, __file__, 1, "%s", ("a" * 20,), None)
+    PayloadTruncationFilter(0).filter(record)
+    assert record.getMessage() == "a" * 20
+
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    loggers = [logger for logger in logging.root.manager.loggerDict.values() if isinstance(logger, logging.Logger)]
+    levels = [(logger, logger.level) for logger in loggers]
+    stream = io.StringIO()
+    listener = setup_logging("INFO", 10, str(tmp_path / "server.log"), stream)
+    try:
+        # The root logger only puts the records into the queue of the listener
+        assert [type(handler) for handler in root.handlers] == [QueueHandler]
+        logging.info("published %s", "b" * 100)
+        logging.debug("not logged")
+    finally:
+        # Stopping the listener writes the remaining records and ends its thread
+        listener.stop()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+        for logger, logger_level in levels:
+            logger.setLevel(logger_level)
+    assert listener._thread is None
+    for output in (stream.getvalue(), (tmp_path / "server.log").read_text()):
+        assert output.count("\n") == 1
+        assert output.rstrip().endswith("INFO - published bbbbbbbbbb... (100 characters)")
+    for handler in listener.handlers:
+        handler.close()
+
+
+async def test_list_topics_pages(session):
+    server = Server()
+
+    # Record the packets instead of sending them
+    sent = []
+
+    async def send_packet(eio_sid, pkt):
+        sent.append(json.loads(pkt.data[1:]))
+
+    server.sio.eio.send_packet = send_packet
+    sid = await server.sio.manager.connect("subscriber", "/")
+    server._sid_ip_mapping[sid] = "127.0.0.1"
+    names = [f"sensors/{i:04}" for i in range(2500)] + ["other"]
+    for name in reversed(names):
+        await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic=name).json())
+    await server.handle_unsubscribe(sid, TransportMessage(timestamp=int(time.time()), topic="sensors/0001").json())
+    names.remove("sensors/0001")
+    sent.clear()
+
+    # Without request id, the list is streamed in chunks and only the last one ends the request
+    await server.handle_list_topics(sid, TransportMessage(timestamp=int(time.time())).json())
+    assert [event for event, _ in sent] == ["PRINT_MESSAGE", "PRINT_MESSAGE", "PRINT_MESSAGE_AND_EXIT"]
+    lines = [line for _, data in sent for line in decode_message(data).payload.split("\n")]
+    assert lines == ["All topics on the server:", *sorted(names)]
+
+    # Prefix, glob pattern, cursor and limit
+    async def page(**kwargs):
+        request = TransportMessage(timestamp=int(time.time()), request_id=1, **kwargs)
+        return decode_message(await server.handle_list_topics(sid, request.json())).payload.split("\n")[1:]
+
+    assert await page(topic="sensors/000", limit=5) == ["sensors/0000", *(f"sensors/000{i}" for i in range(2, 6))]
+    assert await page(topic="sensors/*9", payload="sensors/0100", limit=3) == [
+        "sensors/0109",
+        "sensors/0119",
+        "sensors/0129",
+    ]
+    assert await page(topic="oth") == ["other"]
+    assert len(await page()) == 1000
+    # The limit is clamped to a page of at least one and at most LIST_PAGE_SIZE topics
+    assert len(await page(limit=10**9)) == 1000
+    assert await page(limit=-1) == ["other"]
+    assert await page(topic="sensors/", limit=0) == ["sensors/0000"]
+
+    # Pages of a client session over the network
+    def requests():
+        for name in ("b", "a", "c/1", "c/2"):
+            session.subscribe(name)
+        assert session.listTopics(limit=2) == "All topics on the server:\na\nb"
+        assert list(session.iterTopics(page_size=2)) == ["a", "b", "c/1", "c/2"]
+        assert list(session.iterTopics("c/")) == ["c/1", "c/2"]
+        # Pages larger than the server sends are continued
+        session.subscribe([f"many/{i:04}" for i in range(1001)])
+        assert len(list(session.iterTopics("many/", page_size=5000))) == 1001
+
+    await asyncio.to_thread(requests)
+
+
+async def test_topic_status_cache(session):
+    server = Server()
+    capture = []
+
+    async def send_packet(eio_sid, pkt):
+        capture.append(pkt)
+
+    server.sio.eio.send_packet = send_packet
+    sids = []
+    for i in range(15):
+        sid = await server.sio.manager.connect(f"subscriber-{i}", "/")
+        server._sid_ip_mapping[sid] = f"10.0.0.{i}"
+        sids.append(sid)
+        await server.handle_subscribe(sid, TransportMessage(timestamp=int(time.time()), topic="popular").json())
+
+    async def status(**kwargs):
+        request = TransportMessage(timestamp=int(time.time()), topic="popular", request_id=1, **kwargs)
+        return json.loads(decode_message(await server.handle_topic_status(sids[0], request.json())).payload)
+
+    # Count and a capped sample of the subscribers
+    data = await status()
+    assert (data["topic"], data["timestamp"], data["content"], data["subscribers"]) == ("popular", None, None, 15)
+    assert len(data["sample"]) == 10
+    assert all(address.startswith("10.0.0.") for address in data["sample"])
+    assert (await status(limit=0))["sample"] == []
+    assert len((await status(limit=100))["sample"]) == 15
+
+    # Only the status with the default sample is kept until the topic or its subscribers change
+    topic = server._get_topic_by_name("popular")
+    assert json.loads(topic.status) == data
+    assert server._topic_status(topic, 10) is topic.status
+    await server.handle_publish(
+        sids[0], TransportMessage(timestamp=int(time.time()), topic="popular", payload="new").json()
+    )
+    assert topic.status is None
+    assert (await status())["content"] == "new"
+    await server.handle_unsubscribe(sids[1], TransportMessage(timestamp=int(time.time()), topic="popular").json())
+    assert (await status())["subscribers"] == 14
+    await server.handle_subscribe(sids[1], TransportMessage(timestamp=int(time.time()), topic="popular").json())
+    assert (await status())["subscribers"] == 15
+    await server.disconnect(sids[2])
+    assert (await status())["subscribers"] == 14
+
+    # Sample of a client session over the network
+    def requests():
+        session.subscribe("sampled")
+        assert session.getTopicStatus("sampled", sample=0).endswith("subscribers:\t1")
+        assert session.getTopicStatus("sampled").endswith("subscribers:\t1\n\t127.0.0.1")
+
+    await asyncio.to_thread(requests)
+
+
+async def test_subscribe_batch(server):
+    async with AsyncClient(server) as subscriber, AsyncClient(server) as publisher:
+        # Topics, patterns and invalid entries in one request
+        topics = [f"async/{i}" for i in range(100)]
+        response = await subscriber.subscribe([*topics, "sensors/+/temp", "a/#/b"])
+        assert response == (
+            "Successfully subscribed to 101 topics. Created 100 of them. 1 messages without valid topic were skipped."
+        )
+        assert (
+            await subscriber.subscribe(topics[:2])
+            == "Successfully subscribed to 0 topics. Already subscribed to 2 topics."
+        )
+        assert len(subscriber.subscribed_topics) == 102
+
+        # Updates of all topics arrive through the iterator
+        assert await publisher.publish("async/7", "seven") == "Successfully published message to async/7."
+        assert await publisher.publish("sensors/1/temp", "20") == "Successfully published message to sensors/1/temp."
+        updates = subscriber.__aiter__()
+        update = await asyncio.wait_for(updates.__anext__(), TIMEOUT)
+        assert (update.topic, update.payload.endswith(": seven")) == ("async/7", True)
+        update = await asyncio.wait_for(updates.__anext__(), TIMEOUT)
+        assert update.topic == "sensors/1/temp"
+
+        # The kept messages of all topics are sent in one batch before the response
+        await publisher.publish("async/8", "eight")
+        async with AsyncClient(server) as late:
+            await late.subscribe(["async/7", "async/8", "async/9"], limit=1)
+            history = [await asyncio.wait_for(late.__anext__(), TIMEOUT) for _ in range(2)]
+            assert [message.payload.rsplit(": ", 1)[1] for message in history] == ["seven", "eight"]
+
+        assert await subscriber.unsubscribe(topics[:2]) == [
+            "Successfully unsubscribed from async/0.",
+            "Successfully unsubscribed from async/1.",
+        ]
+        assert len(subscriber.subscribed_topics) == 100
+
+    # Closing ends the iteration after the updates received before
+    assert [update.topic async for update in subscriber] == ["async/8"]
+
+    # An iteration that falls behind loses the oldest updates instead of queueing them without limit
+    async with AsyncClient(server, max_updates=2) as slow, AsyncClient(server) as publisher:
+        await slow.subscribe("bounded")
+        for i in range(5):
+            await publisher.publish("bounded", str(i))
+        await wait_until(lambda: slow.dropped_updates == 3)
+        updates = [await asyncio.wait_for(slow.__anext__(), TIMEOUT) for _ in range(2)]
+        assert [update.payload.rsplit(": ", 1)[1] for update in updates] == ["3", "4"]
+
+    # The topics created by a batch are announced to the other worker processes in one message
+    local = Server()
+    shared = []
+
+    async def share(message):
+        shared.append(message)
+
+    local._share = share
+    sid = await local.sio.manager.connect("subscriber", "/")
+    local._sid_ip_mapping[sid] = "127.0.0.1"
+    messages = [TransportMessage(timestamp=int(time.time()), topic=name) for name in ("x", "y", "z")]
+    await local.handle_subscribe_batch(sid, TransportMessageBatch(timestamp=int(time.time()), messages=messages).json())
+    assert shared == [{"action": "topics_added", "topics": ["x", "y", "z"]}]
+
+
+async def test_client_reconnect(capsys, tmp_path):
+    runner, url = await start_app(store=TopicStore(str(tmp_path)))
+    port = runner.addresses[0][1]
+    client = await asyncio.to_thread(Client, url, reconnection_delay=0.5, reconnection_delay_max=1)
+    try:
+        # resume/c has a message before the client subscribes, so the client receives no update of it
+        async with AsyncClient(url) as publisher:
+            await publisher.subscribe("resume/c")
+            await publisher.publish("resume/c", "before subscribe")
+            await asyncio.to_thread(client.subscribe, ["resume/a", "resume/b", "resume/c"])
+            lines = await read_output(
+                capsys, "Created resume/b and successfully subscribed.", "Successfully subscribed to resume/c."
+            )
+            await publisher.publish("resume/a", "before restart")
+        await wait_until(lambda: client.last_offsets.get("resume/a") == 0)
+        assert client.last_offsets["resume/c"] == 0
+
+        # The server restarts and a message is published before the client is back
+        await runner.cleanup()
+        runner, _ = await start_app(port, store=TopicStore(str(tmp_path)))
+        async with AsyncClient(url) as publisher:
+            await publisher.publish("resume/a", "while away")
+            await publisher.publish("resume/c", "while away")
+        lines += await read_output(capsys, "Successfully subscribed to 3 topics. Created 1 of them.")
+        assert "======= RECONNECTED, SUBSCRIBING TO resume/a, resume/b, resume/c AGAIN =======" in lines
+        await wait_until(lambda: client.last_offsets.get("resume/a") == 1)
+        await wait_until(lambda: client.last_offsets.get("resume/c") == 1)
+
+        async with AsyncClient(url) as publisher:
+            await publisher.publish("resume/a", "after reconnect")
+        await wait_until(lambda: client.last_offsets.get("resume/a") == 2)
+        await asyncio.sleep(SILENCE)
+        lines += await read_output(capsys)
+
+        # Every update is printed once, the one published while the client was away from the kept messages
+        updates = [line.rsplit(": ", 1)[1] for line in lines if line.startswith("resume/a (")]
+        assert updates == ["before restart", "while away", "after reconnect"]
+        # The topic without update is resumed from the offset acknowledged when subscribing
+        assert [line.rsplit(": ", 1)[1] for line in lines if line.startswith("resume/c (")] == ["while away"]
+
+        # An update received again is dropped
+        message = TransportMessage(timestamp=int(time.time()), topic="resume/a", offset=2, payload="again")
+        client._handleResponse(message.json())
+        assert "again" not in capsys.readouterr().out
+    finally:
+        await asyncio.to_thread(client.disconnect)
+        await runner.cleanup()
+
+
+async def test_buffered_publish(server):
+    async with AsyncClient(server) as subscriber:
+        await subscriber.subscribe("buffered")
+        client = await asyncio.to_thread(Client, server, linger=0.05, batch_size=10, max_in_flight=2)
+
+        # Full batches are sent right away, the rest on flush
+        def publish(count, start=0):
+            for i in range(start, start + count):
+                client.publish("buffered", str(i))
+
+        await asyncio.to_thread(publish, 25)
+        assert await asyncio.to_thread(client.flush, TIMEOUT) == [
+            "Successfully published 10 messages to 1 topics.",
+            "Successfully published 10 messages to 1 topics.",
+            "Successfully published 5 messages to 1 topics.",
+        ]
+        updates = [await asyncio.wait_for(subscriber.__anext__(), TIMEOUT) for _ in range(25)]
+        assert [update.payload.rsplit(": ", 1)[1] for update in updates] == [str(i) for i in range(25)]
+
+        # A batch that is not full is sent after the linger time
+        await asyncio.to_thread(publish, 1, 25)
+        update = await asyncio.wait_for(subscriber.__anext__(), TIMEOUT)
+        assert update.payload.endswith(": 25")
+        assert await asyncio.to_thread(client.flush, TIMEOUT) == ["Successfully published 1 messages to 1 topics."]
+
+        # Closing sends the buffered messages
+        await asyncio.to_thread(publish, 3, 26)
+        assert await asyncio.to_thread(client.close, TIMEOUT) == ["Successfully published 3 messages to 1 topics."]
+        updates = [await asyncio.wait_for(subscriber.__anext__(), TIMEOUT) for _ in range(3)]
+        assert [update.payload.rsplit(": ", 1)[1] for update in updates] == ["26", "27", "28"]
+        with pytest.raises(RuntimeError):
+            client.publish("buffered", "closed")
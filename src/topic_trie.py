@@ -0,0 +1,193 @@
+"""Index of MQTT-style wildcard subscriptions.
+
+Topic names are split into levels at ``/``. In a pattern, a level ``+`` matches exactly one level and a level ``#``,
+which has to be the last one, matches any number of levels including none, so ``sensors/#`` matches ``sensors`` as
+well as ``sensors/kitchen/temp``. Only whole levels are wildcards, a name like ``C#`` is an ordinary topic name.
+
+The patterns are stored level by level in a trie. Matching a topic name follows at most the exact, the ``+`` and the
+``#`` child of every visited node, so its cost grows with the depth of the name and the number of matching patterns,
+not with the number of stored patterns.
+"""
+
+from typing import Dict, Iterator, List, Optional, Set
+
+SINGLE_LEVEL = "+"
+"""wildcard matching exactly one level"""
+
+MULTI_LEVEL = "#"
+"""wildcard matching any number of levels at the end of a pattern"""
+
+SEPARATOR = "/"
+"""separator of the levels of a topic name"""
+
+
+def is_pattern(name: str) -> bool:
+    """Check if a topic name is a wildcard pattern.
+
+    :param name: Topic name
+    :return: True if a level of the name is a wildcard
+    """
+    return any(level in (SINGLE_LEVEL, MULTI_LEVEL) for level in name.split(SEPARATOR))
+
+
+def validate_pattern(pattern: str) -> None:
+    """Check that a wildcard pattern is valid.
+
+    :param pattern: Wildcard pattern
+    :raise ValueError: if a multi-level wildcard is not the last level
+    """
+    levels = pattern.split(SEPARATOR)
+    if MULTI_LEVEL in levels[:-1]:
+        raise ValueError(f"{MULTI_LEVEL} has to be the last level of a pattern")
+
+
+class _Node:
+    """Level of the trie"""
+
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.subscribers: Set[str] = set()
+
+
+class TopicTrie:
+    """Wildcard patterns and their subscribers, indexed by level."""
+
+    def __init__(self) -> None:
+        """Constructor of TopicTrie class."""
+        self._root = _Node()
+        self._patterns_of: Dict[str, Set[str]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Number of patterns with at least one subscriber"""
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the patterns with at least one subscriber"""
+        stack = [(self._root, [])]
+        while stack:
+            node, levels = stack.pop()
+            if node.subscribers:
+                yield SEPARATOR.join(levels)
+            for level, child in node.children.items():
+                stack.append((child, levels + [level]))
+
+    def __contains__(self, pattern: str) -> bool:
+        node = self._find(pattern)
+        return node is not None and bool(node.subscribers)
+
+    def add(self, pattern: str, subscriber: str) -> bool:
+        """Subscribe to a pattern.
+
+        :param pattern: Valid wildcard pattern
+        :param subscriber: Session id of the subscriber
+        :return: False if the subscriber was already subscribed to the pattern, True otherwise
+        """
+        node = self._root
+        for level in pattern.split(SEPARATOR):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if subscriber in node.subscribers:
+            return False
+        if not node.subscribers:
+            self._count += 1
+        node.subscribers.add(subscriber)
+        self._patterns_of.setdefault(subscriber, set()).add(pattern)
+        return True
+
+    def remove(self, pattern: str, subscriber: str) -> bool:
+        """Unsubscribe from a pattern. Levels without patterns below them are removed.
+
+        :param pattern: Wildcard pattern
+        :param subscriber: Session id of the subscriber
+        :return: False if the subscriber was not subscribed to the pattern, True otherwise
+        """
+        path = [self._root]
+        levels = pattern.split(SEPARATOR)
+        for level in levels:
+            child = path[-1].children.get(level)
+            if child is None:
+                return False
+            path.append(child)
+        node = path[-1]
+        if subscriber not in node.subscribers:
+            return False
+        node.subscribers.discard(subscriber)
+        if not node.subscribers:
+            self._count -= 1
+        patterns = self._patterns_of[subscriber]
+        patterns.discard(pattern)
+        if not patterns:
+            del self._patterns_of[subscriber]
+
+        # Prune the levels that lead to nothing anymore
+        for level, parent, child in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if child.subscribers or child.children:
+                break
+            del parent.children[level]
+        return True
+
+    def remove_all(self, subscriber: str) -> List[str]:
+        """Unsubscribe from all patterns.
+
+        :param subscriber: Session id of the subscriber
+        :return: Patterns the subscriber was subscribed to
+        """
+        patterns = list(self._patterns_of.get(subscriber, ()))
+        for pattern in patterns:
+            self.remove(pattern, subscriber)
+        return patterns
+
+    def patterns_of(self, subscriber: str) -> Set[str]:
+        """Get the patterns a subscriber is subscribed to.
+
+        :param subscriber: Session id of the subscriber
+        :return: Set of patterns
+        """
+        return set(self._patterns_of.get(subscriber, ()))
+
+    def match(self, name: str) -> Set[str]:
+        """Get the subscribers of all patterns matching a topic name.
+
+        :param name: Topic name
+        :return: Set of session ids
+        """
+        result: Set[str] = set()
+        if not self._count:
+            return result
+        nodes = [self._root]
+        for level in name.split(SEPARATOR):
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                multi = children.get(MULTI_LEVEL)
+                if multi is not None:
+                    result.update(multi.subscribers)
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+                single = children.get(SINGLE_LEVEL)
+                if single is not None and single is not child:
+                    next_nodes.append(single)
+            nodes = next_nodes
+            if not nodes:
+                return result
+        for node in nodes:
+            result.update(node.subscribers)
+            # A multi-level wildcard also matches its parent level
+            multi = node.children.get(MULTI_LEVEL)
+            if multi is not None:
+                result.update(multi.subscribers)
+        return result
+
+    def _find(self, pattern: str) -> Optional[_Node]:
+        node = self._root
+        for level in pattern.split(SEPARATOR):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class TransportMessage(BaseModel):
@@ -13,3 +13,26 @@ class TransportMessage(BaseModel):
 
     payload: Optional[str]
     """Payload of message"""
+
+    request_id: Optional[int]
+    """Id of the request a response belongs to. Requests with an id are answered through the acknowledgement"""
+
+    offset: Optional[int]
+    """Offset of a message of a topic. When subscribing, the kept messages from this offset on are sent. The response to
+    a subscribe carries the offset the next message of the topic gets"""
+
+    limit: Optional[int]
+    """When subscribing, at most this number of the most recent kept messages is sent"""
+
+
+class TransportMessageBatch(BaseModel):
+    """Several transport messages sent in one frame"""
+
+    timestamp: int
+    """Timestamp of batch"""
+
+    messages: List[TransportMessage]
+    """Messages of batch"""
+
+    request_id: Optional[int]
+    """Id of the request. Requests with an id are answered through the acknowledgement"""